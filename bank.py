@@ -1,13 +1,29 @@
 import mysql.connector
 from mysql.connector import Error
 import datetime
+import itertools
 import sys
 import os
 
+from bank_db import create_database, setup_schema, ConnectionPool
+from bank_metrics import Metrics
+from bank_snapshots import SnapshotStore
+from bank_service import (BankingService, BankingError, AccountNotFoundError,
+                          InsufficientFundsError, VelocityLimitError, TransactionTotals, parse_amount)
+from bank_storage import open_backend
+from bank_velocity import load_velocity_rules
+
 class BankingSystem:
     def __init__(self):
         """Initialize database connection with configurable credentials"""
-        self.connection = None
+        self.service = None
+        self.snapshots = None
+        self.metrics = Metrics.from_env()
+        if self.metrics:
+            self.metrics.start_exporters()
+        if os.getenv('DB_BACKEND', 'mysql') != 'mysql':
+            self.open_embedded_storage()
+            return
         self.db_config = self.get_database_config()
         self.connect_to_database()
     
@@ -54,40 +70,24 @@ class BankingSystem:
             return False
     
     def connect_to_database(self):
-        """Establish connection to MySQL database with error handling"""
+        """Prepare the database and open the connection pool with error handling"""
         max_attempts = 3
         for attempt in range(max_attempts):
             try:
                 print(f"\nAttempt {attempt + 1} of {max_attempts} to connect to database...")
                 
-                # First try without database to check credentials
-                test_conn = mysql.connector.connect(
-                    host=self.db_config['host'],
-                    user=self.db_config['user'],
-                    password=self.db_config['password']
-                )
+                # Create database if it doesn't exist
+                create_database(self.db_config)
+                print("✓ Connected to MySQL server successfully")
                 
-                if test_conn.is_connected():
-                    print("✓ Connected to MySQL server successfully")
-                    
-                    # Create database if it doesn't exist
-                    cursor = test_conn.cursor()
-                    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.db_config['database']}")
-                    cursor.execute(f"USE {self.db_config['database']}")
-                    test_conn.close()
-                    
-                    # Now connect to the specific database
-                    self.connection = mysql.connector.connect(
-                        host=self.db_config['host'],
-                        user=self.db_config['user'],
-                        password=self.db_config['password'],
-                        database=self.db_config['database']
-                    )
-                    
-                    if self.connection.is_connected():
-                        print(f"✓ Connected to database '{self.db_config['database']}' successfully")
-                        self.setup_database()
-                        return
+                # Now connect to the specific database
+                pool = ConnectionPool(self.db_config, size=int(os.getenv('DB_POOL_SIZE', '5')), metrics=self.metrics)
+                with pool.connection() as conn:
+                    print(f"✓ Connected to database '{self.db_config['database']}' successfully")
+                    self.setup_database(conn)
+                self.service = BankingService(pool, velocity=load_velocity_rules())
+                self.snapshots = SnapshotStore(self.service)
+                return
                         
             except Error as e:
                 print(f"✗ Connection attempt {attempt + 1} failed: {e}")
@@ -123,53 +123,25 @@ class BankingSystem:
                     
                     sys.exit(1)
     
-    def setup_database(self):
+    def open_embedded_storage(self):
+        """Use the SQLite or in-memory backend selected by DB_BACKEND"""
+        backend = open_backend({'backend': os.getenv('DB_BACKEND'), 'path': os.getenv('DB_PATH')})
+        version = backend.setup()
+        self.service = BankingService(backend, metrics=self.metrics, velocity=load_velocity_rules())
+        print(f"✓ Using {backend.name} storage (schema version {version})")
+    
+    def setup_database(self, connection):
         """Create database and tables if they don't exist"""
-        cursor = self.connection.cursor()
-        
-       
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS accounts (
-                account_id INT AUTO_INCREMENT PRIMARY KEY,
-                account_number VARCHAR(20) UNIQUE NOT NULL,
-                account_holder VARCHAR(100) NOT NULL,
-                email VARCHAR(100),
-                phone VARCHAR(20),
-                address TEXT,
-                balance DECIMAL(15, 2) DEFAULT 0.00,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status ENUM('active', 'inactive', 'suspended') DEFAULT 'active'
-            )
-        """)
-        
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                transaction_id INT AUTO_INCREMENT PRIMARY KEY,
-                account_id INT NOT NULL,
-                transaction_type ENUM('deposit', 'withdrawal', 'transfer', 'account_creation') NOT NULL,
-                amount DECIMAL(15, 2) NOT NULL,
-                description VARCHAR(255),
-                transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
-            )
-        """)
-        
-        self.connection.commit()
-        cursor.close()
-        print("✓ Database tables created/verified successfully")
+        version = setup_schema(connection)
+        print(f"✓ Database tables created/verified successfully (schema version {version})")
     
-    def generate_account_number(self):
-        """Generate a unique 10-digit account number"""
-        cursor = self.connection.cursor()
+    def read_amount(self, prompt, allow_zero=False):
+        """Prompt until a valid amount is entered"""
         while True:
-            import random
-            account_number = str(random.randint(1000000000, 9999999999))
-            
-            cursor.execute("SELECT COUNT(*) FROM accounts WHERE account_number = %s", (account_number,))
-            if cursor.fetchone()[0] == 0:
-                cursor.close()
-                return account_number
+            try:
+                return parse_amount(input(prompt), allow_zero=allow_zero)
+            except BankingError as e:
+                print(f"{e}. Please enter a valid number.")
     
     def create_account(self):
         """Create a new bank account"""
@@ -186,51 +158,19 @@ class BankingSystem:
         phone = input("Enter phone number: ").strip()
         address = input("Enter address: ").strip()
         
-        account_number = self.generate_account_number()
+        initial_deposit = self.read_amount("Enter initial deposit amount: $", allow_zero=True)
         
-        while True:
-            try:
-                initial_deposit = float(input("Enter initial deposit amount: $"))
-                if initial_deposit < 0:
-                    print("Initial deposit cannot be negative.")
-                    continue
-                break
-            except ValueError:
-                print("Please enter a valid number.")
-        
-        cursor = self.connection.cursor()
         try:
-            cursor.execute("""
-                INSERT INTO accounts (account_number, account_holder, email, phone, address, balance)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (account_number, account_holder, email, phone, address, initial_deposit))
-            
-            account_id = cursor.lastrowid
-            cursor.execute("""
-                INSERT INTO transactions (account_id, transaction_type, amount, description)
-                VALUES (%s, 'account_creation', %s, 'Initial deposit - Account creation')
-            """, (account_id, initial_deposit))
-            
-            self.connection.commit()
+            account = self.service.create_account(account_holder, initial_deposit,
+                                                  email=email, phone=phone, address=address)
             
             print(f"\n✓ Account created successfully!")
-            print(f"   Account Number: {account_number}")
-            print(f"   Account Holder: {account_holder}")
-            print(f"   Initial Balance: ${initial_deposit:.2f}")
+            print(f"   Account Number: {account['account_number']}")
+            print(f"   Account Holder: {account['account_holder']}")
+            print(f"   Initial Balance: ${account['balance']:.2f}")
             
-        except Error as e:
+        except (Error, BankingError) as e:
             print(f"✗ Error creating account: {e}")
-            self.connection.rollback()
-        finally:
-            cursor.close()
-    
-    def get_account_id(self, account_number):
-        """Get account ID from account number"""
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT account_id FROM accounts WHERE account_number = %s", (account_number,))
-        result = cursor.fetchone()
-        cursor.close()
-        return result[0] if result else None
     
     def deposit_money(self):
         """Deposit money into an account"""
@@ -239,51 +179,22 @@ class BankingSystem:
         print("="*50)
         
         account_number = input("Enter account number: ").strip()
-        account_id = self.get_account_id(account_number)
-        
-        if not account_id:
+        if not self.service.get_account_id(account_number):
             print("✗ Account not found!")
             return
         
-        while True:
-            try:
-                amount = float(input("Enter deposit amount: $"))
-                if amount <= 0:
-                    print("Deposit amount must be positive.")
-                    continue
-                break
-            except ValueError:
-                print("Please enter a valid number.")
-        
+        amount = self.read_amount("Enter deposit amount: $")
         description = input("Enter deposit description (optional): ").strip()
         
-        cursor = self.connection.cursor()
         try:
-            cursor.execute("""
-                UPDATE accounts 
-                SET balance = balance + %s 
-                WHERE account_id = %s
-            """, (amount, account_id))
-            
-            cursor.execute("""
-                INSERT INTO transactions (account_id, transaction_type, amount, description)
-                VALUES (%s, 'deposit', %s, %s)
-            """, (account_id, amount, description or "Cash deposit"))
-            
-            self.connection.commit()
-            
-            cursor.execute("SELECT balance FROM accounts WHERE account_id = %s", (account_id,))
-            balance = cursor.fetchone()[0]
+            result = self.service.deposit(account_number, amount, description)
             
             print(f"\n✓ Deposit successful!")
-            print(f"   Amount deposited: ${amount:.2f}")
-            print(f"   New balance: ${balance:.2f}")
+            print(f"   Amount deposited: ${result['amount']:.2f}")
+            print(f"   New balance: ${result['balance']:.2f}")
             
-        except Error as e:
+        except (Error, BankingError) as e:
             print(f"✗ Error processing deposit: {e}")
-            self.connection.rollback()
-        finally:
-            cursor.close()
     
     def withdraw_money(self):
         """Withdraw money from an account"""
@@ -292,59 +203,67 @@ class BankingSystem:
         print("="*50)
         
         account_number = input("Enter account number: ").strip()
-        account_id = self.get_account_id(account_number)
-        
-        if not account_id:
+        try:
+            account = self.service.get_balance(account_number)
+        except AccountNotFoundError:
             print("✗ Account not found!")
             return
         
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT balance FROM accounts WHERE account_id = %s", (account_id,))
-        balance = cursor.fetchone()[0]
-        
-        print(f"Current balance: ${balance:.2f}")
-        
-        while True:
-            try:
-                amount = float(input("Enter withdrawal amount: $"))
-                if amount <= 0:
-                    print("Withdrawal amount must be positive.")
-                    continue
-                if amount > balance:
-                    print("✗ Insufficient funds!")
-                    return
-                break
-            except ValueError:
-                print("Please enter a valid number.")
+        print(f"Current balance: ${account['balance']:.2f}")
         
+        amount = self.read_amount("Enter withdrawal amount: $")
         description = input("Enter withdrawal description (optional): ").strip()
         
         try:
-            cursor.execute("""
-                UPDATE accounts 
-                SET balance = balance - %s 
-                WHERE account_id = %s
-            """, (amount, account_id))
-            
-            cursor.execute("""
-                INSERT INTO transactions (account_id, transaction_type, amount, description)
-                VALUES (%s, 'withdrawal', %s, %s)
-            """, (account_id, amount, description or "Cash withdrawal"))
-            
-            self.connection.commit()
-            
-            cursor.execute("SELECT balance FROM accounts WHERE account_id = %s", (account_id,))
-            new_balance = cursor.fetchone()[0]
+            result = self.service.withdraw(account_number, amount, description)
             
             print(f"\n✓ Withdrawal successful!")
-            print(f"   Amount withdrawn: ${amount:.2f}")
-            print(f"   New balance: ${new_balance:.2f}")
+            print(f"   Amount withdrawn: ${result['amount']:.2f}")
+            print(f"   New balance: ${result['balance']:.2f}")
             
-        except Error as e:
+        except InsufficientFundsError:
+            print("✗ Insufficient funds!")
+        except VelocityLimitError as e:
+            print(f"✗ Withdrawal refused: {e}")
+        except (Error, BankingError) as e:
             print(f"✗ Error processing withdrawal: {e}")
-            self.connection.rollback()
-        finally:
-            cursor.close()
+    
+    def transfer_money(self):
+        """Transfer money between two accounts"""
+        print("\n" + "="*50)
+        print("TRANSFER MONEY")
+        print("="*50)
+        
+        from_account_number = input("Enter source account number: ").strip()
+        try:
+            account = self.service.get_balance(from_account_number)
+        except AccountNotFoundError:
+            print("✗ Account not found!")
+            return
+        
+        print(f"Current balance: ${account['balance']:.2f}")
+        
+        to_account_number = input("Enter destination account number: ").strip()
+        if not self.service.get_account_id(to_account_number):
+            print("✗ Destination account not found!")
+            return
+        
+        amount = self.read_amount("Enter transfer amount: $")
+        description = input("Enter transfer description (optional): ").strip()
+        
+        try:
+            result = self.service.transfer(from_account_number, to_account_number, amount, description)
+            
+            print(f"\n✓ Transfer successful!")
+            print(f"   Amount transferred: ${result['amount']:.2f}")
+            print(f"   New balance: ${result['from_balance']:.2f}")
+            
+        except InsufficientFundsError:
+            print("✗ Insufficient funds!")
+        except VelocityLimitError as e:
+            print(f"✗ Transfer refused: {e}")
+        except (Error, BankingError) as e:
+            print(f"✗ Error processing transfer: {e}")
     
     def view_balance(self):
         """View account balance"""
@@ -354,23 +273,16 @@ class BankingSystem:
         
         account_number = input("Enter account number: ").strip()
         
-        cursor = self.connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT account_number, account_holder, balance, status 
-            FROM accounts 
-            WHERE account_number = %s
-        """, (account_number,))
-        
-        account = cursor.fetchone()
-        cursor.close()
-        
-        if account:
-            print(f"\nAccount Number: {account['account_number']}")
-            print(f"Account Holder: {account['account_holder']}")
-            print(f"Account Status: {account['status']}")
-            print(f"Current Balance: ${account['balance']:.2f}")
-        else:
+        try:
+            account = self.service.get_balance(account_number)
+        except AccountNotFoundError:
             print("✗ Account not found!")
+            return
+        
+        print(f"\nAccount Number: {account['account_number']}")
+        print(f"Account Holder: {account['account_holder']}")
+        print(f"Account Status: {account['status']}")
+        print(f"Current Balance: ${account['balance']:.2f}")
     
     def view_transaction_history(self):
         """View transaction history for an account"""
@@ -379,9 +291,9 @@ class BankingSystem:
         print("="*50)
         
         account_number = input("Enter account number: ").strip()
-        account_id = self.get_account_id(account_number)
-        
-        if not account_id:
+        try:
+            account = self.service.get_balance(account_number)
+        except AccountNotFoundError:
             print("✗ Account not found!")
             return
         
@@ -396,73 +308,49 @@ class BankingSystem:
             print("Using default limit of 10 transactions")
             limit = 10
         
-        cursor = self.connection.cursor(dictionary=True)
+        # Archived months live outside the hot table and are only read on request
+        include_archived = False
+        if self.service.pool is not None:
+            include_archived = input("Include archived history? (y/N): ").strip().lower() == 'y'
         
+        # 'all' streams page by page so long histories never sit in memory
         if limit:
-            cursor.execute("""
-                SELECT transaction_type, amount, description, transaction_date
-                FROM transactions
-                WHERE account_id = %s
-                ORDER BY transaction_date DESC
-                LIMIT %s
-            """, (account_id, limit))
+            transactions = iter(self.service.get_transaction_page(
+                account_number, limit=limit, include_archived=include_archived)['transactions'])
         else:
-            cursor.execute("""
-                SELECT transaction_type, amount, description, transaction_date
-                FROM transactions
-                WHERE account_id = %s
-                ORDER BY transaction_date DESC
-            """, (account_id,))
-        
-        transactions = cursor.fetchall()
+            transactions = self.service.iter_transactions(account_number, include_archived=include_archived)
         
-        cursor.execute("SELECT account_holder FROM accounts WHERE account_id = %s", (account_id,))
-        account_holder = cursor.fetchone()['account_holder']
-        cursor.close()
-        
-        print(f"\nTransaction History for: {account_holder}")
+        print(f"\nTransaction History for: {account['account_holder']}")
         print(f"Account Number: {account_number}")
         print("-"*80)
         
-        if not transactions:
+        first = next(transactions, None)
+        if first is None:
             print("No transactions found.")
             return
         
         print(f"{'Date':<20} {'Type':<15} {'Amount':<15} {'Description':<30}")
         print("-"*80)
         
-        total_deposits = 0
-        total_withdrawals = 0
-        
-        for trans in transactions:
+        totals = TransactionTotals()
+        for trans in itertools.chain([first], transactions):
             date_str = trans['transaction_date'].strftime("%Y-%m-%d %H:%M:%S")
             trans_type = trans['transaction_type'].upper()
             amount = trans['amount']
             description = trans['description'] or ""
-            
-            if trans_type in ['DEPOSIT', 'ACCOUNT_CREATION']:
-                total_deposits += amount
-            elif trans_type == 'WITHDRAWAL':
-                total_withdrawals += amount
+            totals.add(trans)
             
             print(f"{date_str:<20} {trans_type:<15} ${amount:<14.2f} {description:<30}")
         
         print("-"*80)
-        print(f"Total Deposits: ${total_deposits:.2f}")
-        print(f"Total Withdrawals: ${total_withdrawals:.2f}")
-        print(f"Net Change: ${(total_deposits - total_withdrawals):.2f}")
+        print(f"Total Deposits: ${totals.total_deposits:.2f}")
+        print(f"Total Withdrawals: ${totals.total_withdrawals:.2f}")
+        print(f"Net Change: ${totals.net_change:.2f}")
     
     def view_all_accounts(self):
         """View all accounts (admin function)"""
-        cursor = self.connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT account_number, account_holder, balance, status, created_at
-            FROM accounts
-            ORDER BY created_at DESC
-        """)
-        
-        accounts = cursor.fetchall()
-        cursor.close()
+        result = self.service.get_all_accounts()
+        accounts = result['accounts']
         
         print("\n" + "="*80)
         print("ALL ACCOUNTS")
@@ -475,22 +363,23 @@ class BankingSystem:
         print(f"{'Account No.':<15} {'Holder':<25} {'Balance':<15} {'Status':<12} {'Created On':<20}")
         print("-"*80)
         
-        total_balance = 0
         for account in accounts:
             created_date = account['created_at'].strftime("%Y-%m-%d")
             print(f"{account['account_number']:<15} {account['account_holder']:<25} "
                   f"${account['balance']:<14.2f} {account['status']:<12} {created_date:<20}")
-            total_balance += account['balance']
         
         print("-"*80)
         print(f"Total Accounts: {len(accounts)}")
+        total_balance = self.snapshots.bank_total() if self.snapshots else result['total_balance']
         print(f"Total Bank Balance: ${total_balance:.2f}")
     
     def close_connection(self):
         """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
+        if self.service:
+            self.service.close()
             print("\nDatabase connection closed.")
+        if self.metrics and os.getenv('BANK_METRICS_FILE'):
+            self.metrics.write_textfile(os.getenv('BANK_METRICS_FILE'))
     
     def display_menu(self):
         """Display main menu"""
@@ -500,10 +389,11 @@ class BankingSystem:
         print("1. Create New Account")
         print("2. Deposit Money")
         print("3. Withdraw Money")
-        print("4. View Account Balance")
-        print("5. View Transaction History")
-        print("6. View All Accounts (Admin)")
-        print("7. Exit")
+        print("4. Transfer Money")
+        print("5. View Account Balance")
+        print("6. View Transaction History")
+        print("7. View All Accounts (Admin)")
+        print("8. Exit")
         print("="*50)
 
 def main():
@@ -518,7 +408,7 @@ def main():
         while True:
             bank.display_menu()
             
-            choice = input("\nEnter your choice (1-7): ").strip()
+            choice = input("\nEnter your choice (1-8): ").strip()
             
             if choice == '1':
                 bank.create_account()
@@ -527,16 +417,18 @@ def main():
             elif choice == '3':
                 bank.withdraw_money()
             elif choice == '4':
-                bank.view_balance()
+                bank.transfer_money()
             elif choice == '5':
-                bank.view_transaction_history()
+                bank.view_balance()
             elif choice == '6':
-                bank.view_all_accounts()
+                bank.view_transaction_history()
             elif choice == '7':
+                bank.view_all_accounts()
+            elif choice == '8':
                 print("\nThank you for using the Banking System. Goodbye!")
                 break
             else:
-                print("Invalid choice! Please enter a number between 1 and 7.")
+                print("Invalid choice! Please enter a number between 1 and 8.")
             
             input("\nPress Enter to continue...")
         
@@ -550,4 +442,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,429 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bank_config import load_database_config
+from bank_errors import BankingError
+from bank_money import Money
+from bank_storage import open_backend
+
+
+# Category codes stored in the int8 type and status columns
+TRANSACTION_TYPES = ('deposit', 'withdrawal', 'transfer', 'account_creation')
+STATUSES = ('active', 'inactive', 'suspended')
+DEPOSIT, WITHDRAWAL, TRANSFER, ACCOUNT_CREATION = range(len(TRANSACTION_TYPES))
+
+# One flat little-endian file per column: <table>.<column>
+TRANSACTION_COLUMNS = (('transaction_id', '<i8'), ('account_id', '<i4'), ('type', 'i1'), ('amount', '<i8'),
+                       ('time', '<i8'))
+ACCOUNT_COLUMNS = (('account_id', '<i4'), ('status', 'i1'), ('created', '<i8'), ('label', '<i8'))
+
+STATE_FILE = 'state.json'
+LABELS_FILE = 'accounts.labels'
+TOP_BY = ('balance', 'deposits', 'withdrawals', 'transactions')
+EPOCH = datetime.datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+
+
+def to_seconds(value):
+    """Seconds since 1970-01-01 of a naive date or datetime, as in the time columns"""
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return (value - EPOCH) // datetime.timedelta(seconds=1)
+
+
+def group_sum(groups, values, size):
+    """Sum int64 ``values`` per group index in one vectorised pass
+
+    bincount adds in float64, which is exact for cent totals below 2**53
+    (about 90 trillion dollars).
+    """
+    return np.rint(np.bincount(groups, weights=values, minlength=size)).astype(np.int64)
+
+
+def net_change(ledger):
+    """Signed effect of each ledger row on its account's balance"""
+    return np.where(ledger['type'] == WITHDRAWAL, -ledger['amount'], ledger['amount'])
+
+
+def deposits_and_withdrawals(ledger):
+    """Split ledger amounts into money in and money out, as TransactionTotals does"""
+    kind, amount = ledger['type'], ledger['amount']
+    transfer = kind == TRANSFER
+    deposits = np.where((kind == DEPOSIT) | (kind == ACCOUNT_CREATION) | (transfer & (amount > 0)), amount, 0)
+    withdrawals = np.where(kind == WITHDRAWAL, amount, np.where(transfer & (amount < 0), -amount, 0))
+    return deposits, withdrawals
+
+
+class AnalyticsStore:
+    """Columnar copy of accounts and the ledger for bank-wide reporting
+
+    Each column is a flat binary file in ``directory``. refresh() appends
+    to the files, and queries memory-map them, so reports are NumPy vector
+    operations over local files and never query the OLTP database.
+
+    refresh() extracts only ledger rows past the last transaction_id and
+    accounts past the last account_id. Balances are folded from the ledger
+    columns, as bank_ledger does, rather than copied from accounts.
+    ``state.json`` records the committed row counts. Columns are appended
+    first and the state is replaced atomically afterwards, so rows from a
+    refresh cut short are truncated by the next one.
+
+    Every refresh re-reads the status of the accounts already extracted
+    and rewrites their status column in place, so status is as current as
+    the last refresh (``status_refreshed_at``).
+    """
+
+    def __init__(self, directory='analytics'):
+        if np is None:
+            raise BankingError("The analytics store needs NumPy: pip install numpy")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.state = self._load_state()
+        self._balances = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_state(self):
+        path = self._path(STATE_FILE)
+        if not os.path.exists(path):
+            return {'transactions': 0, 'last_transaction_id': 0, 'accounts': 0, 'last_account_id': 0,
+                    'labels_size': 0, 'refreshed_at': None, 'status_refreshed_at': None}
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        state.setdefault('status_refreshed_at', None)  # stores written before status was refreshed
+        return state
+
+    def _save_state(self):
+        temp_path = self._path(STATE_FILE + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self._path(STATE_FILE))
+
+    def _files(self):
+        """Yield (path, committed size in bytes) for every column and the labels"""
+        for table, columns in (('transactions', TRANSACTION_COLUMNS), ('accounts', ACCOUNT_COLUMNS)):
+            for name, dtype in columns:
+                yield self._path(f"{table}.{name}"), self.state[table] * np.dtype(dtype).itemsize
+        yield self._path(LABELS_FILE), self.state['labels_size']
+
+    def _truncate(self):
+        """Drop anything appended after the last committed state"""
+        for path, size in self._files():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _append(self, table, columns, arrays):
+        for name, dtype in columns:
+            with open(self._path(f"{table}.{name}"), 'ab') as f:
+                np.asarray(arrays[name], dtype=dtype).tofile(f)
+
+    def _column(self, table, name, dtype):
+        """Memory-map the committed rows of one column"""
+        count = self.state[table]
+        if not count:
+            return np.empty(0, dtype)
+        return np.memmap(self._path(f"{table}.{name}"), dtype=dtype, mode='r', shape=(count,))
+
+    def refresh(self, backend, chunk_size=100000, settle_seconds=60):
+        """Extract new accounts and settled ledger rows from a storage backend
+
+        Accounts and ledger rows younger than ``settle_seconds`` are left
+        for the next refresh, so a row that commits late with a lower ID is
+        not skipped. Returns (accounts added, transactions added).
+        """
+        if not self.state['last_transaction_id']:
+            backend.ledger_id_bounds()  # refuses while archived months exist only as files
+        self._truncate()
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=settle_seconds)
+        accounts = self._refresh_accounts(backend, chunk_size, cutoff)
+        transactions = 0
+        while True:
+            rows = backend.ledger_rows(self.state['last_transaction_id'], chunk_size)
+            settled = next((index for index, row in enumerate(rows) if row[4] >= cutoff), len(rows))
+            if settled:
+                ids, account_ids, kinds, amounts, dates = zip(*rows[:settled])
+                self._append('transactions', TRANSACTION_COLUMNS, {
+                    'transaction_id': ids,
+                    'account_id': account_ids,
+                    'type': [TRANSACTION_TYPES.index(kind) for kind in kinds],
+                    'amount': amounts,
+                    'time': [to_seconds(date) for date in dates]
+                })
+                self.state['transactions'] += settled
+                self.state['last_transaction_id'] = ids[-1]
+                self._save_state()
+                transactions += settled
+            if settled < chunk_size:
+                break
+        self.state['refreshed_at'] = datetime.datetime.now().isoformat(' ', 'seconds')
+        self._save_state()
+        self._balances = None
+        return accounts, transactions
+
+    def _refresh_statuses(self, rows):
+        """Rewrite the status of already extracted accounts from (account_id, status) pairs"""
+        if not rows:
+            return
+        status = np.memmap(self._path('accounts.status'), dtype='i1', mode='r+', shape=(self.state['accounts'],))
+        account_ids = self._column('accounts', 'account_id', '<i4')
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        positions = np.searchsorted(account_ids, ids)
+        found = positions < len(account_ids)
+        found[found] = account_ids[positions[found]] == ids[found]
+        status[positions[found]] = np.array([STATUSES.index(row[1]) for row in rows], dtype='i1')[found]
+        status.flush()
+
+    def _refresh_accounts(self, backend, chunk_size, cutoff):
+        """Re-read every account's status and extract the settled new accounts
+
+        One pass over accounts in ID order: rows already in the store only
+        update their status, and new rows are appended up to the first one
+        created after ``cutoff``.
+        """
+        added = 0
+        after_id = 0
+        while True:
+            rows = backend.account_rows(after_id, chunk_size)
+            known = [row for row in rows if row[0] <= self.state['last_account_id']]
+            self._refresh_statuses([(row[0], row[3]) for row in known])
+            new = rows[len(known):]
+            settled = next((index for index, row in enumerate(new) if row[4] >= cutoff), len(new))
+            if settled:
+                added += self._append_accounts(new[:settled])
+            if settled < len(new) or len(rows) < chunk_size:
+                break
+            after_id = rows[-1][0]
+        self.state['status_refreshed_at'] = datetime.datetime.now().isoformat(' ', 'seconds')
+        return added
+
+    def _append_accounts(self, rows):
+        offsets = []
+        with open(self._path(LABELS_FILE), 'ab') as f:
+            for _, number, holder, _, _ in rows:
+                offsets.append(self.state['labels_size'])
+                label = f"{number}\t{' '.join(holder.split())}\n".encode('utf-8')
+                f.write(label)
+                self.state['labels_size'] += len(label)
+        self._append('accounts', ACCOUNT_COLUMNS, {
+            'account_id': [row[0] for row in rows],
+            'status': [STATUSES.index(row[3]) for row in rows],
+            'created': [to_seconds(row[4]) for row in rows],
+            'label': offsets
+        })
+        self.state['accounts'] += len(rows)
+        self.state['last_account_id'] = rows[-1][0]
+        self._save_state()
+        return len(rows)
+
+    def ledger(self, start_date=None, end_date=None):
+        """Return the ledger columns, limited to [start_date, end_date) when given"""
+        ledger = {name: self._column('transactions', name, dtype) for name, dtype in TRANSACTION_COLUMNS}
+        if start_date is None and end_date is None:
+            return ledger
+        mask = np.ones(len(ledger['time']), dtype=bool)
+        if start_date is not None:
+            mask &= ledger['time'] >= to_seconds(start_date)
+        if end_date is not None:
+            mask &= ledger['time'] < to_seconds(end_date)
+        return {name: column[mask] for name, column in ledger.items()}
+
+    def accounts(self):
+        return {name: self._column('accounts', name, dtype) for name, dtype in ACCOUNT_COLUMNS}
+
+    def _id_space(self, ledger):
+        """Size of an array indexed by account_id that fits every known account"""
+        highest = [self.state['last_account_id']]
+        if len(ledger['account_id']):
+            highest.append(int(ledger['account_id'].max()))
+        return max(highest) + 1
+
+    def balances(self):
+        """Current balance in cents of every account, indexed by account_id"""
+        if self._balances is None:
+            ledger = self.ledger()
+            self._balances = group_sum(ledger['account_id'], net_change(ledger), self._id_space(ledger))
+        return self._balances
+
+    def _labels(self, offsets):
+        """Return (account_number, account_holder) for label offsets"""
+        labels = []
+        with open(self._path(LABELS_FILE), 'rb') as f:
+            for offset in offsets:
+                f.seek(int(offset))
+                number, holder = f.readline().decode('utf-8').rstrip('\n').split('\t', 1)
+                labels.append((number, holder))
+        return labels
+
+    def summary(self):
+        """Return account count, total balance and a breakdown by account status"""
+        accounts = self.accounts()
+        balances = self.balances()[accounts['account_id']]
+        counts = np.bincount(accounts['status'], minlength=len(STATUSES))
+        totals = group_sum(accounts['status'], balances, len(STATUSES))
+        return {
+            'accounts': self.state['accounts'],
+            'transactions': self.state['transactions'],
+            'last_transaction_id': self.state['last_transaction_id'],
+            'refreshed_at': self.state['refreshed_at'],
+            'status_refreshed_at': self.state['status_refreshed_at'],
+            'total_balance': Money(int(balances.sum())),
+            'by_status': {status: {'accounts': int(counts[code]), 'balance': Money(int(totals[code]))}
+                          for code, status in enumerate(STATUSES)}
+        }
+
+    def totals_by_day(self, start_date=None, end_date=None):
+        """Return bank-wide count, deposits, withdrawals and net change per active day"""
+        ledger = self.ledger(start_date, end_date)
+        days, groups = np.unique(ledger['time'] // SECONDS_PER_DAY, return_inverse=True)
+        counts = np.bincount(groups, minlength=len(days))
+        deposits, withdrawals = deposits_and_withdrawals(ledger)
+        deposits = group_sum(groups, deposits, len(days))
+        withdrawals = group_sum(groups, withdrawals, len(days))
+        net = group_sum(groups, net_change(ledger), len(days))
+        return [{
+            'date': (EPOCH + datetime.timedelta(days=int(day))).date(),
+            'transaction_count': int(counts[index]),
+            'deposits': Money(int(deposits[index])),
+            'withdrawals': Money(int(withdrawals[index])),
+            'net_change': Money(int(net[index]))
+        } for index, day in enumerate(days)]
+
+    def totals_by_type(self, start_date=None, end_date=None):
+        """Return count, volume (sum of absolute amounts) and net change per transaction type"""
+        ledger = self.ledger(start_date, end_date)
+        size = len(TRANSACTION_TYPES)
+        counts = np.bincount(ledger['type'], minlength=size)
+        volume = group_sum(ledger['type'], np.abs(ledger['amount']), size)
+        net = group_sum(ledger['type'], net_change(ledger), size)
+        return {kind: {'transaction_count': int(counts[code]), 'volume': Money(int(volume[code])),
+                       'net_change': Money(int(net[code]))}
+                for code, kind in enumerate(TRANSACTION_TYPES)}
+
+    def top_accounts(self, n=10, by='balance', start_date=None, end_date=None):
+        """Return the ``n`` accounts with the highest balance, deposits, withdrawals or transaction count
+
+        The activity measures cover [start_date, end_date) when given.
+        """
+        if by not in TOP_BY:
+            raise ValueError(f"Unknown ranking: {by!r}")
+        accounts = self.accounts()
+        if by == 'balance':
+            by_id = self.balances()
+        else:
+            ledger = self.ledger(start_date, end_date)
+            size = self._id_space(ledger)
+            if by == 'transactions':
+                by_id = np.bincount(ledger['account_id'], minlength=size)
+            else:
+                deposits, withdrawals = deposits_and_withdrawals(ledger)
+                by_id = group_sum(ledger['account_id'], deposits if by == 'deposits' else withdrawals, size)
+        values = by_id[accounts['account_id']]
+        n = min(n, len(values))
+        if not n:
+            return []
+        top = np.argpartition(-values, n - 1)[:n]
+        top = top[np.argsort(-values[top], kind='stable')]
+        balances = self.balances()
+        return [{
+            'account_number': number,
+            'account_holder': holder,
+            'balance': Money(int(balances[accounts['account_id'][index]])),
+            by: int(values[index]) if by == 'transactions' else Money(int(values[index]))
+        } for index, (number, holder) in zip(top, self._labels(accounts['label'][top]))]
+
+    def balance_histogram(self, bins=10):
+        """Return (low, high, accounts) buckets of equal width over all balances"""
+        balances = self.balances()[self.accounts()['account_id']]
+        if not len(balances):
+            return []
+        counts, edges = np.histogram(balances, bins=bins)
+        edges = np.rint(edges).astype(np.int64)
+        return [{'low': Money(int(edges[index])), 'high': Money(int(edges[index + 1])), 'accounts': int(count)}
+                for index, count in enumerate(counts)]
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    """Command-line entry point for the columnar analytics store"""
+    parser = argparse.ArgumentParser(description="Bank-wide reports from a local columnar store")
+    parser.add_argument('--store', default=os.getenv('BANK_ANALYTICS_DIR', 'analytics'),
+                        help="store directory (default $BANK_ANALYTICS_DIR or ./analytics)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    refresh = commands.add_parser('refresh', help="extract new accounts and transactions from the database")
+    refresh.add_argument('--chunk-size', type=int, default=100000)
+    refresh.add_argument('--settle-seconds', type=int, default=60,
+                         help="leave transactions younger than this for the next refresh")
+    commands.add_parser('summary', help="accounts and balances by status")
+    daily = commands.add_parser('daily', help="deposits, withdrawals and net change per day")
+    types = commands.add_parser('types', help="count and volume per transaction type")
+    top = commands.add_parser('top', help="largest accounts by balance or activity")
+    top.add_argument('-n', type=int, default=10)
+    top.add_argument('--by', choices=TOP_BY, default='balance')
+    for command in (daily, types, top):
+        command.add_argument('--start', type=_parse_date, help="first day (inclusive)")
+        command.add_argument('--end', type=_parse_date, help="last day (inclusive)")
+    histogram = commands.add_parser('histogram', help="distribution of account balances")
+    histogram.add_argument('--bins', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("✗ The analytics store needs NumPy: pip install numpy")
+        return 1
+    store = AnalyticsStore(args.store)
+    start = getattr(args, 'start', None)
+    end = getattr(args, 'end', None)
+    end = end + datetime.timedelta(days=1) if end else None
+
+    try:
+        if args.command == 'refresh':
+            backend = open_backend(load_database_config(), pool_size=1)
+            try:
+                accounts, transactions = store.refresh(backend, args.chunk_size, args.settle_seconds)
+            finally:
+                backend.close()
+            print(f"✓ {accounts} accounts and {transactions} transactions added "
+                  f"(up to transaction {store.state['last_transaction_id']})")
+        elif args.command == 'summary':
+            summary = store.summary()
+            for status, totals in summary['by_status'].items():
+                print(f"  {status:<10} {totals['accounts']:>10} accounts  ${totals['balance']:>16.2f}")
+            print(f"Total: {summary['accounts']} accounts, ${summary['total_balance']:.2f} "
+                  f"(as of transaction {summary['last_transaction_id']}, refreshed {summary['refreshed_at']})")
+            if summary['accounts'] and summary['status_refreshed_at'] is None:
+                print("  Account status is as first extracted and may be stale; run refresh to update it")
+        elif args.command == 'daily':
+            for day in store.totals_by_day(start, end):
+                print(f"  {day['date']}  {day['transaction_count']:>8}  +${day['deposits']:>14.2f}  "
+                      f"-${day['withdrawals']:>14.2f}  net ${day['net_change']:>14.2f}")
+        elif args.command == 'types':
+            for kind, totals in store.totals_by_type(start, end).items():
+                print(f"  {kind:<18} {totals['transaction_count']:>10}  volume ${totals['volume']:>16.2f}  "
+                      f"net ${totals['net_change']:>16.2f}")
+        elif args.command == 'top':
+            for rank, account in enumerate(store.top_accounts(args.n, args.by, start, end), 1):
+                value = account[args.by]
+                value = f"{value:>10}" if args.by == 'transactions' else f"${value:>16.2f}"
+                print(f"  {rank:>3}. {account['account_number']:<14} {account['account_holder'][:30]:<30} {value}")
+        else:
+            for bucket in store.balance_histogram(args.bins):
+                print(f"  ${bucket['low']:>14.2f} .. ${bucket['high']:>14.2f}  {bucket['accounts']:>10}")
+    except BankingError as e:
+        print(f"✗ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+import argparse
+import csv
+import datetime
+import gzip
+import os
+import re
+import sys
+
+from bank_db import (load_database_config, PARTITION_MONTHS_AHEAD, add_months, month_partitions, month_start,
+                     next_month, partition_month)
+from bank_service import BankingService, BankingError
+
+
+ARCHIVE_COLUMNS = ('transaction_id', 'account_id', 'transaction_type', 'amount', 'description', 'transaction_date')
+ARCHIVE_FILE_NAME = re.compile(r'transactions_(\d{6})\.csv\.gz$')
+
+
+class TransactionArchiver:
+    """Monthly partition upkeep and archival for the transactions table
+
+    ``transactions`` is range-partitioned by month (migration 6).
+    extend_partitions() keeps empty partitions ready ahead of time.
+    archive() moves closed months out of the hot table, either into the
+    compressed ``transactions_archive`` table or into gzipped CSV files.
+    It then drops their partitions, which is instant whatever their size.
+    Every archived month is recorded in ``transaction_archives``.
+
+    History and totals read the archive table when asked with
+    ``include_archived=True``. A month archived to a file can be loaded
+    back into the archive table with restore().
+    """
+
+    def __init__(self, service, chunk_size=10000):
+        if service.pool is None:
+            raise BankingError("Transaction archival requires the MySQL storage backend")
+        self.service = service
+        self.pool = service.pool
+        self.chunk_size = chunk_size
+
+    def partitions(self):
+        """Return (partition_name, month, estimated_rows) oldest first; month is None for p_future"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT PARTITION_NAME, TABLE_ROWS
+                    FROM information_schema.PARTITIONS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transactions'
+                    ORDER BY PARTITION_ORDINAL_POSITION
+                """)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        if not rows or rows[0][0] is None:
+            raise BankingError("The transactions table is not partitioned; run 'python bank_db.py migrate'")
+        return [(name, partition_month(name), estimate) for name, estimate in rows]
+
+    def extend_partitions(self, months_ahead=PARTITION_MONTHS_AHEAD):
+        """Split p_future so every month up to ``months_ahead`` has its own partition
+
+        Returns the number of partitions added.
+        """
+        months = [month for _, month, _ in self.partitions() if month is not None]
+        last = add_months(month_start(datetime.date.today()), months_ahead)
+        first = next_month(months[-1]) if months else month_start(datetime.date.today())
+        if first > last:
+            return 0
+        clauses = month_partitions(first, last)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"ALTER TABLE transactions REORGANIZE PARTITION p_future INTO ({', '.join(clauses)})")
+            finally:
+                cursor.close()
+        return len(clauses) - 1
+
+    def archive(self, before, destination='table', directory='archive'):
+        """Move every month that ends on or before ``before`` out of the hot table
+
+        ``destination`` is 'table' (the compressed archive table) or 'csv'
+        (one transactions_YYYYMM.csv.gz file per month in ``directory``).
+        Months must already be folded into the daily snapshots, and only
+        closed months can be archived: the current month still takes
+        postings, which dropping its partition would lose. Returns a list
+        of (partition_name, rows_archived).
+        """
+        if destination not in ('table', 'csv'):
+            raise ValueError(f"Unknown archive destination: {destination!r}")
+        cutoff = month_start(before)
+        current = month_start(datetime.date.today())
+        if cutoff > current:
+            raise BankingError(f"Only closed months can be archived; use a date no later than {current}")
+        self.extend_partitions()
+        archived = []
+        for name, month, _ in self.partitions():
+            if month is None or next_month(month) > cutoff:
+                continue
+            self._check_summarised(name)
+            if destination == 'table':
+                count, path = self._copy_to_table(name), None
+            else:
+                path = os.path.join(directory, archive_file_name(month))
+                count = self._write_file(name, path)
+            self._drop(name, next_month(month), destination, path, count)
+            archived.append((name, count))
+        return archived
+
+    def _check_summarised(self, name):
+        """Refuse to archive rows the daily snapshots have not folded in yet"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"""
+                    SELECT COALESCE(MAX(transaction_id), 0) > (
+                        SELECT last_transaction_id FROM snapshot_state WHERE snapshot_id = 1)
+                    FROM transactions PARTITION ({name})
+                """)
+                pending = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+        if pending:
+            raise BankingError(f"Partition {name} has rows not yet in the daily snapshots; "
+                               f"run 'python bank_snapshots.py refresh' first")
+
+    def _copy_to_table(self, name):
+        """Copy one partition into transactions_archive in transaction_id ranges
+
+        INSERT IGNORE makes a rerun after a crash pick up where it stopped.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"SELECT MIN(transaction_id), MAX(transaction_id), COUNT(*) "
+                               f"FROM transactions PARTITION ({name})")
+                low, high, count = cursor.fetchone()
+            finally:
+                cursor.close()
+        if not count:
+            return 0
+
+        def copy_range(start):
+            def work(conn):
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f"""
+                        INSERT IGNORE INTO transactions_archive ({', '.join(ARCHIVE_COLUMNS)})
+                        SELECT {', '.join(ARCHIVE_COLUMNS)}
+                        FROM transactions PARTITION ({name})
+                        WHERE transaction_id >= %s AND transaction_id < %s
+                    """, (start, start + self.chunk_size))
+                finally:
+                    cursor.close()
+            return work
+
+        for start in range(low, high + 1, self.chunk_size):
+            self.pool.run_transaction(copy_range(start))
+        return count
+
+    def _write_file(self, name, path):
+        """Stream one partition to a gzipped CSV, replacing any partial file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = path + '.tmp'
+        count = 0
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM transactions PARTITION ({name}) "
+                               f"ORDER BY transaction_id")
+                with gzip.open(temp_path, 'wt', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(ARCHIVE_COLUMNS)
+                    while True:
+                        rows = cursor.fetchmany(self.chunk_size)
+                        if not rows:
+                            break
+                        writer.writerows(rows)
+                        count += len(rows)
+            finally:
+                cursor.close()
+        os.replace(temp_path, path)
+        return count
+
+    def _drop(self, name, period_end, location, path, count):
+        """Record an archived month, then drop its partition"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    INSERT INTO transaction_archives (partition_name, period_end, location, path, row_count)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE location = VALUES(location), path = VALUES(path),
+                                            row_count = VALUES(row_count), archived_at = CURRENT_TIMESTAMP
+                """, (name, period_end, location, path, count))
+                conn.commit()
+                cursor.execute(f"ALTER TABLE transactions DROP PARTITION {name}")
+            finally:
+                cursor.close()
+
+    def restore(self, path):
+        """Load an archived CSV file into transactions_archive so history can read it
+
+        The month is identified by the file name, so the file may be
+        restored from any directory or through any relative path. Returns
+        the number of rows read.
+        """
+        match = ARCHIVE_FILE_NAME.search(os.path.basename(path))
+        if match is None:
+            raise BankingError(f"{path} is not named like an archive ({archive_file_name(datetime.date.today())})")
+        partition_name = f"p{match.group(1)}"
+        count = 0
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if tuple(header or ()) != ARCHIVE_COLUMNS:
+                raise BankingError(f"{path} is not a transaction archive")
+            while True:
+                rows = [tuple(value or None for value in row) for _, row in zip(range(self.chunk_size), reader)]
+                if not rows:
+                    break
+                self.pool.run_transaction(lambda conn, rows=rows: self._insert_rows(conn, rows))
+                count += len(rows)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("UPDATE transaction_archives SET location = 'table' WHERE partition_name = %s",
+                               (partition_name,))
+            finally:
+                cursor.close()
+        return count
+
+    def _insert_rows(self, conn, rows):
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(f"""
+                INSERT IGNORE INTO transactions_archive ({', '.join(ARCHIVE_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(ARCHIVE_COLUMNS))})
+            """, rows)
+        finally:
+            cursor.close()
+
+    def archived_periods(self):
+        """Return the catalog of archived months, oldest first"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT partition_name, period_end, location, path, row_count, archived_at
+                    FROM transaction_archives
+                    ORDER BY period_end
+                """)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+
+def archive_file_name(month):
+    """File name of one archived month"""
+    return f"transactions_{month:%Y%m}.csv.gz"
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    """Command-line entry point for partition upkeep and archival"""
+    parser = argparse.ArgumentParser(description="Transaction table partitions and archives")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('partitions', help="list the hot table's monthly partitions")
+    extend = commands.add_parser('extend', help="add empty partitions for the coming months")
+    extend.add_argument('--months', type=int, default=PARTITION_MONTHS_AHEAD,
+                        help=f"months ahead to prepare (default {PARTITION_MONTHS_AHEAD})")
+    archive = commands.add_parser('archive', help="move closed months out of the hot table")
+    archive.add_argument('before', type=_parse_date, help="archive months that end on or before this date")
+    archive.add_argument('--to', choices=['table', 'csv'], default='table',
+                         help="compressed archive table (default) or gzipped CSV files")
+    archive.add_argument('--directory', default='archive', help="where CSV archives are written")
+    restore = commands.add_parser('restore', help="load a CSV archive into the archive table")
+    restore.add_argument('path')
+    commands.add_parser('list', help="show archived months")
+    args = parser.parse_args(argv)
+
+    service = BankingService.from_config(load_database_config(), pool_size=1)
+    archiver = TransactionArchiver(service)
+    try:
+        if args.command == 'partitions':
+            for name, month, estimate in archiver.partitions():
+                print(f"  {name:<10} {month.strftime('%Y-%m') if month else 'later':<8} ~{estimate} rows")
+        elif args.command == 'extend':
+            print(f"✓ {archiver.extend_partitions(args.months)} partitions added")
+        elif args.command == 'archive':
+            archived = archiver.archive(args.before, args.to, args.directory)
+            for name, count in archived:
+                print(f"  {name}: {count} rows")
+            print(f"✓ {len(archived)} months archived to {args.to}")
+        elif args.command == 'restore':
+            print(f"✓ {archiver.restore(args.path)} rows restored from {args.path}")
+        else:
+            for period in archiver.archived_periods():
+                where = period['path'] if period['location'] == 'file' else 'transactions_archive'
+                print(f"  {period['partition_name']:<10} {period['row_count']:>10} rows  {where}")
+    except BankingError as e:
+        print(f"✗ {e}")
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
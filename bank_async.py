@@ -0,0 +1,484 @@
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+from bank_bench import percentile
+from bank_cache import LRUCache
+from bank_db import load_database_config, is_retryable, retry_delay
+from bank_money import Money
+from bank_service import (BankingService, BankingError, AccountNotFoundError, InsufficientFundsError,
+                          RequestKeyConflictError, VelocityLimitError, parse_amount)
+from bank_storage import (account_id_plan, account_holder_plan, balance_plan, deposit_plan, withdraw_plan,
+                          history_page_plan, next_page_cursor, open_backend)
+from bank_velocity import VelocityGuard, load_velocity_rules
+
+
+async def run_plan_async(cursor, plan):
+    """Drive a transaction plan on an aiomysql cursor
+
+    Mirrors bank_storage.run_plan, so the asyncio and threaded paths run
+    the same statements and raise the same errors.
+    """
+    try:
+        query = next(plan)
+        while True:
+            await cursor.execute(query.sql, query.params)
+            if query.fetch == 'one':
+                result = await cursor.fetchone()
+            elif query.fetch == 'all':
+                result = await cursor.fetchall()
+            elif query.fetch == 'rowcount':
+                result = cursor.rowcount
+            elif query.fetch == 'lastrowid':
+                result = cursor.lastrowid
+            else:
+                result = None
+            query = plan.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+class AsyncBankingService:
+    """asyncio counterpart of BankingService on an aiomysql pool
+
+    Deposit, withdraw, balance and history run the same transaction plans
+    as the threaded service, with the same retry policy and caching, so a
+    request behaves identically whichever front end serves it.
+
+    ``velocity`` is a bank_velocity.VelocityGuard checked before each
+    withdrawal; warm it before serving, as serve() does.
+    """
+
+    def __init__(self, pool, cache_size=10000, balance_ttl=None, retries=5, backoff=0.005, velocity=None):
+        self.pool = pool
+        self.retries = retries
+        self.backoff = backoff
+        self.velocity = velocity
+        self.account_ids = LRUCache(cache_size) if cache_size else None
+        self.balances = LRUCache(cache_size, ttl=balance_ttl) if cache_size else None
+
+    @classmethod
+    async def from_config(cls, db_config, pool_size=10, **kwargs):
+        """Open an aiomysql pool for the configured database"""
+        if aiomysql is None:
+            raise BankingError("The asyncio front end needs aiomysql: pip install aiomysql")
+        pool = await aiomysql.create_pool(
+            host=db_config['host'],
+            user=db_config['user'],
+            password=db_config['password'],
+            db=db_config['database'],
+            minsize=1,
+            maxsize=pool_size,
+            autocommit=False
+        )
+        return cls(pool, **kwargs)
+
+    async def close(self):
+        """Close all pooled connections"""
+        self.pool.close()
+        await self.pool.wait_closed()
+
+    async def run_transaction(self, work, commit=True):
+        """Run ``await work(cursor)`` in a transaction, retrying on lock conflicts
+
+        ``commit=False`` skips the COMMIT for work that ends its own
+        transaction, like the posting procedure.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.pool.acquire() as conn:
+                    try:
+                        async with conn.cursor() as cursor:
+                            result = await work(cursor)
+                        if commit:
+                            await conn.commit()
+                        return result
+                    except BaseException:
+                        await conn.rollback()
+                        raise
+            except aiomysql.Error as e:
+                if not is_retryable(e) or attempt >= self.retries:
+                    raise
+                await asyncio.sleep(retry_delay(attempt, self.backoff))
+                attempt += 1
+
+    async def _get_account_id(self, cursor, account_number):
+        """Look up the account ID through the cache"""
+        if self.account_ids is not None:
+            account_id = self.account_ids.get(account_number)
+            if account_id is not None:
+                return account_id
+        account_id = await run_plan_async(cursor, account_id_plan(account_number))
+        if self.account_ids is not None:
+            self.account_ids.set(account_number, account_id)
+        return account_id
+
+    def _invalidate_balance(self, account_number):
+        if self.balances is not None:
+            self.balances.invalidate(account_number)
+
+    async def deposit(self, account_number, amount, description=None, request_id=None):
+        """Deposit money into an account and return the new balance"""
+        amount = parse_amount(amount)
+
+        async def work(cursor):
+            account_id = await self._get_account_id(cursor, account_number)
+            return await run_plan_async(cursor, deposit_plan(account_id, account_number, amount, description,
+                                                             request_id))
+
+        try:
+            balance, transaction_id = await self.run_transaction(work, commit=False)
+        finally:
+            self._invalidate_balance(account_number)
+        return {'account_number': account_number, 'amount': amount, 'balance': balance,
+                'transaction_id': transaction_id}
+
+    async def withdraw(self, account_number, amount, description=None, request_id=None):
+        """Withdraw money from an account and return the new balance"""
+        amount = parse_amount(amount)
+
+        async def work(cursor):
+            account_id = await self._get_account_id(cursor, account_number)
+            # Reserved per attempt, so a retried transaction is counted once
+            hold = None
+            if self.velocity is not None:
+                hold = self.velocity.reserve(account_id, account_number, 'withdrawal', amount, request_id)
+            try:
+                return await run_plan_async(cursor, withdraw_plan(account_id, account_number, amount, description,
+                                                                  request_id))
+            except BaseException:
+                if hold is not None:
+                    self.velocity.release(hold)
+                raise
+
+        try:
+            balance, transaction_id = await self.run_transaction(work, commit=False)
+        finally:
+            self._invalidate_balance(account_number)
+        return {'account_number': account_number, 'amount': amount, 'balance': balance,
+                'transaction_id': transaction_id}
+
+    async def get_balance(self, account_number):
+        """Return account number, holder, status and balance"""
+        version = None
+        if self.balances is not None:
+            account = self.balances.get(account_number)
+            if account is not None:
+                return dict(account)
+            version = self.balances.version(account_number)
+
+        async def work(cursor):
+            return await run_plan_async(cursor, balance_plan(account_number))
+
+        account = await self.run_transaction(work)
+        if self.balances is not None:
+            self.balances.set(account_number, dict(account), version)
+        return account
+
+    async def get_transaction_page(self, account_number, after=None, limit=50,
+                                   start_date=None, end_date=None, transaction_types=None):
+        """Return one page of transactions, newest first (see BankingService)"""
+        async def work(cursor):
+            account_id, account_holder = await run_plan_async(cursor, account_holder_plan(account_number))
+            transactions = await run_plan_async(cursor, history_page_plan(
+                account_id, after, limit, start_date, end_date, transaction_types))
+            return account_holder, transactions
+
+        account_holder, transactions = await self.run_transaction(work)
+        return {
+            'account_number': account_number,
+            'account_holder': account_holder,
+            'transactions': transactions,
+            'next_cursor': next_page_cursor(transactions, limit)
+        }
+
+
+# ---------------------------------------------------------------------------
+# HTTP/JSON front end
+# ---------------------------------------------------------------------------
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 422: 'Unprocessable Entity', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+
+def _json_default(value):
+    if isinstance(value, Money):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _parse_after(value):
+    """Parse an ``after=<iso timestamp>,<transaction_id>`` page cursor"""
+    if not value:
+        return None
+    timestamp, _, transaction_id = value.rpartition(',')
+    return datetime.datetime.fromisoformat(timestamp), int(transaction_id)
+
+
+async def dispatch(service, method, target, body):
+    """Route one request and return (status, payload)
+
+    Routes:
+        GET  /accounts/<number>/balance
+        GET  /accounts/<number>/transactions?limit=50&after=<date>,<id>   (limit 1-1000)
+        POST /accounts/<number>/deposit   {"amount": "10.00", "description": "...", "request_id": "..."}
+        POST /accounts/<number>/withdraw  {"amount": "10.00", "description": "...", "request_id": "..."}
+
+    A POST repeated with the same ``request_id`` gets the original
+    response and is not applied twice. A withdrawal refused by a velocity
+    rule gets 429.
+    """
+    url = urlsplit(target)
+    parts = url.path.strip('/').split('/')
+    if len(parts) != 3 or parts[0] != 'accounts':
+        return 404, {'error': 'Unknown path'}
+    account_number, action = parts[1], parts[2]
+
+    try:
+        if action == 'balance' and method == 'GET':
+            return 200, await service.get_balance(account_number)
+        if action == 'transactions' and method == 'GET':
+            query = parse_qs(url.query)
+            limit = int(query.get('limit', ['50'])[0])
+            if not 1 <= limit <= 1000:
+                return 400, {'error': 'Limit must be between 1 and 1000'}
+            page = await service.get_transaction_page(
+                account_number,
+                after=_parse_after(query.get('after', [''])[0]),
+                limit=limit
+            )
+            if page['next_cursor']:
+                page['next_cursor'] = f"{page['next_cursor'][0].isoformat()},{page['next_cursor'][1]}"
+            return 200, page
+        if action in ('deposit', 'withdraw') and method == 'POST':
+            request = json.loads(body or b'{}')
+            if not isinstance(request, dict):
+                return 400, {'error': 'Request body must be a JSON object'}
+            operation = service.deposit if action == 'deposit' else service.withdraw
+            return 200, await operation(account_number, request.get('amount'), request.get('description'),
+                                        request.get('request_id'))
+        if action in ('balance', 'transactions', 'deposit', 'withdraw'):
+            return 405, {'error': 'Method not allowed'}
+        return 404, {'error': 'Unknown path'}
+    except AccountNotFoundError as e:
+        return 404, {'error': str(e)}
+    except InsufficientFundsError as e:
+        return 409, {'error': str(e), 'balance': e.balance}
+    except RequestKeyConflictError as e:
+        return 422, {'error': str(e)}
+    except VelocityLimitError as e:
+        return 429, {'error': str(e), 'rule': e.rule}
+    except (BankingError, ValueError) as e:
+        return 400, {'error': str(e)}
+
+
+async def handle_connection(service, reader, writer):
+    """Serve HTTP/1.1 requests on one keep-alive connection"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            except ValueError:
+                break
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                # The body cannot be found, so the connection cannot be reused
+                status, payload = 400, {'error': 'Invalid Content-Length'}
+                headers['connection'] = 'close'
+            else:
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, payload = await dispatch(service, method, target, body)
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+            data = json.dumps(payload, default=_json_default).encode()
+            writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                         f"Content-Type: application/json\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode('latin-1') + data)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(db_config, host='127.0.0.1', port=8080, pool_size=20):
+    """Run the HTTP/JSON front end until cancelled"""
+    velocity = None
+    rules = load_velocity_rules()
+    if rules:
+        velocity = VelocityGuard(rules)
+        backend = open_backend(db_config, pool_size=1)
+        try:
+            print(f"✓ Velocity limits warmed from {velocity.warm(backend)} recent postings")
+        finally:
+            backend.close()
+    service = await AsyncBankingService.from_config(db_config, pool_size=pool_size, velocity=velocity)
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    print(f"✓ Serving banking API on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+# ---------------------------------------------------------------------------
+# Load generator: asyncio path vs threaded sync path
+# ---------------------------------------------------------------------------
+
+def make_workload(account_numbers, operations, seed=42):
+    """Build a reproducible mix: 50% balance, 30% deposit, 20% withdrawal"""
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(operations):
+        roll = rng.random()
+        kind = 'balance' if roll < 0.5 else 'deposit' if roll < 0.8 else 'withdraw'
+        workload.append((kind, rng.choice(account_numbers), Money(rng.randint(1, 5000))))
+    return workload
+
+
+def summarise(name, latencies, elapsed):
+    """Return throughput and latency percentiles for one benchmark run"""
+    latencies.sort()
+    return {
+        'path': name,
+        'operations': len(latencies),
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def bench_sync(service, workload, concurrency):
+    """Run the workload on the threaded BankingService"""
+    operations = {'balance': lambda n, a: service.get_balance(n),
+                  'deposit': lambda n, a: service.deposit(n, a, "Benchmark"),
+                  'withdraw': lambda n, a: service.withdraw(n, a, "Benchmark")}
+
+    def run(item):
+        kind, account_number, amount = item
+        started = time.perf_counter()
+        try:
+            operations[kind](account_number, amount)
+        except InsufficientFundsError:
+            pass
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(run, workload))
+    return summarise('sync-threads', latencies, time.perf_counter() - started)
+
+
+async def bench_async(service, workload, concurrency):
+    """Run the workload on AsyncBankingService with ``concurrency`` tasks"""
+    operations = {'balance': lambda n, a: service.get_balance(n),
+                  'deposit': lambda n, a: service.deposit(n, a, "Benchmark"),
+                  'withdraw': lambda n, a: service.withdraw(n, a, "Benchmark")}
+    pending = iter(workload)
+    latencies = []
+
+    async def worker():
+        for kind, account_number, amount in pending:
+            started = time.perf_counter()
+            try:
+                await operations[kind](account_number, amount)
+            except InsufficientFundsError:
+                pass
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarise('asyncio', latencies, time.perf_counter() - started)
+
+
+def run_benchmark(db_config, accounts=100, operations=10000, concurrency=32):
+    """Seed accounts, then run the same workload on both paths"""
+    # Both sides must run on MySQL for the comparison to mean anything
+    sync_service = BankingService.from_config(dict(db_config, backend='mysql'), pool_size=concurrency)
+    try:
+        created = sync_service.create_accounts(
+            {'account_holder': f"Benchmark {i}", 'initial_deposit': 1000} for i in range(accounts))
+        account_numbers = [account['account_number'] for account in created]
+        workload = make_workload(account_numbers, operations)
+        sync_result = bench_sync(sync_service, workload, concurrency)
+    finally:
+        sync_service.close()
+
+    async def run_async():
+        service = await AsyncBankingService.from_config(db_config, pool_size=concurrency)
+        try:
+            return await bench_async(service, workload, concurrency)
+        finally:
+            await service.close()
+
+    return [sync_result, asyncio.run(run_async())]
+
+
+def main(argv=None):
+    """Command-line entry point for the asyncio front end"""
+    parser = argparse.ArgumentParser(description="asyncio banking front end")
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('serve', help="run the HTTP/JSON API")
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8080)
+    server.add_argument('--pool-size', type=int, default=20)
+    bench = commands.add_parser('bench', help="compare the asyncio and threaded paths")
+    bench.add_argument('--accounts', type=int, default=100)
+    bench.add_argument('--operations', type=int, default=10000)
+    bench.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    if aiomysql is None:
+        print("✗ The asyncio front end needs aiomysql: pip install aiomysql")
+        return 1
+
+    db_config = load_database_config()
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(db_config, args.host, args.port, args.pool_size))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    results = run_benchmark(db_config, args.accounts, args.operations, args.concurrency)
+    print(f"{'Path':<15} {'Ops':>8} {'Req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        print(f"{result['path']:<15} {result['operations']:>8} {result['requests_per_second']:>10.1f} "
+              f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
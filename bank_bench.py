@@ -0,0 +1,373 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bank_db import load_database_config
+from bank_import import BatchImporter
+from bank_metrics import Metrics
+from bank_money import Money
+from bank_service import BankingService, BankingError, InsufficientFundsError
+
+
+OPERATIONS = ('create', 'deposit', 'withdraw', 'transfer', 'balance', 'history')
+# Names the service's instrumentation records each benchmark operation under
+OPERATION_METRIC_NAMES = {'create': 'create_account', 'deposit': 'deposit', 'withdraw': 'withdraw',
+                          'transfer': 'transfer', 'balance': 'get_balance', 'history': 'get_transaction_page'}
+DEFAULT_MIX = {'create': 2, 'deposit': 25, 'withdraw': 15, 'transfer': 10, 'balance': 40, 'history': 8}
+
+# Metrics compared by ``compare``: (key, True if higher is better)
+COMPARED_METRICS = (('ops_per_second', True), ('p50_ms', False), ('p95_ms', False), ('p99_ms', False))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def parse_mix(text):
+    """Parse ``deposit=30,balance=50,...`` into operation weights"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {name}: {weight!r}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("at least one operation needs a positive weight")
+    return mix
+
+
+class HotspotChooser:
+    """Pick accounts so that a few hot accounts get most of the traffic
+
+    ``hot_share`` of all picks go to the first ``hot_fraction`` of the
+    accounts and the rest are spread uniformly over the others, which is
+    close enough to real payment traffic to expose lock contention.
+    """
+
+    def __init__(self, account_numbers, rng, hot_fraction=0.01, hot_share=0.5):
+        self.rng = rng
+        self.count = len(account_numbers)
+        hot_count = max(1, int(len(account_numbers) * hot_fraction))
+        self.hot = account_numbers[:hot_count]
+        self.cold = account_numbers[hot_count:] or self.hot
+        self.hot_share = hot_share
+
+    def pick(self):
+        if self.rng.random() < self.hot_share:
+            return self.rng.choice(self.hot)
+        return self.rng.choice(self.cold)
+
+    def pick_pair(self):
+        """Pick two different accounts, for transfers"""
+        source = self.pick()
+        while True:
+            target = self.pick()
+            if target != source or self.count < 2:
+                return source, target
+
+
+def random_amount(rng, low=100, high=50000):
+    return Money(rng.randint(low, high))
+
+
+def seed_accounts(service, count, initial_deposit=10000):
+    """Create ``count`` benchmark accounts and return their numbers"""
+    created = service.create_accounts(
+        {'account_holder': f"Benchmark {i}", 'initial_deposit': initial_deposit} for i in range(count))
+    return [account['account_number'] for account in created]
+
+
+def seed_transactions(service, chooser, count, rng, chunk_size=5000):
+    """Post ``count`` historical deposits and withdrawals with the chooser's skew
+
+    On MySQL the rows go through the bulk importer; other backends post
+    them one at a time through the service.
+    """
+    def rows():
+        for _ in range(count):
+            kind = 'deposit' if rng.random() < 0.6 else 'withdrawal'
+            yield {'account_number': chooser.pick(), 'transaction_type': kind,
+                   'amount': random_amount(rng), 'description': "Benchmark seed"}
+
+    if service.pool is not None:
+        return BatchImporter(service.pool, chunk_size=chunk_size).run(rows(), on_error=lambda error: None).rows_posted
+
+    posted = 0
+    for row in rows():
+        operation = service.deposit if row['transaction_type'] == 'deposit' else service.withdraw
+        try:
+            operation(row['account_number'], row['amount'], row['description'])
+            posted += 1
+        except InsufficientFundsError:
+            pass
+    return posted
+
+
+def make_workload(chooser, operations, mix, rng):
+    """Build a reproducible list of (operation, args) from weighted ``mix``"""
+    names = [name for name in OPERATIONS if mix.get(name, 0) > 0]
+    weights = [mix[name] for name in names]
+    workload = []
+    for index, name in enumerate(rng.choices(names, weights, k=operations)):
+        if name == 'create':
+            args = (f"Load test {index}", random_amount(rng))
+        elif name in ('deposit', 'withdraw'):
+            args = (chooser.pick(), random_amount(rng))
+        elif name == 'transfer':
+            args = chooser.pick_pair() + (random_amount(rng),)
+        else:
+            args = (chooser.pick(),)
+        workload.append((name, args))
+    return workload
+
+
+def operation_table(service, history_limit=50):
+    """Map operation names to callables on the service"""
+    return {
+        'create': lambda holder, deposit: service.create_account(holder, deposit),
+        'deposit': lambda number, amount: service.deposit(number, amount, "Benchmark"),
+        'withdraw': lambda number, amount: service.withdraw(number, amount, "Benchmark"),
+        'transfer': lambda source, target, amount: service.transfer(source, target, amount, "Benchmark"),
+        'balance': lambda number: service.get_balance(number),
+        'history': lambda number: service.get_transaction_page(number, limit=history_limit)
+    }
+
+
+def run_workload(service, workload, concurrency):
+    """Run the workload on ``concurrency`` threads and time every operation
+
+    Returns per-operation latency lists plus rejected (insufficient
+    funds) and error counts, and the wall-clock time of the run.
+    """
+    operations = operation_table(service)
+    pending = iter(workload)
+    lock = threading.Lock()
+    samples = []
+
+    def worker():
+        latencies = {name: [] for name in OPERATIONS}
+        rejected = dict.fromkeys(OPERATIONS, 0)
+        errors = dict.fromkeys(OPERATIONS, 0)
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            name, args = item
+            started = time.perf_counter()
+            try:
+                operations[name](*args)
+            except InsufficientFundsError:
+                rejected[name] += 1
+            except Exception:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - started)
+        with lock:
+            samples.append((latencies, rejected, errors))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    latencies = {name: [] for name in OPERATIONS}
+    rejected = dict.fromkeys(OPERATIONS, 0)
+    errors = dict.fromkeys(OPERATIONS, 0)
+    for worker_latencies, worker_rejected, worker_errors in samples:
+        for name in OPERATIONS:
+            latencies[name].extend(worker_latencies[name])
+            rejected[name] += worker_rejected[name]
+            errors[name] += worker_errors[name]
+    return latencies, rejected, errors, elapsed
+
+
+def summarise(latencies, rejected, errors, elapsed):
+    """Return throughput and latency percentiles per operation and overall"""
+    def stats(values, rejected_count, error_count):
+        values.sort()
+        return {
+            'count': len(values),
+            'rejected': rejected_count,
+            'errors': error_count,
+            'ops_per_second': len(values) / elapsed if elapsed else 0.0,
+            'mean_ms': sum(values) / len(values) * 1000 if values else 0.0,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000 if values else 0.0
+        }
+
+    operations = {name: stats(latencies[name], rejected[name], errors[name])
+                  for name in OPERATIONS if latencies[name]}
+    everything = [value for name in OPERATIONS for value in latencies[name]]
+    return {
+        'elapsed_seconds': elapsed,
+        'overall': stats(everything, sum(rejected.values()), sum(errors.values())),
+        'operations': operations
+    }
+
+
+def run_benchmark(service, accounts=1000, transactions=10000, operations=10000, concurrency=16,
+                  mix=None, hot_fraction=0.01, hot_share=0.5, seed=42):
+    """Seed a dataset, run a mixed workload and return the report"""
+    rng = random.Random(seed)
+    seed_started = time.perf_counter()
+    account_numbers = seed_accounts(service, accounts)
+    chooser = HotspotChooser(account_numbers, rng, hot_fraction, hot_share)
+    seeded = seed_transactions(service, chooser, transactions, rng)
+    seed_seconds = time.perf_counter() - seed_started
+
+    workload = make_workload(chooser, operations, mix or DEFAULT_MIX, rng)
+    if service.metrics is not None:
+        service.metrics.reset()
+    report = summarise(*run_workload(service, workload, concurrency))
+    if service.metrics is not None:
+        add_database_breakdown(report, service.metrics)
+    report['config'] = {
+        'backend': service.backend.name,
+        'accounts': accounts,
+        'seed_transactions': seeded,
+        'operations': operations,
+        'concurrency': concurrency,
+        'group_commit': service.group_commit is not None,
+        'mix': mix or DEFAULT_MIX,
+        'hot_fraction': hot_fraction,
+        'hot_share': hot_share,
+        'seed': seed
+    }
+    report['seed_seconds'] = seed_seconds
+    report['environment'] = {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform()
+    }
+    return report
+
+
+def add_database_breakdown(report, metrics):
+    """Add average round trips, rows and DB time per call from instrumentation"""
+    for name, result in report['operations'].items():
+        labels = (('operation', OPERATION_METRIC_NAMES[name]),)
+        calls = result['count'] or 1
+        result['round_trips_per_op'] = metrics.counter('bank_operation_round_trips_total', labels) / calls
+        result['rows_per_op'] = metrics.counter('bank_operation_rows_fetched_total', labels) / calls
+        result['db_ms_per_op'] = metrics.counter('bank_operation_db_seconds_total', labels) / calls * 1000
+        result['python_ms_per_op'] = metrics.counter('bank_operation_python_seconds_total', labels) / calls * 1000
+
+
+def compare(baseline, current, tolerance=0.10):
+    """List metrics that regressed by more than ``tolerance`` (a fraction)"""
+    regressions = []
+    for name, result in current['operations'].items():
+        before = baseline.get('operations', {}).get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = before[metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'Operation':<10} {'Count':>8} {'Ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Errors':>7}"
+          f" {'Trips':>6} {'DB ms':>7}")
+    print("-" * 83)
+    rows = list(report['operations'].items()) + [('overall', report['overall'])]
+    for name, result in rows:
+        breakdown = ""
+        if 'round_trips_per_op' in result:
+            breakdown = f" {result['round_trips_per_op']:>6.1f} {result['db_ms_per_op']:>7.2f}"
+        print(f"{name:<10} {result['count']:>8} {result['ops_per_second']:>10.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7}{breakdown}")
+
+
+def main(argv=None):
+    """Command-line entry point for benchmarks and regression checks"""
+    parser = argparse.ArgumentParser(description="Benchmark the banking operations under a mixed workload")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="seed a dataset and run a mixed workload")
+    run.add_argument('--backend', choices=('mysql', 'sqlite', 'memory'),
+                     help="storage backend (default: DB_BACKEND)")
+    run.add_argument('--accounts', type=int, default=1000)
+    run.add_argument('--transactions', type=int, default=10000, help="historical transactions to seed")
+    run.add_argument('--operations', type=int, default=10000, help="operations in the timed workload")
+    run.add_argument('--concurrency', type=int, default=16)
+    run.add_argument('--mix', type=parse_mix, help="operation weights, e.g. deposit=30,balance=60,history=10")
+    run.add_argument('--hot-fraction', type=float, default=0.01, help="fraction of accounts that are hot")
+    run.add_argument('--hot-share', type=float, default=0.5, help="share of operations hitting hot accounts")
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--group-commit', action='store_true',
+                     help="coalesce concurrent deposits and withdrawals into shared commits")
+    run.add_argument('--metrics', action='store_true',
+                     help="instrument the run and report round trips and DB time per operation")
+    run.add_argument('--output', help="write the JSON report to this file")
+    run.add_argument('--baseline', help="compare against a previous JSON report")
+    run.add_argument('--tolerance', type=float, default=0.10, help="allowed regression (default 0.10)")
+    check = commands.add_parser('compare', help="compare two JSON reports")
+    check.add_argument('baseline')
+    check.add_argument('current')
+    check.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+    else:
+        db_config = load_database_config()
+        if args.backend:
+            db_config['backend'] = args.backend
+        service = BankingService.from_config(db_config, pool_size=args.concurrency,
+                                             metrics=Metrics() if args.metrics else None,
+                                             group_commit=args.group_commit)
+        try:
+            service.backend.setup()
+            current = run_benchmark(service, args.accounts, args.transactions, args.operations, args.concurrency,
+                                    args.mix, args.hot_fraction, args.hot_share, args.seed)
+        except BankingError as e:
+            print(f"✗ {e}")
+            return 1
+        finally:
+            service.close()
+        print_report(current)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+            print(f"\n✓ Report written to {args.output}")
+        if not args.baseline:
+            return 0
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    regressions = compare(baseline, current, args.tolerance)
+    if regressions:
+        print("\n✗ Regressions beyond tolerance:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+    print("\n✓ No regressions beyond tolerance")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import argparse
+import datetime
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from bank_config import load_database_config
+from bank_errors import BankingError
+
+
+# BankingService methods the broker runs on behalf of its clients
+OPERATIONS = frozenset(('create_account', 'deposit', 'withdraw', 'transfer', 'get_balance',
+                        'get_transaction_history', 'get_all_accounts', 'purge_request_keys'))
+
+
+def default_socket_path():
+    """Return $BANK_BROKER_SOCKET or a per-user socket in the temp directory"""
+    path = os.getenv('BANK_BROKER_SOCKET')
+    if path:
+        return path
+    directory = os.getenv('XDG_RUNTIME_DIR') or os.getenv('TMPDIR') or '/tmp'
+    return os.path.join(directory, f"bank-broker-{os.getuid()}.sock")
+
+
+def database_identity(db_config):
+    """Return what identifies the database a resolved config connects to
+
+    Two configs with the same identity reach the same data, whichever
+    file and environment variables they came from. The password is left
+    out, since the identity is shown in the broker's status.
+    """
+    if db_config['backend'] == 'mysql':
+        return {'backend': 'mysql', 'host': db_config['host'], 'user': db_config['user'],
+                'database': db_config['database']}
+    return {'backend': db_config['backend'], 'path': os.path.abspath(db_config['path'])}
+
+
+def encode(value):
+    """JSON fallback: Money as its decimal string, dates as ISO text"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def to_plain(result):
+    """Convert a service result to what a broker client would receive"""
+    return json.loads(json.dumps(result, default=encode))
+
+
+class BrokerError(BankingError):
+    """An operation failed inside the broker; ``kind`` is the original exception type"""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class BrokerUnavailable(Exception):
+    """Raised when the broker socket cannot be connected to
+
+    Nothing listening, a socket owned by someone else and a broker too
+    busy to accept within the timeout all mean the same to a client: run
+    the operation some other way.
+    """
+
+
+class BrokerClient:
+    """Send one operation at a time to a running broker over its Unix socket
+
+    Importing and using the client needs only the standard library, so a
+    script talking to a warm broker never loads the database driver.
+    """
+
+    def __init__(self, path=None, timeout=30):
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+
+    def call(self, operation, *args, **kwargs):
+        """Run ``operation`` in the broker and return its JSON-decoded result"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                raise BrokerUnavailable(f"No broker reachable on {self.path}: {e}") from e
+            sock.sendall(json.dumps({'op': operation, 'args': args, 'kwargs': kwargs}).encode('utf-8') + b"\n")
+            with sock.makefile('rb') as f:
+                line = f.readline()
+        finally:
+            sock.close()
+        if not line:
+            raise BrokerError('ConnectionError', "The broker closed the connection")
+        response = json.loads(line)
+        if not response['ok']:
+            raise BrokerError(response['error'], response['message'])
+        return response['result']
+
+    def close(self):
+        pass
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    """Answer newline-delimited JSON requests on one client connection"""
+
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.dispatch(line)
+            self.wfile.write(json.dumps(response, default=encode).encode('utf-8') + b"\n")
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-lived local process holding a warm BankingService
+
+    Scripted invocations hand their operation to the broker instead of
+    importing the driver, connecting and resolving account IDs
+    themselves. The broker keeps the connection pool and lookup caches
+    warm between calls. The socket is created owner-only, and the broker
+    exits after ``idle_timeout`` seconds without requests (0 keeps it
+    running).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, service, idle_timeout=600, database=None):
+        self.service = service
+        self.database = database
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        self.requests = 0
+        super().__init__(path, BrokerHandler)
+        if idle_timeout:
+            threading.Thread(target=self._watch_idle, name='broker-idle', daemon=True).start()
+
+    def server_bind(self):
+        # Only the owner may connect: the broker can move money
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def _watch_idle(self):
+        while time.monotonic() - self.last_request < self.idle_timeout:
+            time.sleep(min(self.idle_timeout, 1))
+        self.shutdown()
+
+    def status(self):
+        return {'pid': os.getpid(), 'backend': self.service.backend.name, 'database': self.database,
+                'requests': self.requests, 'uptime_seconds': round(time.time() - self.started, 1)}
+
+    def dispatch(self, line):
+        """Run one request and return its response message"""
+        self.last_request = time.monotonic()
+        try:
+            request = json.loads(line)
+            operation = request.get('op')
+            if operation == 'ping':
+                result = self.status()
+            elif operation == 'shutdown':
+                threading.Thread(target=self.shutdown, daemon=True).start()
+                result = self.status()
+            elif operation in OPERATIONS:
+                result = getattr(self.service, operation)(*request.get('args', ()), **request.get('kwargs', {}))
+            else:
+                raise BankingError(f"Unknown operation: {operation!r}")
+        except Exception as e:
+            return {'ok': False, 'error': type(e).__name__, 'message': str(e)}
+        self.requests += 1
+        return {'ok': True, 'result': result}
+
+
+def serve(path=None, idle_timeout=600, pool_size=4, config_file=None):
+    """Run a broker in this process until it is stopped or goes idle"""
+    from bank_metrics import Metrics
+    from bank_service import BankingService
+    from bank_velocity import load_velocity_rules
+
+    path = path or default_socket_path()
+    if os.path.exists(path):
+        try:
+            BrokerClient(path, timeout=2).call('ping')
+        except BrokerUnavailable as e:
+            if not isinstance(e.__cause__, ConnectionRefusedError):
+                raise BankingError(str(e)) from e
+            os.unlink(path)  # left behind by a broker that crashed
+        else:
+            raise BankingError(f"A broker is already listening on {path}")
+
+    metrics = Metrics.from_env()
+    if metrics:
+        metrics.start_exporters()
+    db_config = load_database_config(config_file)
+    service = BankingService.from_config(db_config, pool_size=pool_size, metrics=metrics,
+                                         velocity=load_velocity_rules(config_file))
+    server = BrokerServer(path, service, idle_timeout, database_identity(db_config))
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+        service.close()
+
+
+def start_broker(path=None, idle_timeout=600, pool_size=4, config_file=None, wait=10):
+    """Start a detached broker process and return its status once it answers"""
+    import subprocess
+
+    path = path or default_socket_path()
+    args = [sys.executable, os.path.abspath(__file__), '--socket', path,
+            '--idle-timeout', str(idle_timeout), '--pool-size', str(pool_size)]
+    if config_file:
+        args += ['--config', os.path.abspath(config_file)]
+    with open(path + '.log', 'ab') as log:
+        process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log,
+                                   start_new_session=True)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise BankingError(f"The broker exited with status {process.returncode}; see {path}.log")
+        try:
+            return BrokerClient(path, timeout=2).call('ping')
+        except BrokerUnavailable:
+            time.sleep(0.05)
+    raise BankingError(f"The broker did not answer within {wait}s; see {path}.log")
+
+
+def main(argv=None):
+    """Command-line entry point that runs a broker in the foreground"""
+    parser = argparse.ArgumentParser(description="Local connection broker for scripted banking commands")
+    parser.add_argument('--socket', help="Unix socket path (default $BANK_BROKER_SOCKET or a per-user temp path)")
+    parser.add_argument('--idle-timeout', type=float, default=600,
+                        help="exit after this many idle seconds; 0 runs until stopped (default 600)")
+    parser.add_argument('--pool-size', type=int, default=4, help="database connections to keep open")
+    parser.add_argument('--config', help="config file (default $BANK_CONFIG or ./bank.ini)")
+    args = parser.parse_args(argv)
+
+    try:
+        serve(args.socket, args.idle_timeout, args.pool_size, args.config)
+    except BankingError as e:
+        print(f"✗ {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
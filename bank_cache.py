@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with optional TTL
+
+    Every key carries a version that invalidate() bumps. A reader takes the
+    version before it queries the database and passes it to set(); if a
+    writer invalidated the key in between, the stale value is dropped
+    instead of cached.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value, or ``default`` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not _MISSING:
+                if entry[2] is None or entry[2] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                entry[0] = _MISSING
+            self.misses += 1
+            return default
+
+    def version(self, key):
+        """Return the key's current version, to pass to set()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else 0
+
+    def set(self, key, value, version=None):
+        """Cache a value unless the key was invalidated since ``version``"""
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            entry = self._entries.get(key)
+            current = entry[1] if entry is not None else 0
+            if version is not None and version != current:
+                return False
+            self._entries[key] = [value, current, expires]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        """Drop a cached value and make in-flight set() calls for it fail"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Keep a placeholder so the bumped version is remembered;
+                # it ages out of the LRU order like any other entry
+                self._entries[key] = [_MISSING, 1, None]
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            else:
+                entry[0] = _MISSING
+                entry[1] += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import sys
+
+from bank_broker import (BrokerClient, BrokerError, BrokerUnavailable, database_identity, default_socket_path,
+                         start_broker, to_plain)
+from bank_config import load_database_config
+from bank_errors import BankingError
+
+
+# Operations velocity rules apply to; only these warm the rules in process
+VELOCITY_OPERATIONS = frozenset(('withdraw', 'transfer'))
+
+
+class LocalClient:
+    """Run operations in this process, with the same interface as BrokerClient
+
+    The service (and with it the database driver) is only imported on the
+    first call, and its results are converted exactly as the broker would
+    send them, so output does not depend on where an operation ran. With
+    velocity rules configured, an in-process withdraw or transfer first
+    warms them from the ledger; a broker does that once.
+    """
+
+    def __init__(self, config_file=None):
+        self.config_file = config_file
+        self.service = None
+        self.velocity_loaded = False
+
+    def call(self, operation, *args, **kwargs):
+        if self.service is None:
+            from bank_service import BankingService
+            # One command needs one connection
+            self.service = BankingService.from_config(load_database_config(self.config_file), pool_size=1)
+        if operation in VELOCITY_OPERATIONS and not self.velocity_loaded:
+            from bank_velocity import VelocityGuard, load_velocity_rules
+            rules = load_velocity_rules(self.config_file)
+            if rules:
+                self.service.velocity = VelocityGuard(rules)
+                self.service.velocity.warm(self.service.backend)
+            self.velocity_loaded = True
+        return to_plain(getattr(self.service, operation)(*args, **kwargs))
+
+    def close(self):
+        if self.service is not None:
+            self.service.close()
+
+
+def connect(mode, config_file=None, socket_path=None):
+    """Return a client for ``mode``: 'auto', 'on' (start a broker if needed) or 'off'
+
+    A running broker is only used when it is connected to the database
+    this command's config file and environment resolve to. Otherwise the
+    command would silently post to another database.
+    """
+    if mode == 'off':
+        return LocalClient(config_file)
+    client = BrokerClient(socket_path)
+    if os.path.exists(client.path):
+        try:
+            status = client.call('ping')
+        except BrokerUnavailable:
+            pass
+        else:
+            if status.get('database') == database_identity(load_database_config(config_file)):
+                return client
+            return LocalClient(config_file)
+    if mode == 'on':
+        start_broker(client.path, config_file=config_file)
+        return client
+    return LocalClient(config_file)
+
+
+def setup(config_file=None):
+    """Create the database if needed and apply pending migrations"""
+    from bank_storage import open_backend
+
+    db_config = load_database_config(config_file)
+    if db_config['backend'] == 'mysql':
+        from bank_db import create_database
+        create_database(db_config)
+    backend = open_backend(db_config, pool_size=1)
+    try:
+        backend.setup()
+    finally:
+        backend.close()
+    return db_config['backend']
+
+
+def _print_transactions(history):
+    for trans in history['transactions']:
+        print(f"  {trans['transaction_date'][:19].replace('T', ' ')}  {trans['transaction_type'].upper():<16} "
+              f"${trans['amount']:>12}  {trans['description'] or ''}")
+    print(f"  Total Deposits: ${history['total_deposits']}  Total Withdrawals: ${history['total_withdrawals']}")
+
+
+def run_command(client, args):
+    """Run one banking subcommand and return (result, human-readable printer)"""
+    if args.command == 'create':
+        result = client.call('create_account', args.holder, args.deposit, args.email, args.phone, args.address)
+        return result, lambda r: print(f"✓ Account {r['account_number']} opened for {r['account_holder']}, "
+                                       f"balance ${r['balance']}")
+    if args.command in ('deposit', 'withdraw'):
+        result = client.call(args.command, args.account, args.amount, args.description, args.request_id)
+        verb = 'Deposited' if args.command == 'deposit' else 'Withdrew'
+        return result, lambda r: print(f"✓ {verb} ${r['amount']}, new balance ${r['balance']}")
+    if args.command == 'transfer':
+        result = client.call('transfer', args.from_account, args.to_account, args.amount, args.description)
+        return result, lambda r: print(f"✓ Transferred ${r['amount']}: {r['from_account_number']} "
+                                       f"${r['from_balance']}, {r['to_account_number']} ${r['to_balance']}")
+    if args.command == 'balance':
+        result = client.call('get_balance', args.account)
+        return result, lambda r: print(f"{r['account_number']} ({r['account_holder']}): ${r['balance']}")
+    if args.command == 'history':
+        result = client.call('get_transaction_history', args.account, args.limit, args.include_archived)
+        return result, _print_transactions
+    if args.command == 'purge-keys':
+        result = client.call('purge_request_keys', args.retention)
+        return result, lambda r: print(f"✓ {r} expired request IDs removed")
+    result = client.call('get_all_accounts')
+
+    def print_accounts(r):
+        for account in r['accounts']:
+            print(f"  {account['account_number']:<14} {account['account_holder']:<30} ${account['balance']:>12}")
+        print(f"  Total Bank Balance: ${r['total_balance']}")
+    return result, print_accounts
+
+
+def describe_database(identity):
+    """Short description of a database identity for status output"""
+    if not identity:
+        return 'unknown database'
+    if identity['backend'] == 'mysql':
+        return f"{identity['user']}@{identity['host']}/{identity['database']}"
+    return identity['path']
+
+
+def broker_command(args):
+    """Start, stop or inspect the local broker"""
+    path = args.socket or default_socket_path()
+    client = BrokerClient(path)
+    try:
+        status = client.call('ping')
+    except BrokerUnavailable:
+        status = None
+    if args.action == 'start':
+        if status is None:
+            status = start_broker(path, args.idle_timeout, config_file=args.config)
+            print(f"✓ Broker started on {path} (pid {status['pid']}, {status['backend']})")
+        else:
+            print(f"✓ Broker already running on {path} (pid {status['pid']})")
+    elif args.action == 'stop':
+        if status is None:
+            print(f"✗ No broker running on {path}")
+            return 1
+        client.call('shutdown')
+        print(f"✓ Broker stopped after {status['requests']} requests")
+    elif status is None:
+        print(f"✗ No broker running on {path}")
+        return 1
+    else:
+        print(f"✓ Broker on {path}: pid {status['pid']}, {status['backend']}, "
+              f"{describe_database(status.get('database'))}, "
+              f"{status['requests']} requests, up {status['uptime_seconds']}s")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='bank', description="Scriptable banking commands")
+    parser.add_argument('--config', help="config file (default $BANK_CONFIG or ./bank.ini)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    parser.add_argument('--broker', choices=['auto', 'on', 'off'], default=os.getenv('BANK_BROKER', 'auto'),
+                        help="auto: use a running broker; on: start one if needed; off: always run in process")
+    parser.add_argument('--socket', help="broker socket (default $BANK_BROKER_SOCKET or a per-user temp path)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help="open an account")
+    create.add_argument('holder')
+    create.add_argument('--deposit', default='0', help="initial deposit")
+    create.add_argument('--email', default='')
+    create.add_argument('--phone', default='')
+    create.add_argument('--address', default='')
+    for name in ('deposit', 'withdraw'):
+        command = commands.add_parser(name, help=f"{name} money")
+        command.add_argument('account')
+        command.add_argument('amount')
+        command.add_argument('-d', '--description')
+        command.add_argument('--request-id', help="client-chosen ID; repeating it never posts twice")
+    transfer = commands.add_parser('transfer', help="move money between accounts")
+    transfer.add_argument('from_account')
+    transfer.add_argument('to_account')
+    transfer.add_argument('amount')
+    transfer.add_argument('-d', '--description')
+    balance = commands.add_parser('balance', help="show an account's balance")
+    balance.add_argument('account')
+    history = commands.add_parser('history', help="show recent transactions")
+    history.add_argument('account')
+    history.add_argument('--limit', type=int, default=10)
+    history.add_argument('--include-archived', action='store_true')
+    commands.add_parser('accounts', help="list all accounts")
+    commands.add_parser('setup', help="create the database and apply migrations")
+    purge = commands.add_parser('purge-keys', help="forget expired request IDs (run periodically)")
+    purge.add_argument('--retention', type=int, default=24 * 3600,
+                       help="seconds a request ID is remembered (default 86400)")
+    broker = commands.add_parser('broker', help="manage the local connection broker")
+    broker.add_argument('action', choices=['start', 'stop', 'status'])
+    broker.add_argument('--idle-timeout', type=float, default=600,
+                        help="seconds without requests before the broker exits; 0 never (default 600)")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point for scripted banking operations"""
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == 'setup':
+            print(f"✓ Schema ready ({setup(args.config)})")
+            return 0
+        if args.command == 'broker':
+            return broker_command(args)
+
+        client = connect(args.broker, args.config, args.socket)
+        try:
+            result, show = run_command(client, args)
+        finally:
+            client.close()
+    except (BankingError, BrokerUnavailable, FileNotFoundError) as e:
+        if args.json:
+            kind = e.kind if isinstance(e, BrokerError) else type(e).__name__
+            print(json.dumps({'error': kind, 'message': str(e)}))
+        else:
+            print(f"✗ {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        show(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import configparser
+import os
+
+
+# Each setting, the environment variable that overrides it and its default
+SETTINGS = {
+    'backend': ('DB_BACKEND', 'mysql'),
+    'path': ('DB_PATH', 'banking_system.db'),
+    'host': ('DB_HOST', 'localhost'),
+    'user': ('DB_USER', 'root'),
+    'password': ('DB_PASSWORD', ''),
+    'database': ('DB_NAME', 'banking_system'),
+}
+
+DEFAULT_CONFIG_FILE = 'bank.ini'
+
+
+def config_file_path(path=None):
+    """Return the config file to read: ``path``, $BANK_CONFIG or ./bank.ini if present"""
+    path = path or os.getenv('BANK_CONFIG')
+    if path:
+        return path
+    return DEFAULT_CONFIG_FILE if os.path.exists(DEFAULT_CONFIG_FILE) else None
+
+
+def load_database_config(path=None):
+    """Read database configuration from a config file and environment variables
+
+    The file is INI with a ``[database]`` section using the keys of the
+    returned dict (backend, path, host, user, password, database).
+    Environment variables (DB_BACKEND, DB_HOST, ...) override the file.
+    This module imports nothing heavy, so scripts can read their settings
+    before deciding whether to load a database driver at all.
+    """
+    file_settings = {}
+    path = config_file_path(path)
+    if path:
+        parser = configparser.ConfigParser(interpolation=None)
+        if not parser.read(path, encoding='utf-8'):
+            raise FileNotFoundError(f"Config file not found: {path}")
+        if parser.has_section('database'):
+            file_settings = dict(parser['database'])
+
+    return {key: os.getenv(variable, file_settings.get(key, default))
+            for key, (variable, default) in SETTINGS.items()}
@@ -0,0 +1,664 @@
+import argparse
+import datetime
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error, errorcode
+
+from bank_config import load_database_config
+from bank_metrics import InstrumentedConnection
+
+
+# Errors after which InnoDB has rolled the statement or transaction back
+# and the whole unit of work can simply be run again
+RETRYABLE_ERRORS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+
+def is_retryable(error):
+    """Check whether a database error is a deadlock or lock-wait timeout"""
+    errno = getattr(error, 'errno', None)
+    if errno is None and error.args:
+        # PyMySQL (used by the asyncio driver) carries the code as args[0]
+        errno = error.args[0]
+    return errno in RETRYABLE_ERRORS
+
+
+def retry_delay(attempt, backoff):
+    """Jittered exponential backoff before retry number ``attempt + 1``"""
+    return backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def create_database(db_config):
+    """Create the configured database if it doesn't exist"""
+    conn = mysql.connector.connect(
+        host=db_config['host'],
+        user=db_config['user'],
+        password=db_config['password']
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_config['database']}")
+        cursor.close()
+    finally:
+        conn.close()
+
+
+# Transactions are range-partitioned by month; bank_archive keeps this many
+# empty partitions ready ahead of the current month
+PARTITION_MONTHS_AHEAD = 3
+
+
+def month_start(value):
+    """Return the first day of the month containing a date or datetime"""
+    return datetime.date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def add_months(month, count):
+    for _ in range(count):
+        month = next_month(month)
+    return month
+
+
+def partition_month(partition_name):
+    """Return the month held by a pYYYYMM partition, or None for p_future"""
+    if partition_name == 'p_future':
+        return None
+    return datetime.datetime.strptime(partition_name[1:], '%Y%m').date()
+
+
+def month_partitions(first, last):
+    """Partition clauses for each month from ``first`` to ``last``, plus p_future
+
+    Partition pYYYYMM holds rows dated before the first of the following
+    month; p_future catches anything beyond the last prepared month.
+    """
+    clauses = []
+    month = month_start(first)
+    while month <= last:
+        clauses.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN "
+                       f"(UNIX_TIMESTAMP('{next_month(month):%Y-%m-%d}'))")
+        month = next_month(month)
+    clauses.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    return clauses
+
+
+def _partition_transactions(cursor):
+    """Give transactions a BIGINT key and monthly range partitions
+
+    Partitioned InnoDB tables cannot have foreign keys, and every unique
+    key must contain the partitioning column. So the foreign key to
+    accounts is dropped (accounts are never deleted) and the primary key
+    becomes (transaction_id, transaction_date).
+    """
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'transactions'
+    """)
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE transactions DROP FOREIGN KEY `{name}`")
+    cursor.execute("""
+        ALTER TABLE transactions
+            MODIFY transaction_id BIGINT NOT NULL AUTO_INCREMENT,
+            MODIFY transaction_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (transaction_id, transaction_date)
+    """)
+    cursor.execute("SELECT MIN(transaction_date) FROM transactions")
+    today = datetime.date.today()
+    first = cursor.fetchone()[0] or today
+    last = add_months(month_start(today), PARTITION_MONTHS_AHEAD)
+    cursor.execute(f"""
+        ALTER TABLE transactions
+        PARTITION BY RANGE (UNIX_TIMESTAMP(transaction_date)) ({', '.join(month_partitions(first, last))})
+    """)
+
+
+# Versioned schema changes, applied in order by migrate(). Each step is a
+# list of SQL statements or callables taking a cursor. Never edit a step
+# that has shipped; add a new one instead.
+MIGRATIONS = [
+    (1, "Create accounts and transactions tables", [
+        """
+        CREATE TABLE IF NOT EXISTS accounts (
+            account_id INT AUTO_INCREMENT PRIMARY KEY,
+            account_number VARCHAR(20) UNIQUE NOT NULL,
+            account_holder VARCHAR(100) NOT NULL,
+            email VARCHAR(100),
+            phone VARCHAR(20),
+            address TEXT,
+            balance DECIMAL(15, 2) DEFAULT 0.00,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status ENUM('active', 'inactive', 'suspended') DEFAULT 'active'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id INT AUTO_INCREMENT PRIMARY KEY,
+            account_id INT NOT NULL,
+            transaction_type ENUM('deposit', 'withdrawal', 'transfer', 'account_creation') NOT NULL,
+            amount DECIMAL(15, 2) NOT NULL,
+            description VARCHAR(255),
+            transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    (2, "Index transaction history and account listing", [
+        "CREATE INDEX idx_transactions_account_date ON transactions (account_id, transaction_date, transaction_id)",
+        "CREATE INDEX idx_accounts_created_at ON accounts (created_at)",
+    ]),
+    (3, "Add block-reserved account number sequence", [
+        """
+        CREATE TABLE IF NOT EXISTS account_number_sequence (
+            sequence_id TINYINT PRIMARY KEY,
+            next_value BIGINT NOT NULL
+        )
+        """,
+        "INSERT IGNORE INTO account_number_sequence (sequence_id, next_value) VALUES (1, 100000000)",
+    ]),
+    (4, "Add daily balance snapshot tables", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_balances (
+            account_id INT NOT NULL,
+            balance_date DATE NOT NULL,
+            net_change DECIMAL(15, 2) NOT NULL DEFAULT 0.00,
+            deposits DECIMAL(15, 2) NOT NULL DEFAULT 0.00,
+            withdrawals DECIMAL(15, 2) NOT NULL DEFAULT 0.00,
+            transaction_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, balance_date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            balance_date DATE PRIMARY KEY,
+            net_change DECIMAL(18, 2) NOT NULL DEFAULT 0.00,
+            deposits DECIMAL(18, 2) NOT NULL DEFAULT 0.00,
+            withdrawals DECIMAL(18, 2) NOT NULL DEFAULT 0.00,
+            transaction_count INT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS snapshot_state (
+            snapshot_id TINYINT PRIMARY KEY,
+            last_transaction_id BIGINT NOT NULL
+        )
+        """,
+        "INSERT IGNORE INTO snapshot_state (snapshot_id, last_transaction_id) VALUES (1, 0)",
+    ]),
+    (5, "Add single-round-trip posting procedure", [
+        "DROP PROCEDURE IF EXISTS bank_post",
+        # Locks the account, checks funds, updates the balance, writes the
+        # ledger row and commits, then returns (status, balance in cents,
+        # transaction_id) so a posting costs one CALL and no client COMMIT
+        """
+        CREATE PROCEDURE bank_post(IN p_account_id INT, IN p_type VARCHAR(20), IN p_cents BIGINT,
+                                   IN p_description VARCHAR(255))
+        BEGIN
+            DECLARE v_balance BIGINT DEFAULT NULL;
+            DECLARE v_transaction_id BIGINT;
+            DECLARE EXIT HANDLER FOR SQLEXCEPTION
+            BEGIN
+                ROLLBACK;
+                RESIGNAL;
+            END;
+
+            START TRANSACTION;
+            SELECT CAST(balance * 100 AS SIGNED) INTO v_balance
+            FROM accounts
+            WHERE account_id = p_account_id
+            FOR UPDATE;
+
+            IF v_balance IS NULL THEN
+                ROLLBACK;
+                SELECT 'not_found', NULL, NULL;
+            ELSEIF p_type = 'withdrawal' AND v_balance < p_cents THEN
+                ROLLBACK;
+                SELECT 'insufficient_funds', v_balance, NULL;
+            ELSE
+                SET v_balance = v_balance + IF(p_type = 'withdrawal', -p_cents, p_cents);
+                UPDATE accounts SET balance = v_balance / 100 WHERE account_id = p_account_id;
+                INSERT INTO transactions (account_id, transaction_type, amount, description)
+                VALUES (p_account_id, p_type, p_cents / 100, p_description);
+                SET v_transaction_id = LAST_INSERT_ID();
+                COMMIT;
+                SELECT 'ok', v_balance, v_transaction_id;
+            END IF;
+        END
+        """,
+    ]),
+    (6, "Partition transactions by month and add archive tables", [
+        _partition_transactions,
+        # Closed months moved out of the hot table by bank_archive
+        """
+        CREATE TABLE IF NOT EXISTS transactions_archive (
+            transaction_id BIGINT PRIMARY KEY,
+            account_id INT NOT NULL,
+            transaction_type ENUM('deposit', 'withdrawal', 'transfer', 'account_creation') NOT NULL,
+            amount DECIMAL(15, 2) NOT NULL,
+            description VARCHAR(255),
+            transaction_date TIMESTAMP NOT NULL,
+            INDEX idx_archive_account_date (account_id, transaction_date, transaction_id)
+        ) ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transaction_archives (
+            partition_name VARCHAR(16) PRIMARY KEY,
+            period_end DATE NOT NULL,
+            location ENUM('table', 'file') NOT NULL,
+            path VARCHAR(255),
+            row_count BIGINT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (7, "Add idempotency keys for deposits and withdrawals", [
+        # One row per keyed posting: a 16-byte digest of the client's
+        # request ID, what was posted and its result. Kept apart from the
+        # partitioned ledger, whose unique keys must include the date, and
+        # purged by age (BankingService.purge_request_keys)
+        """
+        CREATE TABLE IF NOT EXISTS posting_requests (
+            request_key BINARY(16) PRIMARY KEY,
+            account_id INT NOT NULL,
+            transaction_type ENUM('deposit', 'withdrawal') NOT NULL,
+            amount_cents BIGINT NOT NULL,
+            balance_cents BIGINT NOT NULL,
+            transaction_id BIGINT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_posting_requests_created (created_at)
+        )
+        """,
+        "DROP PROCEDURE IF EXISTS bank_post",
+        # As in migration 5, plus an optional request key checked after the
+        # account lock is taken. Retries of one request therefore queue on
+        # that lock, and the key read sees the attempt that went first. A
+        # repeat returns the stored result instead of posting again
+        """
+        CREATE PROCEDURE bank_post(IN p_account_id INT, IN p_type VARCHAR(20), IN p_cents BIGINT,
+                                   IN p_description VARCHAR(255), IN p_request_key BINARY(16))
+        BEGIN
+            DECLARE v_balance BIGINT DEFAULT NULL;
+            DECLARE v_transaction_id BIGINT;
+            DECLARE v_seen_account_id INT DEFAULT NULL;
+            DECLARE v_seen_type VARCHAR(20);
+            DECLARE v_seen_cents BIGINT;
+            DECLARE v_seen_balance BIGINT;
+            DECLARE v_seen_transaction_id BIGINT;
+            DECLARE EXIT HANDLER FOR SQLEXCEPTION
+            BEGIN
+                ROLLBACK;
+                RESIGNAL;
+            END;
+
+            START TRANSACTION;
+            SELECT CAST(balance * 100 AS SIGNED) INTO v_balance
+            FROM accounts
+            WHERE account_id = p_account_id
+            FOR UPDATE;
+
+            IF p_request_key IS NOT NULL THEN
+                SELECT account_id, transaction_type, amount_cents, balance_cents, transaction_id
+                INTO v_seen_account_id, v_seen_type, v_seen_cents, v_seen_balance, v_seen_transaction_id
+                FROM posting_requests
+                WHERE request_key = p_request_key;
+            END IF;
+
+            IF v_seen_account_id IS NOT NULL THEN
+                ROLLBACK;
+                IF v_seen_account_id = p_account_id AND v_seen_type = p_type AND v_seen_cents = p_cents THEN
+                    SELECT 'duplicate', v_seen_balance, v_seen_transaction_id;
+                ELSE
+                    SELECT 'key_conflict', NULL, NULL;
+                END IF;
+            ELSEIF v_balance IS NULL THEN
+                ROLLBACK;
+                SELECT 'not_found', NULL, NULL;
+            ELSEIF p_type = 'withdrawal' AND v_balance < p_cents THEN
+                ROLLBACK;
+                SELECT 'insufficient_funds', v_balance, NULL;
+            ELSE
+                SET v_balance = v_balance + IF(p_type = 'withdrawal', -p_cents, p_cents);
+                UPDATE accounts SET balance = v_balance / 100 WHERE account_id = p_account_id;
+                INSERT INTO transactions (account_id, transaction_type, amount, description)
+                VALUES (p_account_id, p_type, p_cents / 100, p_description);
+                SET v_transaction_id = LAST_INSERT_ID();
+                IF p_request_key IS NOT NULL THEN
+                    INSERT INTO posting_requests
+                        (request_key, account_id, transaction_type, amount_cents, balance_cents, transaction_id)
+                    VALUES (p_request_key, p_account_id, p_type, p_cents, v_balance, v_transaction_id);
+                END IF;
+                COMMIT;
+                SELECT 'ok', v_balance, v_transaction_id;
+            END IF;
+        END
+        """,
+    ]),
+    (8, "Make the ledger append-only", [
+        # accounts.balance is a projection of the ledger that bank_ledger can
+        # rebuild, so ledger rows must never change once written. Dropping
+        # a partition (bank_archive) fires no triggers
+        """
+        CREATE TRIGGER transactions_no_update BEFORE UPDATE ON transactions FOR EACH ROW
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'The ledger is append-only'
+        """,
+        """
+        CREATE TRIGGER transactions_no_delete BEFORE DELETE ON transactions FOR EACH ROW
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'The ledger is append-only'
+        """,
+        """
+        CREATE TRIGGER transactions_archive_no_update BEFORE UPDATE ON transactions_archive FOR EACH ROW
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'The ledger is append-only'
+        """,
+        """
+        CREATE TRIGGER transactions_archive_no_delete BEFORE DELETE ON transactions_archive FOR EACH ROW
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'The ledger is append-only'
+        """,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    """Return the highest applied migration version (0 for a new database)"""
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def migrate(connection, target=None):
+    """Apply pending migrations and return the resulting schema version
+
+    A named lock keeps two processes from migrating the same database at
+    the same time.
+    """
+    target = SCHEMA_VERSION if target is None else target
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK('banking_schema_migration', 60)")
+        if cursor.fetchone()[0] != 1:
+            raise Error("Timed out waiting for another process to finish migrating")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            current = get_schema_version(cursor)
+            for version, description, steps in MIGRATIONS:
+                if version <= current or version > target:
+                    continue
+                # DDL commits implicitly in MySQL, so each step is recorded
+                # straight after its statements succeed
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                               (version, description))
+                connection.commit()
+                current = version
+            return current
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('banking_schema_migration')")
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def setup_schema(connection):
+    """Create tables if they don't exist and bring the schema up to date"""
+    return migrate(connection)
+
+
+# Hot queries and the index each must be served from. check_query_plans()
+# runs EXPLAIN on them so a schema change that reintroduces a full scan or
+# filesort is caught.
+HOT_QUERIES = {
+    'transaction_history': ("""
+        SELECT transaction_id, transaction_type, amount, description, transaction_date
+        FROM transactions
+        WHERE account_id = %s
+        ORDER BY transaction_date DESC, transaction_id DESC
+        LIMIT 10
+    """, (1,), 'transactions', 'idx_transactions_account_date'),
+    'transaction_history_page': ("""
+        SELECT transaction_id, transaction_type, amount, description, transaction_date
+        FROM transactions
+        WHERE account_id = %s
+          AND (transaction_date < %s OR (transaction_date = %s AND transaction_id < %s))
+        ORDER BY transaction_date DESC, transaction_id DESC
+        LIMIT 500
+    """, (1, '2038-01-01', '2038-01-01', 2 ** 63 - 1), 'transactions', 'idx_transactions_account_date'),
+    'archived_history_page': ("""
+        SELECT transaction_id, transaction_type, amount, description, transaction_date
+        FROM transactions_archive
+        WHERE account_id = %s
+          AND (transaction_date < %s OR (transaction_date = %s AND transaction_id < %s))
+        ORDER BY transaction_date DESC, transaction_id DESC
+        LIMIT 500
+    """, (1, '2038-01-01', '2038-01-01', 2 ** 63 - 1), 'transactions_archive', 'idx_archive_account_date'),
+    'all_accounts': ("""
+        SELECT account_number, account_holder, balance, status, created_at
+        FROM accounts
+        ORDER BY created_at DESC
+        LIMIT 100
+    """, (), 'accounts', 'idx_accounts_created_at'),
+    'request_key_purge': ("""
+        DELETE FROM posting_requests
+        WHERE created_at < NOW() - INTERVAL %s SECOND
+        LIMIT 10000
+    """, (86400,), 'posting_requests', 'idx_posting_requests_created'),
+}
+
+
+def check_query_plans(connection, queries=None):
+    """EXPLAIN each hot query and return a list of plan problems
+
+    An empty list means every query uses its expected index without a
+    filesort or temporary table. Run it against a database with realistic
+    data; the optimizer may pick a scan for near-empty tables.
+    """
+    problems = []
+    cursor = connection.cursor(dictionary=True)
+    try:
+        for name, (query, params, table, index) in (queries or HOT_QUERIES).items():
+            cursor.execute("EXPLAIN " + query, params)
+            for row in cursor.fetchall():
+                if row['table'] != table:
+                    continue
+                extra = row.get('Extra') or ''
+                if row['key'] != index:
+                    problems.append(f"{name}: uses index {row['key']!r} instead of {index!r}")
+                if 'Using filesort' in extra or 'Using temporary' in extra:
+                    problems.append(f"{name}: {extra}")
+    finally:
+        cursor.close()
+    return problems
+
+
+class PoolTimeoutError(Error):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of MySQL connections
+
+    Connections are opened lazily up to ``size``. When all of them are in
+    use, callers block until one is returned or ``timeout`` seconds pass.
+    With a ``metrics`` registry (see bank_metrics) every connection is
+    instrumented and checkout waits are timed.
+    """
+
+    def __init__(self, db_config, size=10, timeout=30, metrics=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_config = db_config
+        self.size = size
+        self.timeout = timeout
+        self.metrics = metrics
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _open(self):
+        """Open a new connection to the configured database"""
+        conn = mysql.connector.connect(
+            host=self.db_config['host'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            database=self.db_config['database'],
+            autocommit=False
+        )
+        if self.metrics is not None:
+            conn = InstrumentedConnection(conn, self.metrics)
+        return conn
+
+    def acquire(self, timeout=None):
+        """Take a connection from the pool, opening one if under the limit"""
+        if self.metrics is None:
+            return self._acquire(timeout)
+        started = time.perf_counter()
+        try:
+            return self._acquire(timeout)
+        finally:
+            self.metrics.observe('bank_pool_wait_seconds', time.perf_counter() - started)
+
+    def _acquire(self, timeout):
+        if self._closed:
+            raise Error("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        wait = self.timeout if timeout is None else timeout
+        try:
+            return self._idle.get(timeout=wait)
+        except queue.Empty:
+            raise PoolTimeoutError(f"No database connection available after {wait}s")
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is broken"""
+        if discard or self._closed:
+            self._discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    def _discard(self, conn):
+        """Close a connection and free its slot"""
+        try:
+            conn.close()
+        except Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    @contextmanager
+    def connection(self, commit=True):
+        """Borrow a connection for one unit of work
+
+        The work is committed on success and rolled back on error, so a
+        connection never goes back to the pool with an open transaction.
+        ``commit=False`` skips the COMMIT round trip for work that ends its
+        own transaction, such as a call to a procedure that commits.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+            if commit:
+                conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def run_transaction(self, work, retries=5, backoff=0.005, commit=True):
+        """Run ``work(conn)`` in a transaction, retrying on lock conflicts
+
+        Deadlocks and lock-wait timeouts are retried up to ``retries`` times
+        with jittered exponential backoff so that contending workers spread
+        out instead of colliding again. Any other error is raised as is.
+        ``commit`` is passed on to connection().
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.connection(commit=commit) as conn:
+                    return work(conn)
+            except Error as e:
+                if not is_retryable(e) or attempt >= retries:
+                    raise
+                time.sleep(retry_delay(attempt, backoff))
+                attempt += 1
+
+    def close_all(self):
+        """Close every idle connection and refuse further checkouts"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+def main(argv=None):
+    """Command-line entry point for schema maintenance"""
+    parser = argparse.ArgumentParser(description="Banking database schema maintenance")
+    parser.add_argument('command', choices=['migrate', 'check-plans'],
+                        help="apply pending migrations, or EXPLAIN the hot queries")
+    args = parser.parse_args(argv)
+
+    db_config = load_database_config()
+    create_database(db_config)
+    pool = ConnectionPool(db_config, size=1)
+    try:
+        with pool.connection() as conn:
+            if args.command == 'migrate':
+                print(f"✓ Schema at version {migrate(conn)}")
+                return 0
+            problems = check_query_plans(conn)
+    finally:
+        pool.close_all()
+
+    for problem in problems:
+        print(f"✗ {problem}")
+    if problems:
+        return 1
+    print("✓ All hot queries use their indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+class BankingError(Exception):
+    """Base class for banking operation failures"""
+
+
+class AccountNotFoundError(BankingError):
+    """Raised when an account number does not exist"""
+
+    def __init__(self, account_number):
+        super().__init__(f"Account {account_number} not found")
+        self.account_number = account_number
+
+
+class InvalidAmountError(BankingError):
+    """Raised when an amount is not a valid money value"""
+
+
+class InsufficientFundsError(BankingError):
+    """Raised when a withdrawal exceeds the available balance"""
+
+    def __init__(self, account_number, balance, amount):
+        super().__init__(f"Insufficient funds in account {account_number}")
+        self.account_number = account_number
+        self.balance = balance
+        self.amount = amount
+
+
+class DuplicateAccountNumberError(BankingError):
+    """Raised by a storage backend when an account number is already taken"""
+
+
+class RequestKeyConflictError(BankingError):
+    """Raised when a request ID is reused for a different posting"""
+
+    def __init__(self, request_id):
+        super().__init__(f"Request ID {request_id} was already used for a different posting")
+        self.request_id = request_id
+
+
+class VelocityLimitError(BankingError):
+    """Raised when a withdrawal or transfer would break a velocity rule"""
+
+    def __init__(self, account_number, rule):
+        super().__init__(f"Account {account_number} exceeded the {rule} limit")
+        self.account_number = account_number
+        self.rule = rule
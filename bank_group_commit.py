@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from bank_errors import BankingError
+
+
+_STOP = object()
+
+
+class GroupCommitter:
+    """Coalesce concurrent deposits and withdrawals into shared transactions
+
+    Callers queue a posting and block until it is applied. One flusher
+    thread collects postings until ``max_batch`` are waiting or
+    ``max_delay`` seconds have passed since the first. It then hands the
+    batch to the backend's apply_postings(), which runs one transaction
+    and one commit for the whole batch. While a batch commits, the next
+    one fills up, so under load the commit cost is shared by many
+    postings. The price is up to ``max_delay`` of extra latency.
+
+    Postings are applied in the order they were queued. That keeps
+    per-account ordering, and every withdrawal is checked against the
+    balance left by the postings before it. A rejected posting fails only
+    its own caller. If the whole transaction fails, every caller in the
+    batch gets the error. Postings still queued when the flusher stops
+    fail with BankingError rather than leaving their callers waiting.
+    """
+
+    def __init__(self, backend, max_batch=200, max_delay=0.002, metrics=None):
+        if max_batch < 1:
+            raise ValueError("Batch size must be at least 1")
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self._queue = queue.Queue()
+        # Guards _closed, so nothing can be queued behind _STOP
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, account_id, account_number, transaction_type, amount, description=None):
+        """Queue one posting and return the account's new balance once committed"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise BankingError("Group commit is closed")
+            self._queue.put(((account_id, account_number, transaction_type, amount, description), future))
+        return future.result()
+
+    def close(self):
+        """Flush queued postings and stop the flusher thread"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            self._collect()
+        finally:
+            # Whether stopped or killed, take no more postings and release
+            # every caller still waiting
+            with self._lock:
+                self._closed = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    item[1].set_exception(BankingError("Group commit is closed"))
+
+    def _collect(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """Apply one batch and hand each caller its own result"""
+        postings = [posting for posting, _ in batch]
+        results = None
+        try:
+            if self.metrics is not None:
+                with self.metrics.operation('group_commit'):
+                    results = self.backend.apply_postings(postings)
+                self.metrics.inc('bank_group_commit_batches_total')
+                self.metrics.inc('bank_group_commit_postings_total', len(postings))
+            else:
+                results = self.backend.apply_postings(postings)
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            # Reached with results unset only by a BaseException, which
+            # still stops the flusher once the callers are released
+            if results is None:
+                results = [BankingError("Group commit stopped")] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
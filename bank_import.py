@@ -0,0 +1,291 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from itertools import islice
+
+from mysql.connector import Error
+
+from bank_db import load_database_config, ConnectionPool
+from bank_money import Money
+from bank_service import BankingError, VelocityLimitError, parse_amount
+from bank_storage import open_backend
+from bank_velocity import VelocityGuard, load_velocity_rules
+
+
+TRANSACTION_TYPES = ('deposit', 'withdrawal')
+
+
+class RowError:
+    """A rejected input row and the reason it was rejected"""
+
+    def __init__(self, offset, row, message):
+        self.offset = offset
+        self.row = row
+        self.message = message
+
+    def __repr__(self):
+        return f"RowError(offset={self.offset}, message={self.message!r})"
+
+
+class ImportResult:
+    """Running totals for one import"""
+
+    def __init__(self, start_offset=0):
+        self.next_offset = start_offset
+        self.rows_posted = 0
+        self.rows_rejected = 0
+        self.chunks_committed = 0
+        self.errors = []
+
+
+class ImportAborted(Exception):
+    """Raised when a chunk could not be committed
+
+    ``next_offset`` is the first row that was not committed; pass it as
+    ``start_offset`` to resume the import.
+    """
+
+    def __init__(self, next_offset, cause):
+        super().__init__(f"Import stopped at row {next_offset}: {cause}")
+        self.next_offset = next_offset
+        self.cause = cause
+
+
+def read_rows(path):
+    """Lazily yield row dicts from a .csv or .jsonl file"""
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield {'_parse_error': str(e)}
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+
+def _validate(row):
+    """Normalise one input row to (account_number, type, amount, description)"""
+    if not isinstance(row, dict):
+        raise BankingError("Row is not an object")
+    if '_parse_error' in row:
+        raise BankingError(f"Malformed line: {row['_parse_error']}")
+    account_number = str(row.get('account_number') or '').strip()
+    if not account_number:
+        raise BankingError("Missing account_number")
+    transaction_type = str(row.get('transaction_type') or row.get('type') or '').strip().lower()
+    if transaction_type not in TRANSACTION_TYPES:
+        raise BankingError(f"Unsupported transaction type: {transaction_type!r}")
+    amount = parse_amount(row.get('amount'))
+    description = (row.get('description') or '').strip()
+    if not description:
+        description = "Batch deposit" if transaction_type == 'deposit' else "Batch withdrawal"
+    return account_number, transaction_type, amount, description[:255]
+
+
+class BatchImporter:
+    """Post deposits and withdrawals from large files in chunked transactions
+
+    Each chunk resolves its account numbers with one query, locks the
+    affected accounts, applies the net balance change per account with
+    ``executemany`` and inserts all ledger rows with one multi-row INSERT.
+    Bad rows are reported and skipped instead of aborting the load.
+
+    ``velocity`` is a warmed bank_velocity.VelocityGuard. Each withdrawal
+    is reserved against it like a service withdrawal, and a row that
+    would break a rule is rejected.
+    """
+
+    def __init__(self, pool, chunk_size=1000, velocity=None):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1")
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.velocity = velocity
+
+    def _release(self, holds):
+        while holds:
+            self.velocity.release(holds.pop())
+
+    def run(self, rows, start_offset=0, on_error=None, on_progress=None):
+        """Import an iterable of row dicts, skipping the first ``start_offset``
+
+        ``on_error(RowError)`` is called for each rejected row; without it
+        the errors are collected in ``ImportResult.errors``.
+        ``on_progress(ImportResult)`` is called after each committed chunk.
+        """
+        result = ImportResult(start_offset)
+        rows = islice(rows, start_offset, None)
+
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            try:
+                posted, errors = self._post_chunk(result.next_offset, chunk)
+            except Error as e:
+                raise ImportAborted(result.next_offset, e)
+
+            result.next_offset += len(chunk)
+            result.rows_posted += posted
+            result.rows_rejected += len(errors)
+            result.chunks_committed += 1
+            if on_error:
+                for error in errors:
+                    on_error(error)
+            else:
+                result.errors.extend(errors)
+            if on_progress:
+                on_progress(result)
+
+        return result
+
+    def _post_chunk(self, offset, chunk):
+        """Validate and post one chunk in a single transaction"""
+        errors = []
+        valid = []
+        for index, row in enumerate(chunk):
+            try:
+                valid.append((offset + index, row, _validate(row)))
+            except BankingError as e:
+                errors.append(RowError(offset + index, row, str(e)))
+
+        if not valid:
+            return 0, errors
+        holds = []
+
+        def work(conn):
+            self._release(holds)  # reserved by an attempt that was rolled back
+            rejected = []
+            cursor = conn.cursor()
+            try:
+                account_numbers = sorted({parsed[0] for _, _, parsed in valid})
+                placeholders = ', '.join(['%s'] * len(account_numbers))
+                cursor.execute(f"""
+                    SELECT account_id
+                    FROM accounts
+                    WHERE account_number IN ({placeholders})
+                """, account_numbers)
+                account_ids = sorted(account_id for (account_id,) in cursor.fetchall())
+                accounts = {}
+                if account_ids:
+                    # Lock by primary key in ID order, as transfer_plan does, so
+                    # chunks and transfers cannot deadlock one another
+                    placeholders = ', '.join(['%s'] * len(account_ids))
+                    cursor.execute(f"""
+                        SELECT account_number, account_id, CAST(balance * 100 AS SIGNED)
+                        FROM accounts
+                        WHERE account_id IN ({placeholders})
+                        ORDER BY account_id
+                        FOR UPDATE
+                    """, account_ids)
+                    accounts = {number: [account_id, Money(cents)]
+                                for number, account_id, cents in cursor.fetchall()}
+
+                deltas = {}
+                ledger_rows = []
+                for row_offset, row, (account_number, transaction_type, amount, description) in valid:
+                    account = accounts.get(account_number)
+                    if account is None:
+                        rejected.append(RowError(row_offset, row, f"Account {account_number} not found"))
+                        continue
+                    account_id, balance = account
+                    if transaction_type == 'withdrawal':
+                        if amount > balance:
+                            rejected.append(RowError(row_offset, row, f"Insufficient funds in account {account_number}"))
+                            continue
+                        if self.velocity is not None:
+                            try:
+                                holds.append(self.velocity.reserve(account_id, account_number, 'withdrawal', amount))
+                            except VelocityLimitError as e:
+                                rejected.append(RowError(row_offset, row, str(e)))
+                                continue
+                        delta = -amount
+                    else:
+                        delta = amount
+                    account[1] = balance + delta
+                    deltas[account_id] = deltas.get(account_id, 0) + delta.cents
+                    ledger_rows.append((account_id, transaction_type, amount.cents, description))
+
+                if deltas:
+                    cursor.executemany(
+                        "UPDATE accounts SET balance = balance + %s / 100 WHERE account_id = %s",
+                        [(delta, account_id) for account_id, delta in sorted(deltas.items())]
+                    )
+                if ledger_rows:
+                    cursor.executemany("""
+                        INSERT INTO transactions (account_id, transaction_type, amount, description)
+                        VALUES (%s, %s, %s / 100, %s)
+                    """, ledger_rows)
+            finally:
+                cursor.close()
+            return len(ledger_rows), rejected
+
+        try:
+            posted, rejected = self.pool.run_transaction(work)
+        except BaseException:
+            self._release(holds)
+            raise
+        errors.extend(rejected)
+        errors.sort(key=lambda error: error.offset)
+        return posted, errors
+
+
+def main(argv=None):
+    """Command-line entry point for batch imports"""
+    parser = argparse.ArgumentParser(description="Post deposits and withdrawals from a CSV or JSONL file")
+    parser.add_argument('path', help="input file (.csv with a header row, or .jsonl)")
+    parser.add_argument('--chunk-size', type=int, default=int(os.getenv('IMPORT_CHUNK_SIZE', '1000')),
+                        help="rows per database transaction (default 1000)")
+    parser.add_argument('--start-offset', type=int, default=0,
+                        help="number of data rows to skip, to resume an aborted import")
+    parser.add_argument('--errors', help="write rejected rows to this JSONL file")
+    args = parser.parse_args(argv)
+
+    db_config = load_database_config()
+    velocity = None
+    rules = load_velocity_rules()
+    if rules:
+        velocity = VelocityGuard(rules)
+        backend = open_backend(db_config, pool_size=1)
+        try:
+            print(f"✓ Velocity limits warmed from {velocity.warm(backend)} recent postings")
+        finally:
+            backend.close()
+    pool = ConnectionPool(db_config, size=1)
+    importer = BatchImporter(pool, chunk_size=args.chunk_size, velocity=velocity)
+    error_file = open(args.errors, 'a', encoding='utf-8') if args.errors else None
+
+    def on_error(error):
+        if error_file:
+            error_file.write(json.dumps({'offset': error.offset, 'error': error.message, 'row': error.row},
+                                        default=str) + "\n")
+        else:
+            print(f"✗ Row {error.offset}: {error.message}", file=sys.stderr)
+
+    def on_progress(result):
+        print(f"  {result.next_offset} rows read, {result.rows_posted} posted, {result.rows_rejected} rejected")
+
+    try:
+        result = importer.run(read_rows(args.path), start_offset=args.start_offset,
+                              on_error=on_error, on_progress=on_progress)
+    except ImportAborted as e:
+        print(f"✗ {e}")
+        print(f"   Resume with: --start-offset {e.next_offset}")
+        return 1
+    finally:
+        if error_file:
+            error_file.close()
+        pool.close_all()
+
+    print(f"\n✓ Import finished: {result.rows_posted} rows posted, {result.rows_rejected} rejected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from bank_config import load_database_config
+from bank_errors import BankingError
+from bank_money import Money
+from bank_storage import open_backend
+
+
+class BalanceProjection:
+    """Account balances rebuilt from the ledger, held in memory
+
+    Balances are cents in an array indexed by account_id, so the
+    projection costs 8 bytes per account however long the ledger is.
+    ``position`` is the transaction_id it has been replayed up to. Ledger
+    rows for account IDs outside the range it was built for are ignored.
+    """
+
+    def __init__(self, first_id, last_id, position=0):
+        self.first_id = first_id
+        self.last_id = last_id
+        self.position = position
+        self.cents = array('q', bytes(8 * (last_id - first_id + 1)))
+
+    def add(self, changes):
+        """Fold {account_id: cents} net changes into the balances"""
+        for account_id, cents in changes.items():
+            if self.first_id <= account_id <= self.last_id:
+                self.cents[account_id - self.first_id] += cents
+
+    def balance(self, account_id):
+        return Money(self.cents[account_id - self.first_id])
+
+    def slice(self, first_id, last_id):
+        """Return {account_id: cents} for the non-zero balances in an ID range"""
+        offset = self.first_id
+        return {account_id: self.cents[account_id - offset] for account_id in range(first_id, last_id + 1)
+                if self.cents[account_id - offset]}
+
+
+# Each worker process opens its own backend once and reuses it for every
+# chunk it is given, as in bank_statements
+_worker_backend = None
+
+
+def _init_worker(db_config):
+    global _worker_backend
+    _worker_backend = open_backend(db_config, pool_size=1)
+
+
+def replay_chunk(job):
+    """Worker task: net change per account over one transaction-ID range"""
+    first_id, last_id = job
+    return _worker_backend.ledger_net_changes(first_id, last_id)
+
+
+def reconcile_chunk(job):
+    """Worker task: check (or repair) one account-ID range against the replay"""
+    first_id, last_id, replayed, high_water, repair = job
+    return _worker_backend.reconcile_balances(first_id, last_id, replayed, high_water, repair)
+
+
+class ReplayProgress:
+    """Running totals for one replay, passed to the progress callback"""
+
+    def __init__(self, phase, chunks_total):
+        self.phase = phase
+        self.chunks_total = chunks_total
+        self.chunks_done = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class ReconciliationReport:
+    """Outcome of reconcile(): which stored balances disagree with the ledger"""
+
+    def __init__(self, high_water, accounts, drift, repaired, elapsed):
+        self.high_water = high_water
+        self.accounts = accounts
+        self.drift = drift
+        self.repaired = repaired
+        self.elapsed = elapsed
+
+    @property
+    def total_drift(self):
+        """Stored minus ledger balances, summed over the drifted accounts"""
+        return Money(sum(entry['balance'].cents - entry['ledger_balance'].cents for entry in self.drift))
+
+
+class LedgerReplayer:
+    """Rebuild account balances from the append-only ledger
+
+    ``accounts.balance`` is a projection of ``transactions``: postings
+    update both in one transaction, and the ledger itself is append-only
+    (migration 8) with ``transaction_id`` as its sequence number. This
+    engine recomputes the projection in two parallel passes:
+
+    1. replay: the ledger (hot and archive tables) is cut into
+       ``chunk_size`` transaction-ID ranges. Workers read each range
+       sequentially by primary key, and the database returns one net
+       change per account. The changes are folded into an in-memory
+       BalanceProjection up to a high-water transaction_id.
+    2. reconcile: accounts are cut into ``account_chunk_size`` ID ranges.
+       Each range's stored balances are compared with the projection plus
+       the rows posted since the high-water mark, and with ``repair`` the
+       drifted balances are reset in the same transaction.
+
+    The service keeps running throughout. Postings still in flight when
+    the high-water mark is read have ``settle_seconds`` to commit before
+    the replay starts.
+    """
+
+    def __init__(self, db_config, workers=None, chunk_size=1000000, account_chunk_size=10000, settle_seconds=2):
+        if db_config.get('backend', 'mysql') == 'memory':
+            raise BankingError("Ledger replay needs a database the worker processes can share")
+        self.db_config = db_config
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.account_chunk_size = account_chunk_size
+        self.settle_seconds = settle_seconds
+
+    def _run_jobs(self, pool, task, jobs, progress, on_progress, collect):
+        """Run jobs with a few queued per worker, so lazily built jobs stay lazy"""
+        jobs = iter(jobs)
+        pending = set()
+        while True:
+            for job in jobs:
+                pending.add(pool.submit(task, job))
+                if len(pending) >= 2 * self.workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future.result())
+                progress.chunks_done += 1
+                if on_progress:
+                    on_progress(progress)
+
+    def _pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(self.db_config,))
+
+    def replay(self, on_progress=None):
+        """Rebuild every balance from the ledger and return the BalanceProjection
+
+        Returns None when there are no accounts.
+        """
+        with self._pool() as pool:
+            return self._replay(pool, on_progress)
+
+    def _replay(self, pool, on_progress):
+        backend = open_backend(self.db_config, pool_size=1)
+        try:
+            first_txn, high_water = backend.ledger_id_bounds()
+            time.sleep(self.settle_seconds)
+            first_account, last_account = backend.account_id_bounds()
+        finally:
+            backend.close()
+        if first_account is None:
+            return None
+        projection = BalanceProjection(first_account, last_account, high_water or 0)
+        if high_water is None:
+            return projection
+
+        jobs = [(low, min(low + self.chunk_size - 1, high_water))
+                for low in range(first_txn, high_water + 1, self.chunk_size)]
+        progress = ReplayProgress('replay', len(jobs))
+        self._run_jobs(pool, replay_chunk, jobs, progress, on_progress, projection.add)
+        return projection
+
+    def reconcile(self, repair=False, on_progress=None):
+        """Replay the ledger, then compare (or with ``repair`` fix) every stored balance
+
+        Returns a ReconciliationReport. ``on_progress(ReplayProgress)`` is
+        called after each finished chunk of either pass.
+        """
+        started = time.perf_counter()
+        with self._pool() as pool:
+            projection = self._replay(pool, on_progress)
+            if projection is None:
+                return ReconciliationReport(0, 0, [], repair, time.perf_counter() - started)
+
+            ranges = [(low, min(low + self.account_chunk_size - 1, projection.last_id))
+                      for low in range(projection.first_id, projection.last_id + 1, self.account_chunk_size)]
+            jobs = ((low, high, projection.slice(low, high), projection.position, repair) for low, high in ranges)
+            checked = 0
+            drift = []
+
+            def collect(result):
+                nonlocal checked
+                checked += result[0]
+                drift.extend(result[1])
+
+            progress = ReplayProgress('reconcile', len(ranges))
+            self._run_jobs(pool, reconcile_chunk, jobs, progress, on_progress, collect)
+
+        drift.sort()
+        drift = [{'account_id': account_id, 'account_number': account_number, 'balance': Money(stored),
+                  'ledger_balance': Money(ledger)}
+                 for account_id, account_number, stored, ledger in drift]
+        return ReconciliationReport(projection.position, checked, drift, repair, time.perf_counter() - started)
+
+
+def write_drift_report(report, path):
+    """Write the drifted accounts to a CSV file"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('account_number', 'balance', 'ledger_balance', 'difference'))
+        for entry in report.drift:
+            writer.writerow((entry['account_number'], entry['balance'], entry['ledger_balance'],
+                             entry['balance'] - entry['ledger_balance']))
+
+
+def main(argv=None):
+    """Command-line entry point for ledger replay and reconciliation"""
+    parser = argparse.ArgumentParser(description="Rebuild balances from the ledger and report drift")
+    commands = parser.add_subparsers(dest='command', required=True)
+    reconcile = commands.add_parser('reconcile', help="report accounts whose balance disagrees with the ledger")
+    rebuild = commands.add_parser('rebuild', help="reset every drifted balance to the ledger's")
+    for command in (reconcile, rebuild):
+        command.add_argument('--workers', type=int, default=os.cpu_count(),
+                             help="worker processes, each with its own connection (default: CPU count)")
+        command.add_argument('--chunk-size', type=int, default=1000000, help="transaction IDs per replay chunk")
+        command.add_argument('--account-chunk-size', type=int, default=10000,
+                             help="account IDs per reconciliation chunk")
+        command.add_argument('--report', help="write drifted accounts to this CSV file")
+    args = parser.parse_args(argv)
+
+    replayer = LedgerReplayer(load_database_config(), workers=args.workers, chunk_size=args.chunk_size,
+                              account_chunk_size=args.account_chunk_size)
+
+    def on_progress(progress):
+        print(f"  {progress.phase}: {progress.chunks_done}/{progress.chunks_total} chunks "
+              f"({progress.elapsed:.1f}s)")
+
+    try:
+        report = replayer.reconcile(repair=args.command == 'rebuild', on_progress=on_progress)
+    except BankingError as e:
+        print(f"✗ {e}")
+        return 1
+
+    for entry in report.drift[:20]:
+        print(f"  {entry['account_number']:<14} stored ${entry['balance']:>14.2f}  "
+              f"ledger ${entry['ledger_balance']:>14.2f}")
+    if len(report.drift) > 20:
+        print(f"  ... and {len(report.drift) - 20} more")
+    if args.report:
+        write_drift_report(report, args.report)
+    print(f"\n{'✓' if not report.drift or report.repaired else '✗'} {report.accounts} accounts checked "
+          f"against the ledger up to transaction {report.high_water} in {report.elapsed:.1f}s: "
+          f"{len(report.drift)} drifted (net ${report.total_drift:.2f})"
+          f"{', repaired' if report.repaired and report.drift else ''}")
+    return 1 if report.drift and not report.repaired else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+import bisect
+import functools
+import logging
+import os
+import random
+import threading
+import time
+
+
+slow_query_log = logging.getLogger('bank.slow_queries')
+
+# Latency buckets in seconds, from sub-millisecond cache hits to stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRIC_HELP = {
+    'bank_operation_seconds': ('histogram', "Wall-clock time of public banking operations"),
+    'bank_operation_errors_total': ('counter', "Public operations that raised, by exception type"),
+    'bank_operation_db_seconds_total': ('counter', "Time spent waiting on the database per operation"),
+    'bank_operation_python_seconds_total': ('counter', "Time spent outside the database per operation"),
+    'bank_operation_round_trips_total': ('counter', "Database round trips per operation"),
+    'bank_operation_rows_fetched_total': ('counter', "Rows fetched per operation"),
+    'bank_db_statement_seconds': ('histogram', "Statement execution time by statement type"),
+    'bank_db_commit_seconds': ('histogram', "Commit latency"),
+    'bank_pool_wait_seconds': ('histogram', "Time spent waiting for a pooled connection"),
+    'bank_slow_queries_total': ('counter', "Statements slower than the slow-query threshold"),
+    'bank_group_commit_batches_total': ('counter', "Transactions committed by the group committer"),
+    'bank_group_commit_postings_total': ('counter', "Deposits and withdrawals applied by the group committer"),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class OperationContext:
+    """Database time, round trips and rows attributed to one operation"""
+
+    __slots__ = ('name', 'db_seconds', 'round_trips', 'rows')
+
+    def __init__(self, name):
+        self.name = name
+        self.db_seconds = 0.0
+        self.round_trips = 0
+        self.rows = 0
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def statement_kind(sql):
+    """Return the leading SQL keyword, used as a low-cardinality label"""
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms for the banking hot path
+
+    Public operations run inside operation(); every statement, fetch and
+    commit issued meanwhile on an instrumented connection is attributed to
+    that operation, so the export shows how each operation's time splits
+    between the database and Python. Statements slower than
+    ``slow_query_threshold`` seconds are counted, and a ``slow_query_sample``
+    fraction of them is written to the ``bank.slow_queries`` logger.
+    """
+
+    def __init__(self, slow_query_threshold=0.1, slow_query_sample=1.0):
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_query_sample = slow_query_sample
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """Build metrics from BANK_METRICS* settings, or return None if disabled
+
+        Metrics are on when BANK_METRICS=1 or an export target
+        (BANK_METRICS_FILE / BANK_METRICS_PORT) is set. BANK_SLOW_QUERY_MS
+        and BANK_SLOW_QUERY_SAMPLE tune the slow-query log, and
+        BANK_SLOW_QUERY_LOG sends it to a file.
+        """
+        if not (os.getenv('BANK_METRICS') == '1' or os.getenv('BANK_METRICS_FILE') or os.getenv('BANK_METRICS_PORT')):
+            return None
+        log_path = os.getenv('BANK_SLOW_QUERY_LOG')
+        if log_path:
+            handler = logging.FileHandler(log_path, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_log.addHandler(handler)
+            slow_query_log.setLevel(logging.INFO)
+        return cls(slow_query_threshold=float(os.getenv('BANK_SLOW_QUERY_MS', '100')) / 1000,
+                   slow_query_sample=float(os.getenv('BANK_SLOW_QUERY_SAMPLE', '1.0')))
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def counter(self, name, labels=()):
+        """Return a counter's current value"""
+        with self._lock:
+            return self._counters.get((name, labels), 0)
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def operation(self, name):
+        """Context manager timing one public operation"""
+        return _OperationTimer(self, name)
+
+    def record_statement(self, sql, seconds, round_trips=1):
+        """Account for one execute()/executemany() call"""
+        stack = self._stack()
+        operation = stack[-1].name if stack else 'none'
+        if stack:
+            stack[-1].db_seconds += seconds
+            stack[-1].round_trips += round_trips
+        self.observe('bank_db_statement_seconds', seconds, (('statement', statement_kind(sql)),))
+        if seconds >= self.slow_query_threshold:
+            self.inc('bank_slow_queries_total', labels=(('operation', operation),))
+            if self.slow_query_sample >= 1 or random.random() < self.slow_query_sample:
+                slow_query_log.warning("slow query %.1f ms in %s: %s", seconds * 1000, operation,
+                                       ' '.join(sql.split())[:500])
+
+    def record_fetch(self, rows, seconds):
+        """Account for rows read back from a result set"""
+        stack = self._stack()
+        if stack:
+            stack[-1].db_seconds += seconds
+            stack[-1].rows += rows
+
+    def record_commit(self, seconds):
+        stack = self._stack()
+        if stack:
+            stack[-1].db_seconds += seconds
+            stack[-1].round_trips += 1
+        self.observe('bank_db_commit_seconds', seconds)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (histogram.buckets, list(histogram.counts), histogram.count, histogram.sum))
+                                for key, histogram in self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described and name in METRIC_HELP:
+                kind, text = METRIC_HELP[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{_labels_text(labels)} {value}")
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels_text(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels_text(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {total}")
+            lines.append(f"{name}_count{_labels_text(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Atomically write the export, e.g. for node_exporter's textfile collector"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+    def start_textfile_writer(self, path, interval=15):
+        """Rewrite the textfile every ``interval`` seconds on a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.write_textfile(path)
+
+        threading.Thread(target=run, name='metrics-textfile', daemon=True).start()
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve GET /metrics on a daemon thread and return the server"""
+        # Imported here so short-lived processes that never serve skip it
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+    def start_exporters(self):
+        """Start the exporters named by BANK_METRICS_FILE / BANK_METRICS_PORT"""
+        path = os.getenv('BANK_METRICS_FILE')
+        if path:
+            self.start_textfile_writer(path, float(os.getenv('BANK_METRICS_INTERVAL', '15')))
+        port = os.getenv('BANK_METRICS_PORT')
+        if port:
+            self.serve(int(port))
+
+
+class _OperationTimer:
+    __slots__ = ('metrics', 'context', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.context = OperationContext(name)
+
+    def __enter__(self):
+        self.metrics._stack().append(self.context)
+        self.started = time.perf_counter()
+        return self.context
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        stack = self.metrics._stack()
+        stack.pop()
+        context = self.context
+        if stack:
+            # Nested operations also count towards the enclosing one
+            parent = stack[-1]
+            parent.db_seconds += context.db_seconds
+            parent.round_trips += context.round_trips
+            parent.rows += context.rows
+
+        labels = (('operation', context.name),)
+        metrics = self.metrics
+        metrics.observe('bank_operation_seconds', elapsed, labels)
+        metrics.inc('bank_operation_db_seconds_total', context.db_seconds, labels)
+        metrics.inc('bank_operation_python_seconds_total', max(0.0, elapsed - context.db_seconds), labels)
+        metrics.inc('bank_operation_round_trips_total', context.round_trips, labels)
+        metrics.inc('bank_operation_rows_fetched_total', context.rows, labels)
+        if exc_type is not None:
+            metrics.inc('bank_operation_errors_total', labels=labels + (('error', exc_type.__name__),))
+        return False
+
+
+def instrumented(name):
+    """Time a BankingService method as operation ``name`` when metrics are on"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            with self.metrics.operation(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class InstrumentedCursor:
+    """DB-API cursor proxy that reports statements and fetches to Metrics"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            self._metrics.record_statement(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_params):
+        seq_params = list(seq_params)
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_params)
+        finally:
+            # mysql.connector folds INSERT batches into one statement and
+            # runs anything else once per parameter set
+            round_trips = 1 if statement_kind(sql) in ('INSERT', 'REPLACE') else len(seq_params)
+            self._metrics.record_statement(sql, time.perf_counter() - started, round_trips)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._metrics.record_fetch(0 if row is None else 1, time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._metrics.record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._metrics.record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+
+
+class InstrumentedConnection:
+    """Connection proxy handing out instrumented cursors and timing commits"""
+
+    def __init__(self, connection, metrics):
+        self._connection = connection
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs), self._metrics)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._connection.commit()
+        finally:
+            self._metrics.record_commit(time.perf_counter() - started)
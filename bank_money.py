@@ -0,0 +1,126 @@
+from decimal import Decimal, InvalidOperation
+from operator import attrgetter
+
+from bank_errors import InvalidAmountError
+
+
+CENT = Decimal('0.01')
+
+
+class Money:
+    """An exact amount of money held as integer cents
+
+    Arithmetic and comparisons are plain integer operations, so sums are
+    exact and cost no Decimal allocations. Amounts cross the database
+    boundary as cents too: MySQL statements take ``%s / 100`` parameters
+    and read ``CAST(column * 100 AS SIGNED)``, SQLite stores cents
+    directly. Money formats like a Decimal, so ``f"{amount:.2f}"`` works.
+    """
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int):
+            raise TypeError(f"Money takes integer cents, not {type(cents).__name__}")
+        self.cents = cents
+
+    @classmethod
+    def parse(cls, value):
+        """Convert user or API input in dollars to Money, rounding to the cent"""
+        if isinstance(value, Money):
+            return value
+        try:
+            amount = Decimal(str(value).strip())
+        except (InvalidOperation, ValueError):
+            raise InvalidAmountError(f"Invalid amount: {value!r}")
+        if not amount.is_finite():
+            raise InvalidAmountError(f"Invalid amount: {value!r}")
+        return cls(int(amount.quantize(CENT).scaleb(2)))
+
+    @classmethod
+    def from_decimal(cls, value):
+        """Convert a DECIMAL(15,2) value read from the database"""
+        return cls(int(value.scaleb(2)))
+
+    def to_decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __radd__(self, other):
+        # Lets the builtin sum() start from 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, Money):
+            return self.cents <= other.cents
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, Money):
+            return self.cents > other.cents
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, Money):
+            return self.cents >= other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __str__(self):
+        sign = '-' if self.cents < 0 else ''
+        dollars, cents = divmod(abs(self.cents), 100)
+        return f"{sign}{dollars}.{cents:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        if not spec:
+            return str(self)
+        return format(self.to_decimal(), spec)
+
+
+ZERO = Money(0)
+_cents = attrgetter('cents')
+
+
+def total(amounts):
+    """Return the exact sum of an iterable of Money
+
+    The cents are summed by the builtin sum() over a C-level map, so
+    totalling a large report allocates no intermediate Money or Decimal
+    objects.
+    """
+    return Money(sum(map(_cents, amounts)))
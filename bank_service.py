@@ -0,0 +1,437 @@
+import threading
+from itertools import islice
+
+from bank_cache import LRUCache
+from bank_errors import (BankingError, AccountNotFoundError, InvalidAmountError, InsufficientFundsError,
+                         DuplicateAccountNumberError, RequestKeyConflictError, VelocityLimitError)
+from bank_group_commit import GroupCommitter
+from bank_metrics import instrumented
+from bank_money import Money, total
+from bank_storage import (StorageBackend, MySQLBackend, TransactionTotals, REQUEST_KEY_RETENTION, next_page_cursor,
+                          open_backend)
+from bank_velocity import VelocityGuard
+
+
+def parse_amount(value, allow_zero=False):
+    """Convert user or API input to Money"""
+    amount = Money.parse(value)
+    if amount.cents < 0 or (amount.cents == 0 and not allow_zero):
+        raise InvalidAmountError("Amount must be positive")
+    return amount
+
+
+def luhn_check_digit(digits):
+    """Return the Luhn check digit for a string of digits"""
+    total = 0
+    for index, char in enumerate(reversed(digits)):
+        digit = int(char)
+        if index % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_account_number(account_number):
+    """Check the trailing Luhn digit of an allocated account number"""
+    account_number = str(account_number)
+    return (account_number.isdigit() and len(account_number) > 1
+            and luhn_check_digit(account_number[:-1]) == account_number[-1])
+
+
+class AccountNumberAllocator:
+    """Hand out account numbers from blocks reserved in the database
+
+    A block of ``block_size`` sequence values is claimed from the storage
+    backend in one atomic step and then served from memory, so allocating a number normally
+    costs no round trip at all. Each number is the sequence value followed
+    by a Luhn check digit. Values left in a block when the process exits
+    are simply skipped.
+    """
+
+    def __init__(self, backend, block_size=1000):
+        self.backend = backend
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def allocate(self, count=1):
+        """Return ``count`` new account numbers"""
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(numbers))
+                    self._next = self.backend.reserve_account_numbers(size)
+                    self._end = self._next + size
+                take = min(count - len(numbers), self._end - self._next)
+                for value in range(self._next, self._next + take):
+                    body = str(value)
+                    numbers.append(body + luhn_check_digit(body))
+                self._next += take
+        return numbers
+
+
+class BankingService:
+    """Non-interactive banking operations on a pluggable storage backend
+
+    Every public method is one atomic unit of work on the backend (see
+    bank_storage) and returns plain data, so one instance can be shared by
+    many threads. A ConnectionPool may be passed instead of a backend and
+    is wrapped in a MySQLBackend.
+
+    Account-number to ID mappings are cached for the life of the process.
+    Balance snapshots are cached too and invalidated by this service's own
+    writes; when other processes also post to the database, set
+    ``balance_ttl`` (seconds) to bound how stale a cached balance can be.
+    ``cache_size=0`` disables both caches.
+
+    With a bank_metrics.Metrics registry, each public operation is timed
+    and, on MySQL, its statements, rows and commits are attributed to it.
+
+    ``group_commit=True`` (or a GroupCommitter) routes deposits and
+    withdrawals through bank_group_commit, which commits concurrent
+    postings together.
+
+    deposit() and withdraw() accept a client ``request_id``. Retrying
+    with the same ID returns the first attempt's result instead of posting
+    again, for as long as purge_request_keys() retains it. Keyed postings
+    bypass group commit.
+
+    ``velocity`` (a bank_velocity.VelocityGuard, or a list of its rules)
+    checks withdrawals and the source of transfers against per-account
+    velocity limits before they reach the database. A guard that has not
+    been warmed yet is warmed from this backend's recent ledger rows.
+    """
+
+    def __init__(self, backend, allocator=None, cache_size=10000, balance_ttl=None, metrics=None,
+                 group_commit=None, velocity=None):
+        if not isinstance(backend, StorageBackend):
+            backend = MySQLBackend(backend)
+        self.backend = backend
+        # The MySQL-only tools (snapshots, importer) work on the pool directly
+        self.pool = getattr(backend, 'pool', None)
+        self.metrics = metrics if metrics is not None else getattr(self.pool, 'metrics', None)
+        if group_commit is True:
+            group_commit = GroupCommitter(backend, metrics=self.metrics)
+        self.group_commit = group_commit or None
+        if velocity and not isinstance(velocity, VelocityGuard):
+            velocity = VelocityGuard(velocity)
+        self.velocity = velocity or None
+        if self.velocity is not None and not self.velocity.warmed:
+            self.velocity.warm(backend)
+        self.allocator = allocator or AccountNumberAllocator(backend)
+        self.account_ids = LRUCache(cache_size) if cache_size else None
+        self.balances = LRUCache(cache_size, ttl=balance_ttl) if cache_size else None
+
+    @classmethod
+    def from_config(cls, db_config, pool_size=10, metrics=None, group_commit=None, velocity=None):
+        """Build a service on the backend named in the config"""
+        return cls(open_backend(db_config, pool_size=pool_size, metrics=metrics), metrics=metrics,
+                   group_commit=group_commit, velocity=velocity)
+
+    def close(self):
+        """Flush pending group commits and release the backend's connections"""
+        if self.group_commit is not None:
+            self.group_commit.close()
+        self.backend.close()
+
+    def cache_stats(self):
+        """Return hit/miss counters for the account and balance caches"""
+        if self.account_ids is None:
+            return {}
+        return {'account_ids': self.account_ids.stats(), 'balances': self.balances.stats()}
+
+    def _invalidate_balance(self, *account_numbers):
+        """Forget cached balance snapshots after a write"""
+        if self.balances is not None:
+            for account_number in account_numbers:
+                self.balances.invalidate(account_number)
+
+    def _get_account_id(self, account_number):
+        """Look up the account ID, raising if the account doesn't exist"""
+        if self.account_ids is not None:
+            account_id = self.account_ids.get(account_number)
+            if account_id is not None:
+                return account_id
+        account_id = self.backend.lookup_account_id(account_number)
+        if self.account_ids is not None:
+            self.account_ids.set(account_number, account_id)
+        return account_id
+
+    def get_account_id(self, account_number):
+        """Get account ID from account number, or None if it doesn't exist"""
+        try:
+            return self._get_account_id(account_number)
+        except AccountNotFoundError:
+            return None
+
+    @instrumented('create_account')
+    def create_account(self, account_holder, initial_deposit=0, email='', phone='', address=''):
+        """Open a new account and record its initial deposit"""
+        account_holder = (account_holder or '').strip()
+        if not account_holder:
+            raise BankingError("Account holder name is required")
+        initial_deposit = parse_amount(initial_deposit, allow_zero=True)
+
+        # Allocated numbers are unique among themselves; the UNIQUE key only
+        # trips on a clash with a legacy randomly generated number
+        for _ in range(5):
+            account_number = self.allocator.allocate()[0]
+            try:
+                account_id = self.backend.insert_accounts(
+                    [(account_number, account_holder, email, phone, address, initial_deposit)])[0]
+                break
+            except DuplicateAccountNumberError:
+                pass
+        else:
+            raise BankingError("Could not allocate a unique account number")
+        if self.account_ids is not None:
+            self.account_ids.set(account_number, account_id)
+
+        return {
+            'account_id': account_id,
+            'account_number': account_number,
+            'account_holder': account_holder,
+            'balance': initial_deposit
+        }
+
+    @instrumented('create_accounts')
+    def create_accounts(self, accounts, chunk_size=1000):
+        """Open many accounts with one multi-row INSERT per chunk
+
+        ``accounts`` is an iterable of dicts with the keyword arguments of
+        create_account(). Returns the created accounts in input order.
+        """
+        created = []
+        accounts = iter(accounts)
+        while True:
+            chunk = list(islice(accounts, chunk_size))
+            if not chunk:
+                return created
+            rows = []
+            for spec in chunk:
+                account_holder = (spec.get('account_holder') or '').strip()
+                if not account_holder:
+                    raise BankingError("Account holder name is required")
+                rows.append((account_holder, spec.get('email', ''), spec.get('phone', ''), spec.get('address', ''),
+                             parse_amount(spec.get('initial_deposit', 0), allow_zero=True)))
+            numbers = self.allocator.allocate(len(rows))
+
+            try:
+                account_ids = self.backend.insert_accounts([(number,) + row for number, row in zip(numbers, rows)])
+            except DuplicateAccountNumberError:
+                # A legacy number got in the way; let create_account retry each row
+                for account_holder, email, phone, address, initial_deposit in rows:
+                    created.append(self.create_account(account_holder, initial_deposit, email, phone, address))
+                continue
+
+            created.extend({
+                'account_id': account_id,
+                'account_number': number,
+                'account_holder': row[0],
+                'balance': row[4]
+            } for account_id, number, row in zip(account_ids, numbers, rows))
+
+    @instrumented('deposit')
+    def deposit(self, account_number, amount, description=None, request_id=None):
+        """Deposit money into an account and return the new balance
+
+        ``transaction_id`` is the new ledger row, or None when the deposit
+        went through group commit. A repeated ``request_id`` returns the
+        original balance and transaction_id without posting again.
+        """
+        amount = parse_amount(amount)
+        account_id = self._get_account_id(account_number)
+        transaction_id = None
+        try:
+            if self.group_commit is not None and request_id is None:
+                balance = self.group_commit.submit(account_id, account_number, 'deposit', amount, description)
+            else:
+                balance, transaction_id = self.backend.deposit(account_id, account_number, amount, description,
+                                                               request_id)
+        finally:
+            self._invalidate_balance(account_number)
+        return {'account_number': account_number, 'amount': amount, 'balance': balance,
+                'transaction_id': transaction_id}
+
+    @instrumented('withdraw')
+    def withdraw(self, account_number, amount, description=None, request_id=None):
+        """Withdraw money from an account and return the new balance
+
+        ``transaction_id`` and ``request_id`` work as for deposit(). A
+        withdrawal refused for insufficient funds can be retried under the
+        same ID. Raises VelocityLimitError, posting nothing, when the
+        withdrawal would break a velocity rule.
+        """
+        amount = parse_amount(amount)
+        account_id = self._get_account_id(account_number)
+        transaction_id = None
+        hold = self._reserve_velocity(account_id, account_number, 'withdrawal', amount, request_id)
+        try:
+            if self.group_commit is not None and request_id is None:
+                new_balance = self.group_commit.submit(account_id, account_number, 'withdrawal', amount,
+                                                       description)
+            else:
+                new_balance, transaction_id = self.backend.withdraw(account_id, account_number, amount,
+                                                                    description, request_id)
+        except BaseException:
+            self._release_velocity(hold)
+            raise
+        finally:
+            self._invalidate_balance(account_number)
+        return {'account_number': account_number, 'amount': amount, 'balance': new_balance,
+                'transaction_id': transaction_id}
+
+    def _reserve_velocity(self, account_id, account_number, transaction_type, amount, request_id=None):
+        """Count an outgoing posting against the velocity rules, if any"""
+        if self.velocity is None:
+            return None
+        return self.velocity.reserve(account_id, account_number, transaction_type, amount, request_id)
+
+    def _release_velocity(self, hold):
+        if self.velocity is not None:
+            self.velocity.release(hold)
+
+    def velocity_stats(self):
+        """Return the velocity guard's decision counters"""
+        return self.velocity.stats() if self.velocity is not None else {}
+
+    def purge_request_keys(self, retention=REQUEST_KEY_RETENTION):
+        """Forget request IDs older than ``retention`` seconds; run periodically
+
+        Returns the number of keys removed.
+        """
+        return self.backend.purge_request_keys(retention)
+
+    @instrumented('transfer')
+    def transfer(self, from_account_number, to_account_number, amount, description=None):
+        """Move money between two accounts in one transaction
+
+        Each side gets a 'transfer' ledger row: negative on the source
+        account, positive on the target. Velocity rules apply to the
+        source account.
+        """
+        amount = parse_amount(amount)
+        if from_account_number == to_account_number:
+            raise BankingError("Cannot transfer to the same account")
+        from_id = self._get_account_id(from_account_number)
+        to_id = self._get_account_id(to_account_number)
+
+        hold = self._reserve_velocity(from_id, from_account_number, 'transfer', amount)
+        try:
+            from_balance, to_balance = self.backend.transfer(from_id, from_account_number, to_id,
+                                                             to_account_number, amount, description)
+        except BaseException:
+            self._release_velocity(hold)
+            raise
+        finally:
+            self._invalidate_balance(from_account_number, to_account_number)
+        return {
+            'from_account_number': from_account_number,
+            'to_account_number': to_account_number,
+            'amount': amount,
+            'from_balance': from_balance,
+            'to_balance': to_balance
+        }
+
+    @instrumented('get_balance')
+    def get_balance(self, account_number):
+        """Return account number, holder, status and balance"""
+        version = None
+        if self.balances is not None:
+            account = self.balances.get(account_number)
+            if account is not None:
+                return dict(account)
+            version = self.balances.version(account_number)
+
+        account = self.backend.get_account(account_number)
+
+        if self.balances is not None:
+            self.balances.set(account_number, dict(account), version)
+        return account
+
+    @instrumented('get_transaction_page')
+    def get_transaction_page(self, account_number, after=None, limit=50,
+                             start_date=None, end_date=None, transaction_types=None, include_archived=False):
+        """Return one page of transactions, newest first
+
+        ``after`` is the ``next_cursor`` of the previous page, a
+        (transaction_date, transaction_id) pair; ``next_cursor`` is None on
+        the last page. ``start_date`` is inclusive, ``end_date`` exclusive.
+        ``include_archived`` also reads months moved out by bank_archive.
+        """
+        account_id, account_holder = self.backend.get_account_holder(account_number)
+        transactions = self.backend.history_page(account_id, after, limit, start_date, end_date,
+                                                 transaction_types, include_archived)
+        return {
+            'account_number': account_number,
+            'account_holder': account_holder,
+            'transactions': transactions,
+            'next_cursor': next_page_cursor(transactions, limit)
+        }
+
+    def iter_transactions(self, account_number, page_size=500,
+                          start_date=None, end_date=None, transaction_types=None, include_archived=False):
+        """Stream an account's transactions newest first, one page at a time
+
+        Only one page is held in memory and no connection stays checked out
+        between pages, so arbitrarily long histories can be consumed slowly.
+        """
+        account_id = self._get_account_id(account_number)
+        after = None
+        while True:
+            page = self.backend.history_page(account_id, after, page_size, start_date, end_date,
+                                             transaction_types, include_archived)
+            yield from page
+            after = next_page_cursor(page, page_size)
+            if after is None:
+                return
+
+    @instrumented('get_transaction_totals')
+    def get_transaction_totals(self, account_number, start_date=None, end_date=None, transaction_types=None,
+                               include_archived=False):
+        """Aggregate deposits and withdrawals without fetching rows"""
+        account_id = self._get_account_id(account_number)
+        transaction_count, total_deposits, total_withdrawals = self.backend.transaction_totals(
+            account_id, start_date, end_date, transaction_types, include_archived)
+        return {
+            'account_number': account_number,
+            'transaction_count': transaction_count,
+            'total_deposits': total_deposits,
+            'total_withdrawals': total_withdrawals
+        }
+
+    @instrumented('get_transaction_history')
+    def get_transaction_history(self, account_number, limit=10, include_archived=False):
+        """Return the most recent transactions with deposit/withdrawal totals
+
+        ``limit=None`` returns the full history; use iter_transactions() to
+        stream long histories instead of loading them into a list.
+        """
+        if limit:
+            page = self.get_transaction_page(account_number, limit=limit, include_archived=include_archived)
+            account_holder = page['account_holder']
+            transactions = page['transactions']
+        else:
+            account_holder = self.get_balance(account_number)['account_holder']
+            transactions = list(self.iter_transactions(account_number, include_archived=include_archived))
+
+        totals = TransactionTotals()
+        totals.add_many(transactions)
+
+        return {
+            'account_number': account_number,
+            'account_holder': account_holder,
+            'transactions': transactions,
+            'total_deposits': totals.total_deposits,
+            'total_withdrawals': totals.total_withdrawals
+        }
+
+    @instrumented('get_all_accounts')
+    def get_all_accounts(self):
+        """Return every account (newest first) and the total bank balance"""
+        accounts = self.backend.list_accounts()
+        return {'accounts': accounts, 'total_balance': total(account['balance'] for account in accounts)}
@@ -0,0 +1,283 @@
+import argparse
+import datetime
+import sys
+
+from bank_db import load_database_config
+from bank_money import Money
+from bank_service import BankingService, BankingError, AccountNotFoundError
+
+
+# Signed effect of a ledger row on the balance, and its deposit/withdrawal
+# split, matching TransactionTotals in bank_service
+NET_CHANGE_SQL = "CASE WHEN transaction_type = 'withdrawal' THEN -amount ELSE amount END"
+DEPOSITS_SQL = ("CASE WHEN transaction_type IN ('deposit', 'account_creation') "
+                "OR (transaction_type = 'transfer' AND amount > 0) THEN amount ELSE 0 END")
+WITHDRAWALS_SQL = ("CASE WHEN transaction_type = 'withdrawal' THEN amount "
+                   "WHEN transaction_type = 'transfer' AND amount < 0 THEN -amount ELSE 0 END")
+
+
+def _money_columns(day):
+    """Convert the DECIMAL sums of a summary row to Money"""
+    for column in ('deposits', 'withdrawals', 'net_change'):
+        day[column] = Money.from_decimal(day[column])
+    return day
+
+
+class SnapshotStore:
+    """Per-account and bank-wide daily summaries built from the ledger
+
+    ``daily_balances`` holds one row per account per day with activity and
+    ``daily_totals`` one row per day for the whole bank. refresh() folds
+    new ``transactions`` rows into them, tracking its position in
+    ``snapshot_state``. Balances as of any date are sums over the daily
+    rows plus the few ledger rows newer than the last refresh, so reports
+    read O(days) rows however long the history is.
+    """
+
+    def __init__(self, service, chunk_size=50000, settle_seconds=60):
+        if service.pool is None:
+            raise BankingError("Daily snapshots require the MySQL storage backend")
+        self.service = service
+        self.pool = service.pool
+        self.chunk_size = chunk_size
+        # Rows younger than this are left for the next refresh, so a
+        # transaction that commits late with a lower ID is not skipped
+        self.settle_seconds = settle_seconds
+
+    def _account_id(self, account_number):
+        account_id = self.service.get_account_id(account_number)
+        if not account_id:
+            raise AccountNotFoundError(account_number)
+        return account_id
+
+    def refresh(self):
+        """Fold all settled new transactions into the summaries
+
+        Returns the number of ledger rows processed.
+        """
+        processed = 0
+        while True:
+            count = self.pool.run_transaction(self._refresh_chunk)
+            processed += count
+            if count < self.chunk_size:
+                return processed
+
+    def _refresh_chunk(self, conn):
+        """Summarise the next chunk of transactions in one transaction"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT last_transaction_id FROM snapshot_state WHERE snapshot_id = 1 FOR UPDATE")
+            last_id = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT transaction_id, transaction_date < NOW() - INTERVAL %s SECOND
+                FROM transactions
+                WHERE transaction_id > %s
+                ORDER BY transaction_id
+                LIMIT %s
+            """, (self.settle_seconds, last_id, self.chunk_size))
+
+            upper_id = last_id
+            count = 0
+            for transaction_id, settled in cursor.fetchall():
+                if not settled:
+                    break
+                upper_id = transaction_id
+                count += 1
+            if not count:
+                return 0
+
+            cursor.execute(f"""
+                INSERT INTO daily_balances
+                    (account_id, balance_date, net_change, deposits, withdrawals, transaction_count)
+                SELECT * FROM (
+                    SELECT account_id, DATE(transaction_date) AS balance_date,
+                           SUM({NET_CHANGE_SQL}) AS net_change,
+                           SUM({DEPOSITS_SQL}) AS deposits,
+                           SUM({WITHDRAWALS_SQL}) AS withdrawals,
+                           COUNT(*) AS transaction_count
+                    FROM transactions
+                    WHERE transaction_id > %s AND transaction_id <= %s
+                    GROUP BY account_id, DATE(transaction_date)
+                ) AS new
+                ON DUPLICATE KEY UPDATE
+                    net_change = daily_balances.net_change + new.net_change,
+                    deposits = daily_balances.deposits + new.deposits,
+                    withdrawals = daily_balances.withdrawals + new.withdrawals,
+                    transaction_count = daily_balances.transaction_count + new.transaction_count
+            """, (last_id, upper_id))
+
+            cursor.execute(f"""
+                INSERT INTO daily_totals
+                    (balance_date, net_change, deposits, withdrawals, transaction_count)
+                SELECT * FROM (
+                    SELECT DATE(transaction_date) AS balance_date,
+                           SUM({NET_CHANGE_SQL}) AS net_change,
+                           SUM({DEPOSITS_SQL}) AS deposits,
+                           SUM({WITHDRAWALS_SQL}) AS withdrawals,
+                           COUNT(*) AS transaction_count
+                    FROM transactions
+                    WHERE transaction_id > %s AND transaction_id <= %s
+                    GROUP BY DATE(transaction_date)
+                ) AS new
+                ON DUPLICATE KEY UPDATE
+                    net_change = daily_totals.net_change + new.net_change,
+                    deposits = daily_totals.deposits + new.deposits,
+                    withdrawals = daily_totals.withdrawals + new.withdrawals,
+                    transaction_count = daily_totals.transaction_count + new.transaction_count
+            """, (last_id, upper_id))
+
+            cursor.execute("UPDATE snapshot_state SET last_transaction_id = %s WHERE snapshot_id = 1", (upper_id,))
+        finally:
+            cursor.close()
+        return count
+
+    def balance_as_of(self, account_number, as_of_date=None):
+        """Return an account's closing balance at the end of ``as_of_date``"""
+        account_id = self._account_id(account_number)
+        as_of_date = as_of_date or datetime.date.today()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"""
+                    SELECT
+                        (SELECT COALESCE(SUM(net_change), 0)
+                         FROM daily_balances
+                         WHERE account_id = %s AND balance_date <= %s)
+                      + (SELECT COALESCE(SUM({NET_CHANGE_SQL}), 0)
+                         FROM transactions
+                         WHERE account_id = %s
+                           AND transaction_id > (SELECT last_transaction_id FROM snapshot_state
+                                                 WHERE snapshot_id = 1)
+                           AND transaction_date < %s)
+                """, (account_id, as_of_date, account_id, as_of_date + datetime.timedelta(days=1)))
+                return Money.from_decimal(cursor.fetchone()[0])
+            finally:
+                cursor.close()
+
+    def statement(self, account_number, start_date, end_date):
+        """Return daily closing balances for an account between two dates
+
+        Only days with activity are listed, each with its deposits,
+        withdrawals and closing balance; ``opening_balance`` is the balance
+        at the end of the day before ``start_date``. Both dates are
+        inclusive and only refreshed data is used.
+        """
+        account_id = self._account_id(account_number)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT COALESCE(SUM(net_change), 0) AS opening_balance
+                    FROM daily_balances
+                    WHERE account_id = %s AND balance_date < %s
+                """, (account_id, start_date))
+                opening_balance = Money.from_decimal(cursor.fetchone()['opening_balance'])
+                cursor.execute("""
+                    SELECT balance_date, deposits, withdrawals, net_change, transaction_count
+                    FROM daily_balances
+                    WHERE account_id = %s AND balance_date BETWEEN %s AND %s
+                    ORDER BY balance_date
+                """, (account_id, start_date, end_date))
+                days = [_money_columns(day) for day in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+        closing_balance = opening_balance
+        for day in days:
+            closing_balance += day['net_change']
+            day['closing_balance'] = closing_balance
+        return {
+            'account_number': account_number,
+            'opening_balance': opening_balance,
+            'closing_balance': closing_balance,
+            'days': days
+        }
+
+    def bank_total(self, as_of_date=None):
+        """Return the total balance held by the bank at the end of a date
+
+        Without a date this is the current total, including transactions
+        that have not been refreshed into the summaries yet.
+        """
+        day_filter = ""
+        tail_filter = ""
+        params = ()
+        if as_of_date is not None:
+            day_filter = " WHERE balance_date <= %s"
+            tail_filter = " AND transaction_date < %s"
+            params = (as_of_date, as_of_date + datetime.timedelta(days=1))
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"""
+                    SELECT
+                        (SELECT COALESCE(SUM(net_change), 0) FROM daily_totals{day_filter})
+                      + (SELECT COALESCE(SUM({NET_CHANGE_SQL}), 0)
+                         FROM transactions
+                         WHERE transaction_id > (SELECT last_transaction_id FROM snapshot_state
+                                                 WHERE snapshot_id = 1){tail_filter})
+                """, params)
+                return Money.from_decimal(cursor.fetchone()[0])
+            finally:
+                cursor.close()
+
+    def daily_totals(self, start_date, end_date):
+        """Return bank-wide deposits, withdrawals and closing totals per day"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT COALESCE(SUM(net_change), 0) AS opening FROM daily_totals WHERE balance_date < %s",
+                               (start_date,))
+                closing_total = Money.from_decimal(cursor.fetchone()['opening'])
+                cursor.execute("""
+                    SELECT balance_date, deposits, withdrawals, net_change, transaction_count
+                    FROM daily_totals
+                    WHERE balance_date BETWEEN %s AND %s
+                    ORDER BY balance_date
+                """, (start_date, end_date))
+                days = [_money_columns(day) for day in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+        for day in days:
+            closing_total += day['net_change']
+            day['closing_total'] = closing_total
+        return days
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    """Command-line entry point for snapshot maintenance and reports"""
+    parser = argparse.ArgumentParser(description="Daily balance snapshots")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('refresh', help="fold new transactions into the daily summaries")
+    balance = commands.add_parser('balance', help="balance of an account as of a date")
+    balance.add_argument('account_number')
+    balance.add_argument('date', nargs='?', type=_parse_date)
+    total = commands.add_parser('total', help="total bank balance as of a date")
+    total.add_argument('date', nargs='?', type=_parse_date)
+    args = parser.parse_args(argv)
+
+    service = BankingService.from_config(load_database_config(), pool_size=1)
+    snapshots = SnapshotStore(service)
+    try:
+        if args.command == 'refresh':
+            print(f"✓ {snapshots.refresh()} transactions summarised")
+        elif args.command == 'balance':
+            amount = snapshots.balance_as_of(args.account_number, args.date)
+            print(f"Balance of {args.account_number} as of {args.date or datetime.date.today()}: ${amount:.2f}")
+        else:
+            print(f"Total Bank Balance: ${snapshots.bank_total(args.date):.2f}")
+    except AccountNotFoundError:
+        print("✗ Account not found!")
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bank_config import load_database_config
+from bank_errors import BankingError
+from bank_money import Money
+from bank_storage import TransactionTotals, open_backend
+
+
+FORMATS = ('csv', 'json', 'txt')
+CHECKPOINT_FILE = 'checkpoint.json'
+
+
+def net_cents(trans):
+    """Signed effect of a ledger row on the balance, in cents"""
+    cents = trans['amount'].cents
+    return -cents if trans['transaction_type'] == 'withdrawal' else cents
+
+
+def build_statement(account, transactions, start, end):
+    """Build one account's statement for the period [start, end)
+
+    ``transactions`` are the account's rows since ``start``, oldest first,
+    and ``account['balance']`` is its current balance. Rows after the
+    period only roll that balance back to the closing balance.
+    """
+    in_period = [trans for trans in transactions if trans['transaction_date'] < end]
+    closing = account['balance'].cents - sum(map(net_cents, transactions[len(in_period):]))
+    running = closing - sum(map(net_cents, in_period))
+    opening = running
+    lines = []
+    for trans in in_period:
+        running += net_cents(trans)
+        lines.append(dict(trans, balance=Money(running)))
+    totals = TransactionTotals()
+    totals.add_many(in_period)
+    return {
+        'account_number': account['account_number'],
+        'account_holder': account['account_holder'],
+        'period_start': start.date(),
+        'period_end': (end - datetime.timedelta(days=1)).date(),
+        'opening_balance': Money(opening),
+        'closing_balance': Money(closing),
+        'total_deposits': totals.total_deposits,
+        'total_withdrawals': totals.total_withdrawals,
+        'transactions': lines
+    }
+
+
+def _write_csv(statement, f):
+    writer = csv.writer(f)
+    writer.writerow(('date', 'transaction_id', 'type', 'amount', 'balance', 'description'))
+    writer.writerow((statement['period_start'], '', 'opening', '', statement['opening_balance'], "Opening balance"))
+    for trans in statement['transactions']:
+        writer.writerow((trans['transaction_date'].strftime("%Y-%m-%d %H:%M:%S"), trans['transaction_id'],
+                         trans['transaction_type'], trans['amount'], trans['balance'], trans['description'] or ''))
+    writer.writerow((statement['period_end'], '', 'closing', '', statement['closing_balance'], "Closing balance"))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _write_json(statement, f):
+    json.dump(statement, f, default=_json_default, indent=1)
+
+
+def _write_text(statement, f):
+    """Fixed-width 80-column layout, ready to print or convert to PDF"""
+    f.write("ACCOUNT STATEMENT\n")
+    f.write("=" * 80 + "\n")
+    f.write(f"Account Holder: {statement['account_holder']}\n")
+    f.write(f"Account Number: {statement['account_number']}\n")
+    f.write(f"Period: {statement['period_start']} to {statement['period_end']}\n")
+    f.write("-" * 80 + "\n")
+    f.write(f"{'Date':<20} {'Type':<16} {'Amount':>12} {'Balance':>12}  Description\n")
+    f.write("-" * 80 + "\n")
+    f.write(f"{str(statement['period_start']):<20} {'':<16} {'':>12} {statement['opening_balance']:>12.2f}  "
+            f"Opening balance\n")
+    for trans in statement['transactions']:
+        f.write(f"{trans['transaction_date'].strftime('%Y-%m-%d %H:%M:%S'):<20} "
+                f"{trans['transaction_type'].upper():<16} {trans['amount']:>12.2f} {trans['balance']:>12.2f}  "
+                f"{(trans['description'] or '')[:15]}\n")
+    f.write("-" * 80 + "\n")
+    f.write(f"Total Deposits: ${statement['total_deposits']:.2f}\n")
+    f.write(f"Total Withdrawals: ${statement['total_withdrawals']:.2f}\n")
+    f.write(f"Closing Balance: ${statement['closing_balance']:.2f}\n")
+
+
+WRITERS = {'csv': _write_csv, 'json': _write_json, 'txt': _write_text}
+
+
+def write_statement(statement, directory, fmt):
+    """Write one statement file, replacing it atomically"""
+    path = os.path.join(directory, f"{statement['account_number']}.{fmt}")
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', newline='', encoding='utf-8') as f:
+        WRITERS[fmt](statement, f)
+    os.replace(temp_path, path)
+    return path
+
+
+# Each worker process opens its own backend (and so its own connection)
+# once and reuses it for every slice it is given
+_worker_backend = None
+
+
+def _init_worker(db_config):
+    global _worker_backend
+    _worker_backend = open_backend(db_config, pool_size=1)
+
+
+def export_slice(job):
+    """Worker task: stream one account-ID slice and write its statements
+
+    Returns (slice_index, accounts_written, transactions_written).
+    """
+    index, first_id, last_id, start, end, fmt, directory, include_archived = job
+    accounts = transactions = 0
+    for account, rows in _worker_backend.iter_statement_data(first_id, last_id, start, include_archived):
+        statement = build_statement(account, rows, start, end)
+        write_statement(statement, directory, fmt)
+        accounts += 1
+        transactions += len(statement['transactions'])
+    return index, accounts, transactions
+
+
+class ExportProgress:
+    """Running totals for one export, passed to the progress callback"""
+
+    def __init__(self, slices_total, slices_done=0):
+        self.slices_total = slices_total
+        self.slices_done = slices_done
+        self.accounts = 0
+        self.transactions = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class StatementExporter:
+    """Write a statement file per account using a pool of worker processes
+
+    The account-ID range is cut into slices of ``slice_size`` IDs. Each
+    worker process streams a slice's accounts and ledger rows through its
+    own connection and writes the files, so throughput grows with the
+    number of workers until the database or disk saturates. Slices are
+    handed out as workers free up, so a slice of busy accounts does not
+    hold the others back.
+
+    ``checkpoint.json`` in the output directory records the export's
+    parameters and finished slices. Running the same export again skips
+    those slices. Statement files are written atomically, so a slice cut
+    short by a crash is simply written again.
+    """
+
+    def __init__(self, db_config, start_date, end_date, directory, fmt='csv', workers=None, slice_size=1000,
+                 include_archived=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown statement format: {fmt!r}")
+        if db_config.get('backend', 'mysql') == 'memory':
+            raise BankingError("Statement export needs a database the worker processes can share")
+        if end_date < start_date:
+            raise BankingError("The statement period ends before it starts")
+        self.db_config = db_config
+        self.start = datetime.datetime.combine(start_date, datetime.time())
+        self.end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time())
+        self.directory = directory
+        self.fmt = fmt
+        self.workers = workers or os.cpu_count() or 1
+        self.slice_size = slice_size
+        self.include_archived = include_archived
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+
+    def _load_checkpoint(self, params):
+        """Return the finished slice indexes, or an empty set for a new export"""
+        if not os.path.exists(self.checkpoint_path):
+            return params, set()
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            saved = json.load(f)
+        done = set(saved.pop('done'))
+        # Resume with the saved account bounds so slices line up with the first run
+        saved_bounds = (saved.pop('first_id'), saved.pop('last_id'))
+        if saved != {key: value for key, value in params.items() if key not in ('first_id', 'last_id')}:
+            raise BankingError(f"{self.checkpoint_path} belongs to a different export; "
+                               f"use another directory or delete it")
+        return dict(params, first_id=saved_bounds[0], last_id=saved_bounds[1]), done
+
+    def _save_checkpoint(self, params, done):
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(params, done=sorted(done)), f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def run(self, on_progress=None):
+        """Export every account's statement and return the final ExportProgress
+
+        ``on_progress(ExportProgress)`` is called after each finished slice.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        backend = open_backend(self.db_config, pool_size=1)
+        try:
+            first_id, last_id = backend.account_id_bounds()
+        finally:
+            backend.close()
+
+        params = {'start': self.start.isoformat(), 'end': self.end.isoformat(), 'format': self.fmt,
+                  'slice_size': self.slice_size, 'include_archived': self.include_archived,
+                  'first_id': first_id, 'last_id': last_id}
+        params, done = self._load_checkpoint(params)
+        first_id, last_id = params['first_id'], params['last_id']
+        if first_id is None:
+            return ExportProgress(0)
+
+        slices = [(index, low, min(low + self.slice_size - 1, last_id))
+                  for index, low in enumerate(range(first_id, last_id + 1, self.slice_size))]
+        progress = ExportProgress(len(slices), len(done))
+        jobs = [(index, low, high, self.start, self.end, self.fmt, self.directory, self.include_archived)
+                for index, low, high in slices if index not in done]
+        if not jobs:
+            return progress
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), mp_context=context,
+                                 initializer=_init_worker, initargs=(self.db_config,)) as pool:
+            futures = [pool.submit(export_slice, job) for job in jobs]
+            for future in as_completed(futures):
+                index, accounts, transactions = future.result()
+                done.add(index)
+                self._save_checkpoint(params, done)
+                progress.slices_done += 1
+                progress.accounts += accounts
+                progress.transactions += transactions
+                if on_progress:
+                    on_progress(progress)
+        return progress
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    """Command-line entry point for statement export"""
+    parser = argparse.ArgumentParser(description="Write a statement file for every account")
+    parser.add_argument('start_date', type=_parse_date, help="first day of the period")
+    parser.add_argument('end_date', type=_parse_date, help="last day of the period (inclusive)")
+    parser.add_argument('--output', default='statements', help="directory for statement files")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="worker processes, each with its own connection (default: CPU count)")
+    parser.add_argument('--slice-size', type=int, default=1000, help="account IDs per work unit")
+    parser.add_argument('--include-archived', action='store_true',
+                        help="also read months moved out by bank_archive")
+    args = parser.parse_args(argv)
+
+    exporter = StatementExporter(load_database_config(), args.start_date, args.end_date, args.output,
+                                 fmt=args.format, workers=args.workers, slice_size=args.slice_size,
+                                 include_archived=args.include_archived)
+
+    def on_progress(progress):
+        rate = progress.accounts / progress.elapsed if progress.elapsed else 0
+        print(f"  {progress.slices_done}/{progress.slices_total} slices, {progress.accounts} accounts, "
+              f"{progress.transactions} transactions ({rate:.0f} accounts/s)")
+
+    try:
+        progress = exporter.run(on_progress)
+    except BankingError as e:
+        print(f"✗ {e}")
+        return 1
+    print(f"\n✓ Statements written to {args.output}: {progress.accounts} accounts in {progress.elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1713 @@
+import datetime
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from bank_errors import (BankingError, AccountNotFoundError, InsufficientFundsError, DuplicateAccountNumberError,
+                         RequestKeyConflictError)
+from bank_money import Money
+
+
+ACCOUNT_COLUMNS = ('account_number', 'account_holder', 'balance', 'status')
+LISTING_COLUMNS = ('account_number', 'account_holder', 'balance', 'status', 'created_at')
+HISTORY_COLUMNS = ('transaction_id', 'transaction_type', 'amount', 'description', 'transaction_date')
+STATEMENT_ACCOUNT_COLUMNS = ('account_id', 'account_number', 'account_holder', 'balance')
+
+
+# MySQL reads DECIMAL(15,2) money columns as integer cents
+BALANCE_CENTS = "CAST(balance * 100 AS SIGNED)"
+AMOUNT_CENTS = "CAST(amount * 100 AS SIGNED)"
+# Net effect of a group of ledger rows on the balance, in cents
+NET_CENTS = "CAST(SUM(CASE WHEN transaction_type = 'withdrawal' THEN -amount ELSE amount END) * 100 AS SIGNED)"
+
+DEPOSIT_TYPES = frozenset(('deposit', 'account_creation'))
+
+
+def is_outflow(transaction_type, cents):
+    """Whether a ledger row takes money out of its account"""
+    return transaction_type == 'withdrawal' or (transaction_type == 'transfer' and cents < 0)
+
+# How long a request ID keeps protecting against a repeat; clients must
+# not retry a request for longer than this
+REQUEST_KEY_RETENTION = 24 * 3600
+
+
+def request_key(request_id):
+    """Return the 16-byte digest stored for a client request ID"""
+    return hashlib.blake2b(str(request_id).encode('utf-8'), digest_size=16).digest()
+
+
+class TransactionTotals:
+    """Deposit and withdrawal totals accumulated one transaction at a time
+
+    Sums are kept in integer cents, so they stay exact however many rows
+    are added.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.deposit_cents = 0
+        self.withdrawal_cents = 0
+
+    def add(self, trans):
+        """Count one transaction row"""
+        self.add_many((trans,))
+
+    def add_many(self, transactions):
+        """Count a batch of transaction rows, such as one history page"""
+        count = deposits = withdrawals = 0
+        for trans in transactions:
+            count += 1
+            cents = trans['amount'].cents
+            transaction_type = trans['transaction_type']
+            if transaction_type in DEPOSIT_TYPES:
+                deposits += cents
+            elif transaction_type == 'withdrawal':
+                withdrawals += cents
+            elif transaction_type == 'transfer':
+                if cents >= 0:
+                    deposits += cents
+                else:
+                    withdrawals -= cents
+        self.count += count
+        self.deposit_cents += deposits
+        self.withdrawal_cents += withdrawals
+
+    @property
+    def total_deposits(self):
+        return Money(self.deposit_cents)
+
+    @property
+    def total_withdrawals(self):
+        return Money(self.withdrawal_cents)
+
+    @property
+    def net_change(self):
+        return Money(self.deposit_cents - self.withdrawal_cents)
+
+
+class StorageBackend:
+    """Interface between BankingService and a storage engine
+
+    Each method is one atomic unit of work. Amounts are Money values and
+    account IDs are the backend's own keys, resolved through
+    lookup_account_id().
+    """
+
+    name = None
+
+    def setup(self):
+        """Create or upgrade the schema"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections and other resources"""
+
+    def reserve_account_numbers(self, count):
+        """Claim ``count`` consecutive sequence values and return the first"""
+        raise NotImplementedError
+
+    def insert_accounts(self, rows):
+        """Insert (number, holder, email, phone, address, deposit) rows
+
+        Records each initial deposit in the ledger and returns the new
+        account IDs in order. Raises DuplicateAccountNumberError, inserting
+        nothing, if any number is taken.
+        """
+        raise NotImplementedError
+
+    def lookup_account_id(self, account_number):
+        raise NotImplementedError
+
+    def get_account(self, account_number):
+        """Return account_number, account_holder, balance and status"""
+        raise NotImplementedError
+
+    def get_account_holder(self, account_number):
+        """Return (account_id, account_holder)"""
+        raise NotImplementedError
+
+    def deposit(self, account_id, account_number, amount, description=None, request_id=None):
+        """Credit an account and return (new balance, transaction_id)
+
+        With a ``request_id`` already used for the same posting, nothing is
+        posted and the original result is returned. Raises
+        RequestKeyConflictError if it was used for a different posting.
+        """
+        raise NotImplementedError
+
+    def withdraw(self, account_id, account_number, amount, description=None, request_id=None):
+        """Debit an account if funds allow and return (new balance, transaction_id)
+
+        ``request_id`` works as for deposit(). A rejected withdrawal is not
+        recorded, so it can be retried under the same ID.
+        """
+        raise NotImplementedError
+
+    def purge_request_keys(self, retention=REQUEST_KEY_RETENTION):
+        """Forget request IDs older than ``retention`` seconds and return how many"""
+        raise NotImplementedError
+
+    def transfer(self, from_id, from_number, to_id, to_number, amount, description=None):
+        """Move money between accounts and return both new balances"""
+        raise NotImplementedError
+
+    def apply_postings(self, postings):
+        """Apply many deposits and withdrawals in one transaction
+
+        ``postings`` is a list of (account_id, account_number,
+        transaction_type, amount, description) applied in order. Returns
+        one result per posting: the account's new balance, or the
+        exception to raise for that posting alone (insufficient funds,
+        unknown account). Used by bank_group_commit.
+        """
+        raise NotImplementedError
+
+    def history_page(self, account_id, after=None, limit=50, start_date=None, end_date=None,
+                     transaction_types=None, include_archived=False):
+        """Return up to ``limit`` transactions newest first, after a keyset cursor
+
+        ``include_archived`` also reads months moved out of the hot table
+        by bank_archive; backends without an archive ignore it.
+        """
+        raise NotImplementedError
+
+    def transaction_totals(self, account_id, start_date=None, end_date=None, transaction_types=None,
+                           include_archived=False):
+        """Return (transaction_count, total_deposits, total_withdrawals)"""
+        raise NotImplementedError
+
+    def list_accounts(self):
+        """Return every account, newest first"""
+        raise NotImplementedError
+
+    def account_id_bounds(self):
+        """Return the lowest and highest account IDs, or (None, None) with no accounts"""
+        raise NotImplementedError
+
+    def ledger_id_bounds(self):
+        """Return the lowest and highest transaction IDs, or (None, None) for an empty ledger
+
+        Covers archived months too. Raises BankingError while any month is
+        archived only to a file, since its rows cannot be read.
+        """
+        raise NotImplementedError
+
+    def ledger_net_changes(self, first_id, last_id):
+        """Return {account_id: net change in cents} of the ledger rows with IDs in a range
+
+        Reads the hot and archive tables. Used by bank_ledger to replay
+        balances from the ledger.
+        """
+        raise NotImplementedError
+
+    def reconcile_balances(self, first_id, last_id, replayed, high_water, repair=False):
+        """Compare the stored balances of an account-ID range with the ledger
+
+        ``replayed`` maps account_id to the net of its ledger rows up to
+        transaction ``high_water``. Rows after it are added here, in the
+        same transaction that reads the balances. Returns the number of
+        accounts checked and a list of (account_id, account_number, stored
+        cents, ledger cents) for each that disagrees; with ``repair`` their
+        balances are reset to the ledger's.
+        """
+        raise NotImplementedError
+
+    def ledger_rows(self, after_id, limit):
+        """Return up to ``limit`` ledger rows after a transaction_id, in ID order
+
+        Rows are (transaction_id, account_id, transaction_type, amount
+        cents, transaction_date), read from the hot and archive tables.
+        Used by bank_analytics to extract the ledger incrementally.
+        """
+        raise NotImplementedError
+
+    def account_rows(self, after_id, limit):
+        """Return up to ``limit`` accounts after an account_id, in ID order
+
+        Rows are (account_id, account_number, account_holder, status,
+        created_at).
+        """
+        raise NotImplementedError
+
+    def recent_outflows(self, since, after_id, limit):
+        """Return up to ``limit`` withdrawals and outgoing transfers posted since a time
+
+        Rows are (transaction_id, account_id, transaction_type, amount
+        cents as a positive number, transaction_date) after a
+        transaction_id, in ID order, from the hot table only. Used to warm
+        bank_velocity's counters.
+        """
+        raise NotImplementedError
+
+    def recent_request_keys(self, since, after_id, limit):
+        """Return up to ``limit`` keyed withdrawals recorded since a time
+
+        Rows are (transaction_id, account_id, request_key) after a
+        transaction_id, in ID order. bank_velocity remembers the keys so a
+        retry after a restart is not counted again.
+        """
+        raise NotImplementedError
+
+    def iter_statement_data(self, first_id, last_id, since, include_archived=False):
+        """Yield (account, transactions) for each account with an ID in a range
+
+        ``account`` holds account_id, account_number, account_holder and
+        the current balance. ``transactions`` are its ledger rows dated on
+        or after ``since``, oldest first. Accounts and ledger come from one
+        consistent read and the ledger is streamed, so only one account's
+        rows are held at a time. Used by bank_statements.
+        """
+        raise NotImplementedError
+
+
+class Query:
+    """One statement of a transaction plan and what to read back from it
+
+    ``fetch`` is None, 'one', 'all', 'rowcount' or 'lastrowid'.
+    """
+
+    __slots__ = ('sql', 'params', 'fetch')
+
+    def __init__(self, sql, params=(), fetch=None):
+        self.sql = sql
+        self.params = params
+        self.fetch = fetch
+
+
+def run_plan(cursor, plan):
+    """Drive a transaction plan on a blocking DB-API cursor
+
+    A plan is a generator that yields Query objects, receives each result
+    and returns the operation's result. The same plans are driven by the
+    asyncio front end, so both paths issue identical statements and make
+    identical decisions.
+    """
+    try:
+        query = next(plan)
+        while True:
+            cursor.execute(query.sql, query.params)
+            if query.fetch == 'one':
+                result = cursor.fetchone()
+            elif query.fetch == 'all':
+                result = cursor.fetchall()
+            elif query.fetch == 'rowcount':
+                result = cursor.rowcount
+            elif query.fetch == 'lastrowid':
+                result = cursor.lastrowid
+            else:
+                result = None
+            query = plan.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def history_filters(start_date=None, end_date=None, transaction_types=None, placeholder='%s'):
+    """Build the extra WHERE clause for date-range and type filters"""
+    where = ""
+    params = []
+    if start_date:
+        where += f" AND transaction_date >= {placeholder}"
+        params.append(start_date)
+    if end_date:
+        where += f" AND transaction_date < {placeholder}"
+        params.append(end_date)
+    if transaction_types:
+        types = [transaction_types] if isinstance(transaction_types, str) else list(transaction_types)
+        where += f" AND transaction_type IN ({', '.join([placeholder] * len(types))})"
+        params.extend(types)
+    return where, params
+
+
+def account_id_plan(account_number):
+    """Resolve an account number to its account_id"""
+    row = yield Query("SELECT account_id FROM accounts WHERE account_number = %s", (account_number,), 'one')
+    if not row:
+        raise AccountNotFoundError(account_number)
+    return row[0]
+
+
+def account_holder_plan(account_number):
+    """Resolve an account number to (account_id, account_holder)"""
+    row = yield Query("SELECT account_id, account_holder FROM accounts WHERE account_number = %s",
+                      (account_number,), 'one')
+    if not row:
+        raise AccountNotFoundError(account_number)
+    return row[0], row[1]
+
+
+def balance_plan(account_number):
+    """Read an account's number, holder, balance and status"""
+    row = yield Query(f"""
+        SELECT account_number, account_holder, {BALANCE_CENTS}, status
+        FROM accounts
+        WHERE account_number = %s
+    """, (account_number,), 'one')
+    if not row:
+        raise AccountNotFoundError(account_number)
+    return dict(zip(ACCOUNT_COLUMNS, (row[0], row[1], Money(row[2]), row[3])))
+
+
+def posting_plan(account_id, account_number, transaction_type, amount, description, request_id=None):
+    """Post one deposit or withdrawal in a single round trip
+
+    The bank_post procedure (migrations 5 and 7) locks the account, checks
+    the request key and funds, updates the balance, writes the ledger row
+    and commits, then returns the outcome. The caller must not send its
+    own COMMIT. Returns (new balance, transaction_id); for a repeated
+    request that is the result of the first attempt.
+    """
+    key = request_key(request_id) if request_id is not None else None
+    status, cents, transaction_id = yield Query("CALL bank_post(%s, %s, %s, %s, %s)",
+                                                (account_id, transaction_type, amount.cents, description, key),
+                                                'one')
+    if status == 'not_found':
+        raise AccountNotFoundError(account_number)
+    if status == 'insufficient_funds':
+        raise InsufficientFundsError(account_number, Money(cents), amount)
+    if status == 'key_conflict':
+        raise RequestKeyConflictError(request_id)
+    return Money(cents), transaction_id
+
+
+def deposit_plan(account_id, account_number, amount, description=None, request_id=None):
+    """Credit an account and return (new balance, transaction_id)"""
+    return posting_plan(account_id, account_number, 'deposit', amount, description or "Cash deposit", request_id)
+
+
+def withdraw_plan(account_id, account_number, amount, description=None, request_id=None):
+    """Debit an account if funds allow and return (new balance, transaction_id)
+
+    The funds check runs against the locked row inside the procedure, so
+    two concurrent withdrawals can never both pass it.
+    """
+    return posting_plan(account_id, account_number, 'withdrawal', amount, description or "Cash withdrawal",
+                        request_id)
+
+
+def purge_request_keys_plan(retention, chunk_size):
+    """Delete one chunk of expired request keys and return how many went"""
+    return (yield Query("""
+        DELETE FROM posting_requests
+        WHERE created_at < NOW() - INTERVAL %s SECOND
+        LIMIT %s
+    """, (retention, chunk_size), 'rowcount'))
+
+
+def transfer_plan(from_id, from_number, to_id, to_number, amount, description=None):
+    """Move money between two accounts and return both new balances
+
+    Both rows are locked in account_id order, so transfers in opposite
+    directions cannot deadlock each other. Each side gets a 'transfer'
+    ledger row: negative on the source account, positive on the target.
+    """
+    rows = yield Query(f"""
+        SELECT account_id, {BALANCE_CENTS}
+        FROM accounts
+        WHERE account_id IN (%s, %s)
+        ORDER BY account_id
+        FOR UPDATE
+    """, (from_id, to_id), 'all')
+    balances = {account_id: Money(cents) for account_id, cents in rows}
+    # An account can be deleted between the ID lookup and this lock
+    for account_id, account_number in ((from_id, from_number), (to_id, to_number)):
+        if account_id not in balances:
+            raise AccountNotFoundError(account_number)
+    if balances[from_id] < amount:
+        raise InsufficientFundsError(from_number, balances[from_id], amount)
+
+    yield Query("UPDATE accounts SET balance = balance - %s / 100 WHERE account_id = %s", (amount.cents, from_id))
+    yield Query("UPDATE accounts SET balance = balance + %s / 100 WHERE account_id = %s", (amount.cents, to_id))
+    yield Query("""
+        INSERT INTO transactions (account_id, transaction_type, amount, description)
+        VALUES (%s, 'transfer', %s / 100, %s), (%s, 'transfer', %s / 100, %s)
+    """, (from_id, -amount.cents, description or f"Transfer to {to_number}",
+          to_id, amount.cents, description or f"Transfer from {from_number}"))
+    return balances[from_id] - amount, balances[to_id] + amount
+
+
+def ledger_tables(include_archived=False):
+    """Tables holding ledger rows: the hot table, plus the archive if asked"""
+    return ('transactions', 'transactions_archive') if include_archived else ('transactions',)
+
+
+def history_page_plan(account_id, after=None, limit=50, start_date=None, end_date=None, transaction_types=None,
+                      include_archived=False):
+    """Fetch one newest-first page of transactions after a keyset cursor
+
+    With ``include_archived`` the hot and archive tables each return
+    their own top ``limit`` rows from their account/date index. The
+    union of those rows is then cut to the page.
+    """
+    where, params = history_filters(start_date, end_date, transaction_types)
+    if after:
+        # Expanded row comparison so MySQL can range-scan the
+        # (account_id, transaction_date, transaction_id) index
+        where += " AND (transaction_date < %s OR (transaction_date = %s AND transaction_id < %s))"
+        params += [after[0], after[0], after[1]]
+    selects = [f"""
+        SELECT transaction_id, transaction_type, {AMOUNT_CENTS}, description, transaction_date
+        FROM {table}
+        WHERE account_id = %s{where}
+        ORDER BY transaction_date DESC, transaction_id DESC
+        LIMIT %s
+    """ for table in ledger_tables(include_archived)]
+    params = [account_id] + params + [limit]
+    if include_archived:
+        rows = yield Query(f"""
+            SELECT * FROM (({selects[0]}) UNION ALL ({selects[1]})) AS ledger
+            ORDER BY transaction_date DESC, transaction_id DESC
+            LIMIT %s
+        """, params * 2 + [limit], 'all')
+    else:
+        rows = yield Query(selects[0], params, 'all')
+    return [dict(zip(HISTORY_COLUMNS, (transaction_id, transaction_type, Money(cents), description, date)))
+            for transaction_id, transaction_type, cents, description, date in rows]
+
+
+def totals_plan(account_id, start_date=None, end_date=None, transaction_types=None, include_archived=False):
+    """Aggregate deposits and withdrawals in SQL without fetching rows"""
+    where, params = history_filters(start_date, end_date, transaction_types)
+    ledger = " UNION ALL ".join(f"SELECT transaction_type, amount FROM {table} WHERE account_id = %s{where}"
+                                for table in ledger_tables(include_archived))
+    count, deposits, withdrawals = yield Query(f"""
+        SELECT COUNT(*),
+               CAST(COALESCE(SUM(CASE
+                   WHEN transaction_type IN ('deposit', 'account_creation') THEN amount
+                   WHEN transaction_type = 'transfer' AND amount > 0 THEN amount
+                   ELSE 0 END), 0) * 100 AS SIGNED),
+               CAST(COALESCE(SUM(CASE
+                   WHEN transaction_type = 'withdrawal' THEN amount
+                   WHEN transaction_type = 'transfer' AND amount < 0 THEN -amount
+                   ELSE 0 END), 0) * 100 AS SIGNED)
+        FROM ({ledger}) AS ledger
+    """, ([account_id] + params) * len(ledger_tables(include_archived)), 'one')
+    return count, Money(deposits), Money(withdrawals)
+
+
+def list_accounts_plan():
+    """Read every account, newest first"""
+    rows = yield Query(f"""
+        SELECT account_number, account_holder, {BALANCE_CENTS}, status, created_at
+        FROM accounts
+        ORDER BY created_at DESC
+    """, (), 'all')
+    return [dict(zip(LISTING_COLUMNS, (number, holder, Money(cents), status, created_at)))
+            for number, holder, cents, status, created_at in rows]
+
+
+def account_bounds_plan():
+    """Read the lowest and highest account IDs"""
+    row = yield Query("SELECT MIN(account_id), MAX(account_id) FROM accounts", (), 'one')
+    return row[0], row[1]
+
+
+def ledger_bounds_plan():
+    """Read the lowest and highest transaction IDs across the hot and archive tables"""
+    files, = yield Query("SELECT COUNT(*) FROM transaction_archives WHERE location = 'file'", (), 'one')
+    if files:
+        raise BankingError(f"{files} archived months are only in files; "
+                           f"load them with 'python bank_archive.py restore' first")
+    bounds = []
+    for table in ledger_tables(True):
+        low, high = yield Query(f"SELECT MIN(transaction_id), MAX(transaction_id) FROM {table}", (), 'one')
+        if low is not None:
+            bounds.append((low, high))
+    if not bounds:
+        return None, None
+    return min(low for low, _ in bounds), max(high for _, high in bounds)
+
+
+def ledger_net_changes_plan(first_id, last_id):
+    """Sum each account's ledger rows in a transaction-ID range
+
+    The range is a primary-key range scan in every partition, so chunks
+    read the ledger sequentially and MySQL returns one row per account.
+    """
+    changes = {}
+    for table in ledger_tables(True):
+        rows = yield Query(f"""
+            SELECT account_id, {NET_CENTS}
+            FROM {table}
+            WHERE transaction_id BETWEEN %s AND %s
+            GROUP BY account_id
+        """, (first_id, last_id), 'all')
+        for account_id, cents in rows:
+            changes[account_id] = changes.get(account_id, 0) + cents
+    return changes
+
+
+def ledger_rows_plan(after_id, limit):
+    """Read the next ledger rows in transaction_id order from both ledger tables"""
+    selects = [f"""
+        SELECT transaction_id, account_id, transaction_type, {AMOUNT_CENTS}, transaction_date
+        FROM {table}
+        WHERE transaction_id > %s
+        ORDER BY transaction_id
+        LIMIT %s
+    """ for table in ledger_tables(True)]
+    rows = yield Query(f"""
+        SELECT * FROM (({selects[0]}) UNION ALL ({selects[1]})) AS ledger
+        ORDER BY transaction_id
+        LIMIT %s
+    """, [after_id, limit] * 2 + [limit], 'all')
+    return rows
+
+
+def account_rows_plan(after_id, limit):
+    """Read the next accounts in account_id order"""
+    rows = yield Query("""
+        SELECT account_id, account_number, account_holder, status, created_at
+        FROM accounts
+        WHERE account_id > %s
+        ORDER BY account_id
+        LIMIT %s
+    """, (after_id, limit), 'all')
+    return rows
+
+
+def recent_outflows_plan(since, after_id, limit):
+    """Read the next withdrawals and outgoing transfers posted since a time"""
+    rows = yield Query(f"""
+        SELECT transaction_id, account_id, transaction_type, CAST(ABS(amount) * 100 AS SIGNED), transaction_date
+        FROM transactions
+        WHERE transaction_date >= %s AND transaction_id > %s
+          AND (transaction_type = 'withdrawal' OR (transaction_type = 'transfer' AND amount < 0))
+        ORDER BY transaction_id
+        LIMIT %s
+    """, (since, after_id, limit), 'all')
+    return rows
+
+
+def recent_request_keys_plan(since, after_id, limit):
+    """Read the next request keys of withdrawals recorded since a time"""
+    rows = yield Query("""
+        SELECT transaction_id, account_id, request_key
+        FROM posting_requests
+        WHERE created_at >= %s AND transaction_id > %s AND transaction_type = 'withdrawal'
+        ORDER BY transaction_id
+        LIMIT %s
+    """, (since, after_id, limit), 'all')
+    return [(transaction_id, account_id, bytes(key)) for transaction_id, account_id, key in rows]
+
+
+def find_drift(accounts, replayed, late):
+    """Return the (account_id, number, stored, ledger) accounts whose balance is off
+
+    ``accounts`` are (account_id, number, stored cents) rows; ``replayed``
+    and ``late`` map account_id to ledger cents before and after the
+    replay's high-water mark.
+    """
+    drift = []
+    for account_id, account_number, stored in accounts:
+        ledger = replayed.get(account_id, 0) + late.get(account_id, 0)
+        if stored != ledger:
+            drift.append((account_id, account_number, stored, ledger))
+    return drift
+
+
+def reconcile_plan(first_id, last_id, replayed, high_water, repair=False):
+    """Check (and with ``repair`` fix) one account range against the replay
+
+    Without ``repair`` both reads come from one REPEATABLE READ snapshot.
+    With it the accounts are locked first, so the late rows read next
+    include every posting committed to them.
+    """
+    accounts = yield Query(f"""
+        SELECT account_id, account_number, {BALANCE_CENTS}
+        FROM accounts
+        WHERE account_id BETWEEN %s AND %s{' FOR UPDATE' if repair else ''}
+    """, (first_id, last_id), 'all')
+    # Only the ledger's tail is read, by primary key rather than through
+    # the accounts' full histories
+    late = yield Query(f"""
+        SELECT account_id, {NET_CENTS}
+        FROM transactions FORCE INDEX (PRIMARY)
+        WHERE transaction_id > %s AND account_id BETWEEN %s AND %s
+        GROUP BY account_id
+    """, (high_water, first_id, last_id), 'all')
+    drift = find_drift(accounts, replayed, dict(late))
+    if repair:
+        for account_id, _, _, ledger in drift:
+            yield Query("UPDATE accounts SET balance = %s / 100 WHERE account_id = %s", (ledger, account_id))
+    return len(accounts), drift
+
+
+DEFAULT_DESCRIPTIONS = {'deposit': "Cash deposit", 'withdrawal': "Cash withdrawal"}
+
+
+def replayed_posting(seen, request_id, account_id, transaction_type, amount):
+    """Return the stored (balance, transaction_id) of a repeated request
+
+    ``seen`` is the stored (account_id, transaction_type, amount_cents,
+    balance_cents, transaction_id) of the request's first posting.
+    """
+    if tuple(seen[:3]) != (account_id, transaction_type, amount.cents):
+        raise RequestKeyConflictError(request_id)
+    return Money(seen[3]), seen[4]
+
+
+def settle_postings(balances, postings):
+    """Apply postings in order to in-memory balances
+
+    ``balances`` maps account_id to balance in cents and is updated in
+    place; postings for accounts missing from it are rejected. Returns
+    (results, deltas, ledger): per posting the new balance or the
+    exception for that caller, the net change in cents per account, and
+    (account_id, transaction_type, cents, description) ledger rows.
+    """
+    results = []
+    deltas = {}
+    ledger = []
+    for account_id, account_number, transaction_type, amount, description in postings:
+        balance = balances.get(account_id)
+        if balance is None:
+            results.append(AccountNotFoundError(account_number))
+            continue
+        change = amount.cents
+        if transaction_type == 'withdrawal':
+            if balance < change:
+                results.append(InsufficientFundsError(account_number, Money(balance), amount))
+                continue
+            change = -change
+        balances[account_id] = balance + change
+        deltas[account_id] = deltas.get(account_id, 0) + change
+        ledger.append((account_id, transaction_type, amount.cents,
+                       description or DEFAULT_DESCRIPTIONS[transaction_type]))
+        results.append(Money(balance + change))
+    return results, deltas, ledger
+
+
+def postings_plan(postings):
+    """Apply a batch of deposits and withdrawals in four round trips
+
+    The touched accounts are locked in account_id order, the postings are
+    settled in Python in arrival order, and then one UPDATE applies every
+    account's net change and one INSERT writes all ledger rows.
+    """
+    account_ids = sorted({posting[0] for posting in postings})
+    placeholders = ', '.join(['%s'] * len(account_ids))
+    rows = yield Query(f"""
+        SELECT account_id, {BALANCE_CENTS}
+        FROM accounts
+        WHERE account_id IN ({placeholders})
+        ORDER BY account_id
+        FOR UPDATE
+    """, account_ids, 'all')
+    results, deltas, ledger = settle_postings(dict(rows), postings)
+
+    if deltas:
+        cases = ' '.join(['WHEN %s THEN %s'] * len(deltas))
+        params = [value for account_id, cents in sorted(deltas.items()) for value in (account_id, cents)]
+        yield Query(f"""
+            UPDATE accounts
+            SET balance = balance + (CASE account_id {cases} END) / 100
+            WHERE account_id IN ({', '.join(['%s'] * len(deltas))})
+        """, params + sorted(deltas))
+    if ledger:
+        yield Query(f"""
+            INSERT INTO transactions (account_id, transaction_type, amount, description)
+            VALUES {', '.join(['(%s, %s, %s / 100, %s)'] * len(ledger))}
+        """, [value for row in ledger for value in row])
+    return results
+
+
+def group_ledger(accounts, rows):
+    """Pair each account with its ledger rows
+
+    ``accounts`` are (account_id, number, holder, balance) tuples and
+    ``rows`` are (account_id, transaction dict) pairs, both in account_id
+    order. Yields (account dict, transactions) for every account.
+    """
+    rows = iter(rows)
+    pending = next(rows, None)
+    for account in accounts:
+        account_id = account[0]
+        transactions = []
+        while pending is not None and pending[0] <= account_id:
+            if pending[0] == account_id:
+                transactions.append(pending[1])
+            pending = next(rows, None)
+        yield dict(zip(STATEMENT_ACCOUNT_COLUMNS, account)), transactions
+
+
+def next_page_cursor(transactions, limit):
+    """Return the keyset cursor after a full page, or None on the last page"""
+    if len(transactions) < limit:
+        return None
+    last = transactions[-1]
+    return (last['transaction_date'], last['transaction_id'])
+
+
+class MySQLBackend(StorageBackend):
+    """MySQL storage on a bounded ConnectionPool"""
+
+    name = 'mysql'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _run(self, make_plan, commit=True):
+        """Run a freshly built plan in a retried transaction
+
+        ``commit=False`` is for plans whose procedure commits by itself.
+        """
+        def work(conn):
+            cursor = conn.cursor()
+            try:
+                return run_plan(cursor, make_plan())
+            finally:
+                cursor.close()
+
+        return self.pool.run_transaction(work, commit=commit)
+
+    def setup(self):
+        from bank_db import migrate
+
+        with self.pool.connection() as conn:
+            return migrate(conn)
+
+    def close(self):
+        self.pool.close_all()
+
+    def reserve_account_numbers(self, count):
+        def work(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE account_number_sequence
+                    SET next_value = LAST_INSERT_ID(next_value + %s)
+                    WHERE sequence_id = 1
+                """, (count,))
+                return cursor.lastrowid - count
+            finally:
+                cursor.close()
+
+        return self.pool.run_transaction(work)
+
+    def insert_accounts(self, rows):
+        params = [row[:5] + (row[5].cents,) for row in rows]
+
+        def work(conn):
+            cursor = conn.cursor()
+            try:
+                if len(rows) == 1:
+                    cursor.execute("""
+                        INSERT INTO accounts (account_number, account_holder, email, phone, address, balance)
+                        VALUES (%s, %s, %s, %s, %s, %s / 100)
+                    """, params[0])
+                    account_ids = [cursor.lastrowid]
+                else:
+                    cursor.executemany("""
+                        INSERT INTO accounts (account_number, account_holder, email, phone, address, balance)
+                        VALUES (%s, %s, %s, %s, %s, %s / 100)
+                    """, params)
+                    numbers = [row[0] for row in rows]
+                    placeholders = ', '.join(['%s'] * len(numbers))
+                    cursor.execute(f"SELECT account_number, account_id FROM accounts "
+                                   f"WHERE account_number IN ({placeholders})", numbers)
+                    by_number = dict(cursor.fetchall())
+                    account_ids = [by_number[number] for number in numbers]
+
+                cursor.executemany("""
+                    INSERT INTO transactions (account_id, transaction_type, amount, description)
+                    VALUES (%s, 'account_creation', %s / 100, 'Initial deposit - Account creation')
+                """, [(account_id, row[5].cents) for account_id, row in zip(account_ids, rows)])
+            finally:
+                cursor.close()
+            return account_ids
+
+        # The driver is imported on first use, so SQLite and in-memory
+        # deployments never load it
+        from mysql.connector import Error, errorcode
+
+        try:
+            return self.pool.run_transaction(work)
+        except Error as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise DuplicateAccountNumberError(str(e))
+            raise
+
+    def lookup_account_id(self, account_number):
+        return self._run(lambda: account_id_plan(account_number))
+
+    def get_account(self, account_number):
+        return self._run(lambda: balance_plan(account_number))
+
+    def get_account_holder(self, account_number):
+        return self._run(lambda: account_holder_plan(account_number))
+
+    def deposit(self, account_id, account_number, amount, description=None, request_id=None):
+        return self._run(lambda: deposit_plan(account_id, account_number, amount, description, request_id),
+                         commit=False)
+
+    def withdraw(self, account_id, account_number, amount, description=None, request_id=None):
+        return self._run(lambda: withdraw_plan(account_id, account_number, amount, description, request_id),
+                         commit=False)
+
+    def purge_request_keys(self, retention=REQUEST_KEY_RETENTION, chunk_size=10000):
+        # Short chunks keep each DELETE from holding locks for long
+        purged = 0
+        while True:
+            count = self._run(lambda: purge_request_keys_plan(retention, chunk_size))
+            purged += count
+            if count < chunk_size:
+                return purged
+
+    def transfer(self, from_id, from_number, to_id, to_number, amount, description=None):
+        return self._run(lambda: transfer_plan(from_id, from_number, to_id, to_number, amount, description))
+
+    def apply_postings(self, postings):
+        return self._run(lambda: postings_plan(postings))
+
+    def history_page(self, account_id, after=None, limit=50, start_date=None, end_date=None,
+                     transaction_types=None, include_archived=False):
+        return self._run(lambda: history_page_plan(account_id, after, limit, start_date, end_date,
+                                                   transaction_types, include_archived))
+
+    def transaction_totals(self, account_id, start_date=None, end_date=None, transaction_types=None,
+                           include_archived=False):
+        return self._run(lambda: totals_plan(account_id, start_date, end_date, transaction_types,
+                                             include_archived))
+
+    def list_accounts(self):
+        return self._run(list_accounts_plan)
+
+    def account_id_bounds(self):
+        return self._run(account_bounds_plan)
+
+    def ledger_id_bounds(self):
+        return self._run(ledger_bounds_plan)
+
+    def ledger_net_changes(self, first_id, last_id):
+        return self._run(lambda: ledger_net_changes_plan(first_id, last_id))
+
+    def reconcile_balances(self, first_id, last_id, replayed, high_water, repair=False):
+        return self._run(lambda: reconcile_plan(first_id, last_id, replayed, high_water, repair))
+
+    def ledger_rows(self, after_id, limit):
+        return self._run(lambda: ledger_rows_plan(after_id, limit))
+
+    def account_rows(self, after_id, limit):
+        return self._run(lambda: account_rows_plan(after_id, limit))
+
+    def recent_outflows(self, since, after_id, limit):
+        return self._run(lambda: recent_outflows_plan(since, after_id, limit))
+
+    def recent_request_keys(self, since, after_id, limit):
+        return self._run(lambda: recent_request_keys_plan(since, after_id, limit))
+
+    def iter_statement_data(self, first_id, last_id, since, include_archived=False):
+        tables = ledger_tables(include_archived)
+        ledger = " UNION ALL ".join(f"""
+            SELECT account_id, transaction_id, transaction_type, {AMOUNT_CENTS}, description, transaction_date
+            FROM {table}
+            WHERE account_id BETWEEN %s AND %s AND transaction_date >= %s
+        """ for table in tables)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # The first read fixes the REPEATABLE READ snapshot, so the
+                # balances and the ledger rows agree
+                cursor.execute(f"""
+                    SELECT account_id, account_number, account_holder, {BALANCE_CENTS}
+                    FROM accounts
+                    WHERE account_id BETWEEN %s AND %s
+                    ORDER BY account_id
+                """, (first_id, last_id))
+                accounts = [(account_id, number, holder, Money(cents))
+                            for account_id, number, holder, cents in cursor.fetchall()]
+                cursor.execute(f"{ledger} ORDER BY account_id, transaction_date, transaction_id",
+                               [first_id, last_id, since] * len(tables))
+                rows = ((row[0], dict(zip(HISTORY_COLUMNS, (row[1], row[2], Money(row[3]), row[4], row[5]))))
+                        for batch in iter(lambda: cursor.fetchmany(1000), []) for row in batch)
+                yield from group_ledger(accounts, rows)
+            finally:
+                cursor.close()
+
+
+SQLITE_NET_CENTS = "SUM(CASE WHEN transaction_type = 'withdrawal' THEN -amount_cents ELSE amount_cents END)"
+
+
+def _sqlite_timestamp(value):
+    """Format a date/datetime the way SQLiteBackend stores timestamps"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ', 'microseconds')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class SQLiteBackend(StorageBackend):
+    """Embedded SQLite storage
+
+    Runs in WAL mode so readers never block the writer, with
+    ``synchronous=NORMAL`` and a large page cache. Money is stored as
+    integer cents and converted at the boundary, so arithmetic stays exact.
+    Each thread gets its own connection; writes take the database write
+    lock up front (BEGIN IMMEDIATE), so they serialise without deadlocks.
+    ``path=':memory:'`` gives a private in-memory database, useful for
+    simulations and tests.
+    """
+
+    name = 'sqlite'
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA foreign_keys = ON",
+        "PRAGMA busy_timeout = 10000",
+        "PRAGMA cache_size = -65536",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA mmap_size = 268435456",
+    )
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS accounts (
+            account_id INTEGER PRIMARY KEY,
+            account_number TEXT UNIQUE NOT NULL,
+            account_holder TEXT NOT NULL,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            balance_cents INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'inactive', 'suspended'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_accounts_created_at ON accounts (created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id INTEGER PRIMARY KEY,
+            account_id INTEGER NOT NULL REFERENCES accounts(account_id) ON DELETE CASCADE,
+            transaction_type TEXT NOT NULL
+                CHECK (transaction_type IN ('deposit', 'withdrawal', 'transfer', 'account_creation')),
+            amount_cents INTEGER NOT NULL,
+            description TEXT,
+            transaction_date TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_account_date
+        ON transactions (account_id, transaction_date, transaction_id)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS account_number_sequence (
+            sequence_id INTEGER PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO account_number_sequence (sequence_id, next_value) VALUES (1, 100000000)",
+        """
+        CREATE TABLE IF NOT EXISTS posting_requests (
+            request_key BLOB PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            transaction_type TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            balance_cents INTEGER NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_posting_requests_created ON posting_requests (created_at)",
+        """
+        CREATE TRIGGER IF NOT EXISTS transactions_no_update BEFORE UPDATE ON transactions
+        BEGIN SELECT RAISE(ABORT, 'The ledger is append-only'); END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS transactions_no_delete BEFORE DELETE ON transactions
+        BEGIN SELECT RAISE(ABORT, 'The ledger is append-only'); END
+        """,
+    )
+
+    def __init__(self, path='banking_system.db'):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        # An in-memory database exists only inside one connection, so every
+        # thread shares it and takes turns
+        self._shared = self._open() if path == ':memory:' else None
+        self._shared_lock = threading.RLock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    @contextmanager
+    def _transaction(self, begin):
+        shared = self._shared is not None
+        if shared:
+            self._shared_lock.acquire()
+        try:
+            conn = self._shared if shared else self._connection()
+            conn.execute(begin)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            if shared:
+                self._shared_lock.release()
+
+    def _write(self):
+        """Run a block in a write transaction, holding the write lock from the start"""
+        return self._transaction("BEGIN IMMEDIATE")
+
+    def _read(self):
+        """Run a block in a read transaction, giving a consistent snapshot"""
+        return self._transaction("BEGIN")
+
+    def setup(self):
+        with self._write() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            conn.execute("PRAGMA user_version = 3")
+        return 3
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _account_id(self, conn, account_number):
+        row = conn.execute("SELECT account_id FROM accounts WHERE account_number = ?",
+                           (account_number,)).fetchone()
+        if not row:
+            raise AccountNotFoundError(account_number)
+        return row[0]
+
+    def _balance(self, conn, account_id):
+        return Money(conn.execute("SELECT balance_cents FROM accounts WHERE account_id = ?",
+                                        (account_id,)).fetchone()[0])
+
+    def _refusal(self, conn, account_id, account_number, amount):
+        """Explain why a debit matched no row: a missing account or insufficient funds"""
+        row = conn.execute("SELECT balance_cents FROM accounts WHERE account_id = ?", (account_id,)).fetchone()
+        if row is None:
+            return AccountNotFoundError(account_number)
+        return InsufficientFundsError(account_number, Money(row[0]), amount)
+
+    def reserve_account_numbers(self, count):
+        with self._write() as conn:
+            first = conn.execute("SELECT next_value FROM account_number_sequence WHERE sequence_id = 1").fetchone()[0]
+            conn.execute("UPDATE account_number_sequence SET next_value = ? WHERE sequence_id = 1",
+                         (first + count,))
+        return first
+
+    def insert_accounts(self, rows):
+        now = _sqlite_timestamp(datetime.datetime.now())
+        try:
+            with self._write() as conn:
+                account_ids = []
+                for number, holder, email, phone, address, deposit in rows:
+                    cursor = conn.execute("""
+                        INSERT INTO accounts (account_number, account_holder, email, phone, address,
+                                              balance_cents, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (number, holder, email, phone, address, deposit.cents, now))
+                    account_ids.append(cursor.lastrowid)
+                conn.executemany("""
+                    INSERT INTO transactions (account_id, transaction_type, amount_cents, description,
+                                              transaction_date)
+                    VALUES (?, 'account_creation', ?, 'Initial deposit - Account creation', ?)
+                """, [(account_id, row[5].cents, now) for account_id, row in zip(account_ids, rows)])
+        except sqlite3.IntegrityError as e:
+            raise DuplicateAccountNumberError(str(e))
+        return account_ids
+
+    def lookup_account_id(self, account_number):
+        with self._read() as conn:
+            return self._account_id(conn, account_number)
+
+    def get_account(self, account_number):
+        with self._read() as conn:
+            row = conn.execute("""
+                SELECT account_number, account_holder, balance_cents, status
+                FROM accounts
+                WHERE account_number = ?
+            """, (account_number,)).fetchone()
+        if not row:
+            raise AccountNotFoundError(account_number)
+        return dict(zip(ACCOUNT_COLUMNS, (row[0], row[1], Money(row[2]), row[3])))
+
+    def get_account_holder(self, account_number):
+        with self._read() as conn:
+            row = conn.execute("SELECT account_id, account_holder FROM accounts WHERE account_number = ?",
+                               (account_number,)).fetchone()
+        if not row:
+            raise AccountNotFoundError(account_number)
+        return row[0], row[1]
+
+    def _post(self, conn, account_id, transaction_type, cents, description):
+        return conn.execute("""
+            INSERT INTO transactions (account_id, transaction_type, amount_cents, description, transaction_date)
+            VALUES (?, ?, ?, ?, ?)
+        """, (account_id, transaction_type, cents, description, _sqlite_timestamp(datetime.datetime.now()))).lastrowid
+
+    def _seen_request(self, conn, request_id):
+        """Return the stored posting for a request ID, or None if it is new"""
+        if request_id is None:
+            return None
+        return conn.execute("""
+            SELECT account_id, transaction_type, amount_cents, balance_cents, transaction_id
+            FROM posting_requests
+            WHERE request_key = ?
+        """, (request_key(request_id),)).fetchone()
+
+    def _remember_request(self, conn, request_id, account_id, transaction_type, cents, balance, transaction_id):
+        if request_id is not None:
+            conn.execute("""
+                INSERT INTO posting_requests (request_key, account_id, transaction_type, amount_cents,
+                                              balance_cents, transaction_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (request_key(request_id), account_id, transaction_type, cents, balance.cents, transaction_id,
+                  _sqlite_timestamp(datetime.datetime.now())))
+
+    def deposit(self, account_id, account_number, amount, description=None, request_id=None):
+        cents = amount.cents
+        with self._write() as conn:
+            seen = self._seen_request(conn, request_id)
+            if seen:
+                return replayed_posting(seen, request_id, account_id, 'deposit', amount)
+            if not conn.execute("UPDATE accounts SET balance_cents = balance_cents + ? WHERE account_id = ?",
+                                (cents, account_id)).rowcount:
+                raise AccountNotFoundError(account_number)
+            transaction_id = self._post(conn, account_id, 'deposit', cents, description or "Cash deposit")
+            balance = self._balance(conn, account_id)
+            self._remember_request(conn, request_id, account_id, 'deposit', cents, balance, transaction_id)
+            return balance, transaction_id
+
+    def withdraw(self, account_id, account_number, amount, description=None, request_id=None):
+        cents = amount.cents
+        with self._write() as conn:
+            seen = self._seen_request(conn, request_id)
+            if seen:
+                return replayed_posting(seen, request_id, account_id, 'withdrawal', amount)
+            updated = conn.execute("""
+                UPDATE accounts SET balance_cents = balance_cents - ?
+                WHERE account_id = ? AND balance_cents >= ?
+            """, (cents, account_id, cents)).rowcount
+            if updated == 0:
+                raise self._refusal(conn, account_id, account_number, amount)
+            transaction_id = self._post(conn, account_id, 'withdrawal', cents, description or "Cash withdrawal")
+            balance = self._balance(conn, account_id)
+            self._remember_request(conn, request_id, account_id, 'withdrawal', cents, balance, transaction_id)
+            return balance, transaction_id
+
+    def purge_request_keys(self, retention=REQUEST_KEY_RETENTION):
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=retention)
+        with self._write() as conn:
+            return conn.execute("DELETE FROM posting_requests WHERE created_at < ?",
+                                (_sqlite_timestamp(cutoff),)).rowcount
+
+    def transfer(self, from_id, from_number, to_id, to_number, amount, description=None):
+        cents = amount.cents
+        with self._write() as conn:
+            updated = conn.execute("""
+                UPDATE accounts SET balance_cents = balance_cents - ?
+                WHERE account_id = ? AND balance_cents >= ?
+            """, (cents, from_id, cents)).rowcount
+            if updated == 0:
+                raise self._refusal(conn, from_id, from_number, amount)
+            if not conn.execute("UPDATE accounts SET balance_cents = balance_cents + ? WHERE account_id = ?",
+                                (cents, to_id)).rowcount:
+                raise AccountNotFoundError(to_number)
+            self._post(conn, from_id, 'transfer', -cents, description or f"Transfer to {to_number}")
+            self._post(conn, to_id, 'transfer', cents, description or f"Transfer from {from_number}")
+            return self._balance(conn, from_id), self._balance(conn, to_id)
+
+    def apply_postings(self, postings):
+        account_ids = sorted({posting[0] for posting in postings})
+        now = _sqlite_timestamp(datetime.datetime.now())
+        with self._write() as conn:
+            rows = conn.execute(f"""
+                SELECT account_id, balance_cents FROM accounts
+                WHERE account_id IN ({', '.join(['?'] * len(account_ids))})
+            """, account_ids).fetchall()
+            results, deltas, ledger = settle_postings(dict(rows), postings)
+            conn.executemany("UPDATE accounts SET balance_cents = balance_cents + ? WHERE account_id = ?",
+                             [(cents, account_id) for account_id, cents in deltas.items()])
+            conn.executemany("""
+                INSERT INTO transactions (account_id, transaction_type, amount_cents, description, transaction_date)
+                VALUES (?, ?, ?, ?, ?)
+            """, [row + (now,) for row in ledger])
+        return results
+
+    def history_page(self, account_id, after=None, limit=50, start_date=None, end_date=None,
+                     transaction_types=None, include_archived=False):
+        where, params = history_filters(_sqlite_timestamp(start_date), _sqlite_timestamp(end_date),
+                                        transaction_types, placeholder='?')
+        if after:
+            after_date = _sqlite_timestamp(after[0])
+            where += " AND (transaction_date < ? OR (transaction_date = ? AND transaction_id < ?))"
+            params += [after_date, after_date, after[1]]
+        with self._read() as conn:
+            rows = conn.execute(f"""
+                SELECT transaction_id, transaction_type, amount_cents, description, transaction_date
+                FROM transactions
+                WHERE account_id = ?{where}
+                ORDER BY transaction_date DESC, transaction_id DESC
+                LIMIT ?
+            """, [account_id] + params + [limit]).fetchall()
+        return [dict(zip(HISTORY_COLUMNS, (transaction_id, transaction_type, Money(cents), description,
+                                           datetime.datetime.fromisoformat(date))))
+                for transaction_id, transaction_type, cents, description, date in rows]
+
+    def transaction_totals(self, account_id, start_date=None, end_date=None, transaction_types=None,
+                           include_archived=False):
+        where, params = history_filters(_sqlite_timestamp(start_date), _sqlite_timestamp(end_date),
+                                        transaction_types, placeholder='?')
+        with self._read() as conn:
+            count, deposits, withdrawals = conn.execute(f"""
+                SELECT COUNT(*),
+                       COALESCE(SUM(CASE
+                           WHEN transaction_type IN ('deposit', 'account_creation') THEN amount_cents
+                           WHEN transaction_type = 'transfer' AND amount_cents > 0 THEN amount_cents
+                           ELSE 0 END), 0),
+                       COALESCE(SUM(CASE
+                           WHEN transaction_type = 'withdrawal' THEN amount_cents
+                           WHEN transaction_type = 'transfer' AND amount_cents < 0 THEN -amount_cents
+                           ELSE 0 END), 0)
+                FROM transactions
+                WHERE account_id = ?{where}
+            """, [account_id] + params).fetchone()
+        return count, Money(deposits), Money(withdrawals)
+
+    def list_accounts(self):
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT account_number, account_holder, balance_cents, status, created_at
+                FROM accounts
+                ORDER BY created_at DESC
+            """).fetchall()
+        return [dict(zip(LISTING_COLUMNS, (number, holder, Money(cents), status,
+                                           datetime.datetime.fromisoformat(created_at))))
+                for number, holder, cents, status, created_at in rows]
+
+    def account_id_bounds(self):
+        with self._read() as conn:
+            return tuple(conn.execute("SELECT MIN(account_id), MAX(account_id) FROM accounts").fetchone())
+
+    def ledger_id_bounds(self):
+        with self._read() as conn:
+            return tuple(conn.execute("SELECT MIN(transaction_id), MAX(transaction_id) FROM transactions").fetchone())
+
+    def ledger_net_changes(self, first_id, last_id):
+        with self._read() as conn:
+            return dict(conn.execute(f"""
+                SELECT account_id, {SQLITE_NET_CENTS}
+                FROM transactions
+                WHERE transaction_id BETWEEN ? AND ?
+                GROUP BY account_id
+            """, (first_id, last_id)))
+
+    def reconcile_balances(self, first_id, last_id, replayed, high_water, repair=False):
+        with (self._write() if repair else self._read()) as conn:
+            accounts = conn.execute("""
+                SELECT account_id, account_number, balance_cents
+                FROM accounts
+                WHERE account_id BETWEEN ? AND ?
+            """, (first_id, last_id)).fetchall()
+            late = dict(conn.execute(f"""
+                SELECT account_id, {SQLITE_NET_CENTS}
+                FROM transactions
+                WHERE transaction_id > ? AND account_id BETWEEN ? AND ?
+                GROUP BY account_id
+            """, (high_water, first_id, last_id)))
+            drift = find_drift(accounts, replayed, late)
+            if repair:
+                conn.executemany("UPDATE accounts SET balance_cents = ? WHERE account_id = ?",
+                                 [(ledger, account_id) for account_id, _, _, ledger in drift])
+        return len(accounts), drift
+
+    def ledger_rows(self, after_id, limit):
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT transaction_id, account_id, transaction_type, amount_cents, transaction_date
+                FROM transactions
+                WHERE transaction_id > ?
+                ORDER BY transaction_id
+                LIMIT ?
+            """, (after_id, limit)).fetchall()
+        return [row[:4] + (datetime.datetime.fromisoformat(row[4]),) for row in rows]
+
+    def account_rows(self, after_id, limit):
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT account_id, account_number, account_holder, status, created_at
+                FROM accounts
+                WHERE account_id > ?
+                ORDER BY account_id
+                LIMIT ?
+            """, (after_id, limit)).fetchall()
+        return [row[:4] + (datetime.datetime.fromisoformat(row[4]),) for row in rows]
+
+    def recent_outflows(self, since, after_id, limit):
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT transaction_id, account_id, transaction_type, ABS(amount_cents), transaction_date
+                FROM transactions
+                WHERE transaction_id > ? AND transaction_date >= ?
+                  AND (transaction_type = 'withdrawal' OR (transaction_type = 'transfer' AND amount_cents < 0))
+                ORDER BY transaction_id
+                LIMIT ?
+            """, (after_id, _sqlite_timestamp(since), limit)).fetchall()
+        return [row[:4] + (datetime.datetime.fromisoformat(row[4]),) for row in rows]
+
+    def recent_request_keys(self, since, after_id, limit):
+        with self._read() as conn:
+            return conn.execute("""
+                SELECT transaction_id, account_id, request_key
+                FROM posting_requests
+                WHERE transaction_id > ? AND created_at >= ? AND transaction_type = 'withdrawal'
+                ORDER BY transaction_id
+                LIMIT ?
+            """, (after_id, _sqlite_timestamp(since), limit)).fetchall()
+
+    def iter_statement_data(self, first_id, last_id, since, include_archived=False):
+        with self._read() as conn:
+            accounts = conn.execute("""
+                SELECT account_id, account_number, account_holder, balance_cents
+                FROM accounts
+                WHERE account_id BETWEEN ? AND ?
+                ORDER BY account_id
+            """, (first_id, last_id)).fetchall()
+            accounts = [(account_id, number, holder, Money(cents)) for account_id, number, holder, cents in accounts]
+            rows = conn.execute("""
+                SELECT account_id, transaction_id, transaction_type, amount_cents, description, transaction_date
+                FROM transactions
+                WHERE account_id BETWEEN ? AND ? AND transaction_date >= ?
+                ORDER BY account_id, transaction_date, transaction_id
+            """, (first_id, last_id, _sqlite_timestamp(_as_datetime(since))))
+            yield from group_ledger(accounts, (
+                (account_id, dict(zip(HISTORY_COLUMNS, (transaction_id, transaction_type, Money(cents), description,
+                                                        datetime.datetime.fromisoformat(date)))))
+                for account_id, transaction_id, transaction_type, cents, description, date in rows))
+
+
+class MemoryBackend(StorageBackend):
+    """Pure in-process storage with no persistence
+
+    All state lives in dicts guarded by one lock, which makes every
+    operation atomic. Useful as a zero-latency baseline when comparing
+    engines and for simulations that don't need durability.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._accounts = {}
+        self._ids = {}
+        self._ledger = {}
+        self._next_account_id = 1
+        self._next_transaction_id = 1
+        self._sequence = 100000000
+        # request key -> (account_id, type, cents, balance cents, transaction_id, created), oldest first
+        self._requests = {}
+
+    def setup(self):
+        return 1
+
+    def _account_id(self, account_number):
+        account_id = self._ids.get(account_number)
+        if account_id is None:
+            raise AccountNotFoundError(account_number)
+        return account_id
+
+    def _account(self, account_id, account_number):
+        account = self._accounts.get(account_id)
+        if account is None:
+            raise AccountNotFoundError(account_number)
+        return account
+
+    def _post(self, account_id, transaction_type, amount, description, now=None):
+        self._ledger[account_id].append({
+            'transaction_id': self._next_transaction_id,
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'description': description,
+            'transaction_date': now or datetime.datetime.now()
+        })
+        self._next_transaction_id += 1
+        return self._next_transaction_id - 1
+
+    def reserve_account_numbers(self, count):
+        with self._lock:
+            first = self._sequence
+            self._sequence += count
+        return first
+
+    def insert_accounts(self, rows):
+        now = datetime.datetime.now()
+        with self._lock:
+            if any(row[0] in self._ids for row in rows) or len({row[0] for row in rows}) < len(rows):
+                raise DuplicateAccountNumberError("Account number already exists")
+            account_ids = []
+            for number, holder, email, phone, address, deposit in rows:
+                account_id = self._next_account_id
+                self._next_account_id += 1
+                self._accounts[account_id] = {
+                    'account_number': number,
+                    'account_holder': holder,
+                    'email': email,
+                    'phone': phone,
+                    'address': address,
+                    'balance': deposit,
+                    'status': 'active',
+                    'created_at': now
+                }
+                self._ids[number] = account_id
+                self._ledger[account_id] = []
+                self._post(account_id, 'account_creation', deposit, 'Initial deposit - Account creation', now)
+                account_ids.append(account_id)
+        return account_ids
+
+    def lookup_account_id(self, account_number):
+        with self._lock:
+            return self._account_id(account_number)
+
+    def get_account(self, account_number):
+        with self._lock:
+            account = self._accounts[self._account_id(account_number)]
+            return {column: account[column] for column in ACCOUNT_COLUMNS}
+
+    def get_account_holder(self, account_number):
+        with self._lock:
+            account_id = self._account_id(account_number)
+            return account_id, self._accounts[account_id]['account_holder']
+
+    def _remember_request(self, request_id, account_id, transaction_type, amount, balance, transaction_id):
+        if request_id is not None:
+            self._requests[request_key(request_id)] = (account_id, transaction_type, amount.cents, balance.cents,
+                                                       transaction_id, time.monotonic())
+
+    def deposit(self, account_id, account_number, amount, description=None, request_id=None):
+        with self._lock:
+            seen = self._requests.get(request_key(request_id)) if request_id is not None else None
+            if seen:
+                return replayed_posting(seen, request_id, account_id, 'deposit', amount)
+            account = self._account(account_id, account_number)
+            account['balance'] += amount
+            transaction_id = self._post(account_id, 'deposit', amount, description or "Cash deposit")
+            self._remember_request(request_id, account_id, 'deposit', amount, account['balance'], transaction_id)
+            return account['balance'], transaction_id
+
+    def withdraw(self, account_id, account_number, amount, description=None, request_id=None):
+        with self._lock:
+            seen = self._requests.get(request_key(request_id)) if request_id is not None else None
+            if seen:
+                return replayed_posting(seen, request_id, account_id, 'withdrawal', amount)
+            account = self._account(account_id, account_number)
+            if account['balance'] < amount:
+                raise InsufficientFundsError(account_number, account['balance'], amount)
+            account['balance'] -= amount
+            transaction_id = self._post(account_id, 'withdrawal', amount, description or "Cash withdrawal")
+            self._remember_request(request_id, account_id, 'withdrawal', amount, account['balance'],
+                                   transaction_id)
+            return account['balance'], transaction_id
+
+    def purge_request_keys(self, retention=REQUEST_KEY_RETENTION):
+        cutoff = time.monotonic() - retention
+        purged = 0
+        with self._lock:
+            # Keys are kept in insertion order, so the expired ones come first
+            while self._requests:
+                key = next(iter(self._requests))
+                if self._requests[key][5] >= cutoff:
+                    break
+                del self._requests[key]
+                purged += 1
+        return purged
+
+    def transfer(self, from_id, from_number, to_id, to_number, amount, description=None):
+        with self._lock:
+            source = self._account(from_id, from_number)
+            target = self._account(to_id, to_number)
+            if source['balance'] < amount:
+                raise InsufficientFundsError(from_number, source['balance'], amount)
+            source['balance'] -= amount
+            target['balance'] += amount
+            self._post(from_id, 'transfer', -amount, description or f"Transfer to {to_number}")
+            self._post(to_id, 'transfer', amount, description or f"Transfer from {from_number}")
+            return source['balance'], target['balance']
+
+    def apply_postings(self, postings):
+        with self._lock:
+            balances = {posting[0]: self._accounts[posting[0]]['balance'].cents
+                        for posting in postings if posting[0] in self._accounts}
+            results, deltas, ledger = settle_postings(balances, postings)
+            for account_id in deltas:
+                self._accounts[account_id]['balance'] = Money(balances[account_id])
+            for account_id, transaction_type, cents, description in ledger:
+                self._post(account_id, transaction_type, Money(cents), description)
+        return results
+
+    def _matching(self, account_id, start_date, end_date, transaction_types):
+        """Yield an account's ledger rows newest first, filtered"""
+        types = [transaction_types] if isinstance(transaction_types, str) else transaction_types
+        start = _as_datetime(start_date)
+        end = _as_datetime(end_date)
+        for trans in reversed(self._ledger[account_id]):
+            if start and trans['transaction_date'] < start:
+                continue
+            if end and trans['transaction_date'] >= end:
+                continue
+            if types and trans['transaction_type'] not in types:
+                continue
+            yield trans
+
+    def history_page(self, account_id, after=None, limit=50, start_date=None, end_date=None,
+                     transaction_types=None, include_archived=False):
+        page = []
+        with self._lock:
+            for trans in self._matching(account_id, start_date, end_date, transaction_types):
+                if after and (trans['transaction_date'], trans['transaction_id']) >= tuple(after):
+                    continue
+                page.append(dict(trans))
+                if len(page) == limit:
+                    break
+        return page
+
+    def transaction_totals(self, account_id, start_date=None, end_date=None, transaction_types=None,
+                           include_archived=False):
+        totals = TransactionTotals()
+        with self._lock:
+            for trans in self._matching(account_id, start_date, end_date, transaction_types):
+                totals.add(trans)
+        return totals.count, totals.total_deposits, totals.total_withdrawals
+
+    def list_accounts(self):
+        with self._lock:
+            accounts = [{column: account[column] for column in LISTING_COLUMNS}
+                        for account in self._accounts.values()]
+        accounts.reverse()
+        return accounts
+
+    def account_id_bounds(self):
+        with self._lock:
+            return (min(self._accounts), max(self._accounts)) if self._accounts else (None, None)
+
+    def ledger_id_bounds(self):
+        with self._lock:
+            return (1, self._next_transaction_id - 1) if self._next_transaction_id > 1 else (None, None)
+
+    def _net_changes(self, first_id, last_id, account_ids=None):
+        changes = {}
+        for account_id in (self._ledger if account_ids is None else account_ids):
+            for trans in self._ledger[account_id]:
+                if first_id <= trans['transaction_id'] <= last_id:
+                    cents = trans['amount'].cents
+                    changes[account_id] = changes.get(account_id, 0) + (
+                        -cents if trans['transaction_type'] == 'withdrawal' else cents)
+        return changes
+
+    def ledger_net_changes(self, first_id, last_id):
+        with self._lock:
+            return self._net_changes(first_id, last_id)
+
+    def reconcile_balances(self, first_id, last_id, replayed, high_water, repair=False):
+        with self._lock:
+            account_ids = [account_id for account_id in sorted(self._accounts) if first_id <= account_id <= last_id]
+            accounts = [(account_id, self._accounts[account_id]['account_number'],
+                         self._accounts[account_id]['balance'].cents) for account_id in account_ids]
+            late = self._net_changes(high_water + 1, self._next_transaction_id, account_ids)
+            drift = find_drift(accounts, replayed, late)
+            if repair:
+                for account_id, _, _, ledger in drift:
+                    self._accounts[account_id]['balance'] = Money(ledger)
+        return len(accounts), drift
+
+    def ledger_rows(self, after_id, limit):
+        with self._lock:
+            rows = [(trans['transaction_id'], account_id, trans['transaction_type'], trans['amount'].cents,
+                     trans['transaction_date'])
+                    for account_id, ledger in self._ledger.items() for trans in ledger
+                    if trans['transaction_id'] > after_id]
+        rows.sort()
+        return rows[:limit]
+
+    def account_rows(self, after_id, limit):
+        with self._lock:
+            return [(account_id, account['account_number'], account['account_holder'], account['status'],
+                     account['created_at'])
+                    for account_id, account in sorted(self._accounts.items()) if account_id > after_id][:limit]
+
+    def recent_outflows(self, since, after_id, limit):
+        with self._lock:
+            rows = [(trans['transaction_id'], account_id, trans['transaction_type'], abs(trans['amount'].cents),
+                     trans['transaction_date'])
+                    for account_id, ledger in self._ledger.items() for trans in ledger
+                    if trans['transaction_id'] > after_id and trans['transaction_date'] >= since
+                    and is_outflow(trans['transaction_type'], trans['amount'].cents)]
+        rows.sort()
+        return rows[:limit]
+
+    def recent_request_keys(self, since, after_id, limit):
+        # Keys are stamped with the monotonic clock, so ``since`` becomes an age
+        cutoff = time.monotonic() - (datetime.datetime.now() - _as_datetime(since)).total_seconds()
+        with self._lock:
+            rows = sorted((seen[4], seen[0], key) for key, seen in self._requests.items()
+                          if seen[1] == 'withdrawal' and seen[4] > after_id and seen[5] >= cutoff)
+        return rows[:limit]
+
+    def iter_statement_data(self, first_id, last_id, since, include_archived=False):
+        since = _as_datetime(since)
+        statements = []
+        with self._lock:
+            for account_id in sorted(self._accounts):
+                if first_id <= account_id <= last_id:
+                    account = self._accounts[account_id]
+                    statements.append((
+                        dict(zip(STATEMENT_ACCOUNT_COLUMNS, (account_id, account['account_number'],
+                                                             account['account_holder'], account['balance']))),
+                        [dict(trans) for trans in self._ledger[account_id] if trans['transaction_date'] >= since]))
+        return iter(statements)
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    return datetime.datetime.fromisoformat(value)
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend, 'memory': MemoryBackend}
+
+
+def open_backend(config, pool_size=10, metrics=None):
+    """Build the storage backend named by ``config['backend']``
+
+    'mysql' (the default) uses the host/user/password/database settings,
+    'sqlite' uses ``config['path']`` and 'memory' needs nothing.
+    """
+    kind = config.get('backend', 'mysql')
+    if kind == 'mysql':
+        from bank_db import ConnectionPool
+
+        return MySQLBackend(ConnectionPool(config, size=pool_size, metrics=metrics))
+    if kind == 'sqlite':
+        return SQLiteBackend(config.get('path') or 'banking_system.db')
+    if kind == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend: {kind!r}")
@@ -0,0 +1,299 @@
+import configparser
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from bank_config import config_file_path
+from bank_errors import VelocityLimitError
+from bank_money import Money
+from bank_storage import request_key
+
+
+# Postings that take money out of an account; the only ones rules apply to
+OUTFLOW_TYPES = ('withdrawal', 'transfer')
+
+# Request keys remembered per account, so a retried posting is not counted twice
+REQUEST_MEMORY = 16
+
+
+class VelocityRule:
+    """One limit on an account's outgoing postings within a sliding window
+
+    ``max_count`` caps the number of postings and ``max_amount`` their
+    total within ``window`` seconds; either may be None. Only postings of
+    ``transaction_types`` count. The window is tracked in ``buckets``
+    slices, and a posting is checked against the current slice plus the
+    ``buckets`` before it. The window therefore errs on the strict side by
+    at most one slice (window / buckets).
+    """
+
+    def __init__(self, name, window, max_count=None, max_amount=None, transaction_types=OUTFLOW_TYPES, buckets=60):
+        if max_count is None and max_amount is None:
+            raise ValueError(f"Velocity rule {name!r} needs a count or amount limit")
+        if window <= 0 or buckets < 1:
+            raise ValueError(f"Velocity rule {name!r} needs a positive window and bucket count")
+        unknown = set(transaction_types) - set(OUTFLOW_TYPES)
+        if unknown:
+            raise ValueError(f"Velocity rule {name!r} cannot apply to {', '.join(sorted(unknown))}")
+        self.name = name
+        self.window = window
+        self.max_count = max_count
+        self.max_amount = Money.parse(max_amount) if max_amount is not None else None
+        self.transaction_types = frozenset(transaction_types)
+        self.buckets = buckets
+        self.width = window / buckets
+
+    def __repr__(self):
+        limit = f"{self.max_count} postings" if self.max_count is not None else ''
+        if self.max_amount is not None:
+            limit += f"{' and ' if limit else ''}${self.max_amount}"
+        types = ', '.join(sorted(self.transaction_types))
+        return f"VelocityRule({self.name!r}: {limit} per {self.window}s on {types})"
+
+
+def parse_rule(name, text):
+    """Build a VelocityRule from ``<count|amount> <limit> per <seconds> [types]``
+
+    Examples: ``count 20 per 3600 withdrawal``, ``amount 10000.00 per
+    86400`` or ``amount 2500 per 3600 withdrawal,transfer``.
+    """
+    words = text.split()
+    if len(words) not in (4, 5) or words[0] not in ('count', 'amount') or words[2] != 'per':
+        raise ValueError(f"Velocity rule {name!r} should read '<count|amount> <limit> per <seconds> [types]': "
+                         f"{text!r}")
+    transaction_types = words[4].split(',') if len(words) == 5 else OUTFLOW_TYPES
+    if words[0] == 'count':
+        return VelocityRule(name, int(words[3]), max_count=int(words[1]), transaction_types=transaction_types)
+    return VelocityRule(name, int(words[3]), max_amount=words[1], transaction_types=transaction_types)
+
+
+def load_velocity_rules(path=None):
+    """Read velocity rules from the ``[velocity]`` section of the config file
+
+    Each key names a rule and its value is parsed by parse_rule(). Returns
+    an empty list, so no limits apply, when no rules are configured.
+    """
+    path = config_file_path(path)
+    if not path:
+        return []
+    parser = configparser.ConfigParser(interpolation=None)
+    if not parser.read(path, encoding='utf-8'):
+        raise FileNotFoundError(f"Config file not found: {path}")
+    if not parser.has_section('velocity'):
+        return []
+    return [parse_rule(name, text) for name, text in parser['velocity'].items()]
+
+
+class AccountCounters:
+    """Per-rule sliding windows of one account
+
+    Each window is a list of [slice, count, cents] entries for the slices
+    that saw a posting, oldest first. Entries older than the window are
+    trimmed as new ones arrive, so an account holds at most
+    ``buckets + 1`` entries per rule however busy it is.
+    """
+
+    __slots__ = ('windows', 'last_seen', 'requests')
+
+    def __init__(self, rule_count):
+        self.windows = [[] for _ in range(rule_count)]
+        self.last_seen = 0.0
+        self.requests = None
+
+
+def window_totals(window, oldest):
+    """Return (count, cents) of the entries from slice ``oldest`` on"""
+    count = cents = 0
+    for entry in window:
+        if entry[0] >= oldest:
+            count += entry[1]
+            cents += entry[2]
+    return count, cents
+
+
+def window_add(window, current, oldest, count, cents):
+    """Add a posting to slice ``current`` and drop entries before ``oldest``"""
+    while window and window[0][0] < oldest:
+        del window[0]
+    index = len(window)
+    while index and window[index - 1][0] > current:
+        index -= 1
+    if index and window[index - 1][0] == current:
+        window[index - 1][1] += count
+        window[index - 1][2] += cents
+    else:
+        window.insert(index, [current, count, cents])
+
+
+class VelocityGuard:
+    """Velocity limits on withdrawals and transfers, counted in memory
+
+    reserve() checks a posting against every rule before it reaches the
+    database and counts it, all under one lock, so concurrent postings
+    cannot slip past a limit together. A posting that then fails is given
+    back with release(). A decision touches only the account's own
+    counters and takes a few microseconds. No query is needed.
+
+    warm() loads the withdrawals and outgoing transfers of the longest
+    window from the ledger at startup, so a restart does not reset the
+    limits. It also loads the request keys stored for those withdrawals,
+    so a client retrying across the restart is not counted twice. Only accounts with recent activity are held. An account with
+    no posting for longer than every window is dropped, losing nothing.
+    Beyond ``max_accounts``, the least recently active accounts are
+    dropped as well, which is where memory stays bounded at the cost of
+    forgetting their counts.
+
+    Counts cover the postings this process made since it was warmed.
+    Several processes posting to one database each enforce the limits on
+    their own share.
+    """
+
+    def __init__(self, rules, max_accounts=100000, clock=time.time):
+        self.rules = list(rules)
+        if not self.rules:
+            raise ValueError("A velocity guard needs at least one rule")
+        self.max_accounts = max_accounts
+        self.clock = clock
+        # Idle accounts are dropped once even the longest window has passed
+        self.idle_after = max(rule.window + rule.width for rule in self.rules)
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+        self.warmed = False
+        self.checks = 0
+        self.refusals = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _counters(self, account_id, when):
+        counters = self._accounts.get(account_id)
+        if counters is None:
+            counters = self._accounts[account_id] = AccountCounters(len(self.rules))
+        else:
+            self._accounts.move_to_end(account_id)
+        counters.last_seen = max(counters.last_seen, when)
+        return counters
+
+    @staticmethod
+    def _remember(counters, key):
+        """Record a request key, forgetting the oldest beyond REQUEST_MEMORY"""
+        if counters.requests is None:
+            counters.requests = {}
+        counters.requests[key] = True
+        if len(counters.requests) > REQUEST_MEMORY:
+            del counters.requests[next(iter(counters.requests))]
+
+    def _expire(self, now):
+        """Drop idle accounts, then the least recently active ones over ``max_accounts``"""
+        idle_before = now - self.idle_after
+        while self._accounts:
+            account_id, counters = next(iter(self._accounts.items()))
+            if counters.last_seen < idle_before:
+                self.expired += 1
+            elif len(self._accounts) > self.max_accounts:
+                self.evictions += 1
+            else:
+                return
+            del self._accounts[account_id]
+
+    def _applicable(self, counters, transaction_type, when, now):
+        """Yield (rule, window, slice, oldest live slice) for the rules covering a posting"""
+        for rule, window in zip(self.rules, counters.windows):
+            if transaction_type in rule.transaction_types:
+                yield rule, window, int(when // rule.width), int(now // rule.width) - rule.buckets
+
+    def reserve(self, account_id, account_number, transaction_type, amount, request_id=None):
+        """Count a posting against every rule, or raise VelocityLimitError
+
+        Returns a hold to pass to release() if the posting then fails. A
+        ``request_id`` already counted for the account is not counted again.
+        """
+        now = self.clock()
+        cents = amount.cents
+        key = request_key(request_id) if request_id is not None else None
+        with self._lock:
+            self.checks += 1
+            counters = self._counters(account_id, now)
+            self._expire(now)
+            if key is not None and counters.requests and key in counters.requests:
+                return None
+            applied = []
+            for rule, window, current, oldest in self._applicable(counters, transaction_type, now, now):
+                count, total = window_totals(window, oldest)
+                if ((rule.max_count is not None and count >= rule.max_count)
+                        or (rule.max_amount is not None and total + cents > rule.max_amount.cents)):
+                    self.refusals += 1
+                    raise VelocityLimitError(account_number, rule.name)
+                applied.append((window, current, oldest))
+            for window, current, oldest in applied:
+                window_add(window, current, oldest, 1, cents)
+            if key is not None:
+                self._remember(counters, key)
+            return counters, applied, cents, key
+
+    def release(self, hold):
+        """Give back a reservation whose posting failed"""
+        if hold is None:
+            return
+        counters, applied, cents, key = hold
+        with self._lock:
+            for window, current, _ in applied:
+                for entry in window:
+                    if entry[0] == current:
+                        entry[1] -= 1
+                        entry[2] -= cents
+                        break
+            if key is not None and counters.requests:
+                counters.requests.pop(key, None)
+
+    def warm(self, backend, chunk_size=10000):
+        """Count the recent outflows recorded in the ledger; returns the rows loaded
+
+        Archived months are not read, so windows must be shorter than the
+        archive retention. Request keys are read back only while
+        purge_request_keys() keeps them.
+        """
+        now = self.clock()
+        since = datetime.datetime.fromtimestamp(now - self.idle_after)
+        after_id = 0
+        loaded = 0
+        while True:
+            rows = backend.recent_outflows(since, after_id, chunk_size)
+            with self._lock:
+                for _, account_id, transaction_type, cents, transaction_date in rows:
+                    when = transaction_date.timestamp()
+                    counters = self._counters(account_id, when)
+                    for _, window, current, oldest in self._applicable(counters, transaction_type, when, now):
+                        if current >= oldest:
+                            window_add(window, current, oldest, 1, cents)
+                self._expire(now)
+            loaded += len(rows)
+            if len(rows) < chunk_size:
+                break
+            after_id = rows[-1][0]
+
+        after_id = 0
+        while True:
+            rows = backend.recent_request_keys(since, after_id, chunk_size)
+            with self._lock:
+                for _, account_id, key in rows:
+                    counters = self._accounts.get(account_id)
+                    if counters is not None:
+                        self._remember(counters, key)
+            if len(rows) < chunk_size:
+                break
+            after_id = rows[-1][0]
+        self.warmed = True
+        return loaded
+
+    def stats(self):
+        """Return decision counters and the number of accounts tracked"""
+        with self._lock:
+            return {
+                'accounts': len(self._accounts),
+                'max_accounts': self.max_accounts,
+                'checks': self.checks,
+                'refusals': self.refusals,
+                'expired': self.expired,
+                'evictions': self.evictions
+            }
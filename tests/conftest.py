@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The bank_* modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_storage import open_backend  # noqa: E402
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def backend(request, tmp_path):
+    """An empty, migrated embedded backend; each test runs on both"""
+    backend = open_backend({'backend': request.param, 'path': str(tmp_path / 'bank.db')}, pool_size=4)
+    backend.setup()
+    yield backend
+    backend.close()
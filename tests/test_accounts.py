@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bank_errors import BankingError
+from bank_money import Money
+from bank_service import AccountNumberAllocator, BankingService, is_valid_account_number, luhn_check_digit
+
+
+class CountingReservations:
+    """Backend stand-in that hands out sequence blocks and counts the reservations"""
+
+    def __init__(self, first=100000000):
+        self.next = first
+        self.reservations = 0
+
+    def reserve_account_numbers(self, count):
+        self.reservations += 1
+        first, self.next = self.next, self.next + count
+        return first
+
+
+def test_luhn_check_digits():
+    assert luhn_check_digit('7992739871') == '3'
+    assert is_valid_account_number('79927398713')
+    assert not is_valid_account_number('79927398714')
+    assert not is_valid_account_number('x')
+
+
+def test_numbers_come_from_reserved_blocks():
+    backend = CountingReservations()
+    allocator = AccountNumberAllocator(backend, block_size=10)
+    numbers = allocator.allocate(4) + allocator.allocate(6) + allocator.allocate(1)
+
+    assert backend.reservations == 2
+    assert len(set(numbers)) == 11
+    assert all(is_valid_account_number(number) for number in numbers)
+    assert numbers[0] == '100000000' + luhn_check_digit('100000000')
+
+
+def test_a_request_larger_than_a_block_is_served_at_once():
+    backend = CountingReservations()
+    assert len(AccountNumberAllocator(backend, block_size=10).allocate(25)) == 25
+    assert backend.reservations == 1
+
+
+def test_concurrent_allocations_never_repeat_a_number():
+    allocator = AccountNumberAllocator(CountingReservations(), block_size=7)
+    with ThreadPoolExecutor(8) as executor:
+        batches = list(executor.map(lambda _: allocator.allocate(5), range(40)))
+    numbers = [number for batch in batches for number in batch]
+    assert len(set(numbers)) == len(numbers) == 200
+
+
+@pytest.fixture
+def service(backend):
+    return BankingService(backend)
+
+
+def test_bulk_creation_keeps_input_order_across_chunks(service):
+    specs = [{'account_holder': f"Holder {n}", 'initial_deposit': str(n)} for n in range(7)]
+    created = service.create_accounts(specs, chunk_size=3)
+
+    assert [account['account_holder'] for account in created] == [spec['account_holder'] for spec in specs]
+    assert len({account['account_number'] for account in created}) == 7
+    assert service.get_balance(created[6]['account_number'])['balance'] == Money(600)
+    assert service.get_all_accounts()['total_balance'] == Money(2100)
+
+
+def test_bulk_creation_refuses_a_nameless_holder(service):
+    with pytest.raises(BankingError, match="holder"):
+        service.create_accounts([{'account_holder': "Grace"}, {'account_holder': "  "}])
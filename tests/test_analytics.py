@@ -0,0 +1,45 @@
+import pytest
+
+from bank_money import Money
+from bank_service import BankingService
+
+np = pytest.importorskip('numpy')
+
+from bank_analytics import AnalyticsStore  # noqa: E402
+
+
+def set_status(backend, account_number, status):
+    """Change an account's status the way an operator would, outside the service"""
+    if backend.name == 'sqlite':
+        with backend._write() as conn:
+            conn.execute("UPDATE accounts SET status = ? WHERE account_number = ?", (status, account_number))
+    else:
+        backend._accounts[backend._ids[account_number]]['status'] = status
+
+
+@pytest.fixture
+def numbers(backend):
+    service = BankingService(backend)
+    return [service.create_account(f"Holder {n}", f"{10 * (n + 1)}")['account_number'] for n in range(5)]
+
+
+def test_accounts_younger_than_the_settle_time_wait_for_the_next_refresh(backend, numbers, tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'analytics'))
+
+    assert store.refresh(backend, settle_seconds=3600) == (0, 0)
+    assert store.refresh(backend, settle_seconds=0) == (5, 5)
+    assert store.summary()['total_balance'] == Money(15000)
+
+
+def test_every_refresh_picks_up_status_changes(backend, numbers, tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'analytics'))
+    store.refresh(backend, chunk_size=2, settle_seconds=0)
+    set_status(backend, numbers[1], 'suspended')
+    set_status(backend, numbers[4], 'inactive')
+
+    assert store.refresh(backend, chunk_size=2, settle_seconds=0) == (0, 0)
+    by_status = store.summary()['by_status']
+    assert by_status['active'] == {'accounts': 3, 'balance': Money(8000)}
+    assert by_status['suspended'] == {'accounts': 1, 'balance': Money(2000)}
+    assert by_status['inactive'] == {'accounts': 1, 'balance': Money(5000)}
+    assert store.summary()['status_refreshed_at'] is not None
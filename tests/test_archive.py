@@ -0,0 +1,34 @@
+import datetime
+
+import pytest
+
+from bank_archive import TransactionArchiver, archive_file_name
+from bank_db import next_month
+from bank_errors import BankingError
+
+
+class Unreachable:
+    """A pool that fails the test if archive() gets as far as the database"""
+
+    def connection(self):
+        raise AssertionError("The database should not be touched")
+
+
+class Service:
+    pool = Unreachable()
+
+
+def test_the_current_month_cannot_be_archived():
+    archiver = TransactionArchiver(Service())
+    with pytest.raises(BankingError, match="closed months"):
+        archiver.archive(next_month(datetime.date.today()))
+
+
+def test_restore_refuses_files_not_named_like_an_archive(tmp_path):
+    archiver = TransactionArchiver(Service())
+    with pytest.raises(BankingError, match="not named like an archive"):
+        archiver.restore(str(tmp_path / 'january.csv.gz'))
+
+
+def test_archive_file_names_carry_the_month():
+    assert archive_file_name(datetime.date(2025, 1, 1)) == 'transactions_202501.csv.gz'
@@ -0,0 +1,58 @@
+import pytest
+
+from bank_money import Money
+from bank_service import BankingService
+from bank_storage import MemoryBackend, SQLiteBackend, open_backend
+
+
+def test_open_backend_picks_the_configured_backend(tmp_path):
+    assert isinstance(open_backend({'backend': 'memory'}), MemoryBackend)
+    backend = open_backend({'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')})
+    assert isinstance(backend, SQLiteBackend)
+    backend.close()
+    with pytest.raises(ValueError):
+        open_backend({'backend': 'postgres'})
+
+
+def test_sqlite_keeps_accounts_across_reopen(tmp_path):
+    config = {'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')}
+    backend = open_backend(config)
+    backend.setup()
+    number = BankingService(backend).create_account("Ada", "12.34")['account_number']
+    backend.close()
+
+    backend = open_backend(config)
+    backend.setup()
+    try:
+        assert BankingService(backend).get_balance(number)['balance'] == Money(1234)
+    finally:
+        backend.close()
+
+
+def run_script(service):
+    """Drive one backend through a fixed sequence and return what it reports"""
+    first = service.create_account("Ada", "10")['account_number']
+    second = service.create_account("Alan", "5")['account_number']
+    service.deposit(first, "2.50", "Pocket money")
+    service.withdraw(second, "1.00")
+    service.transfer(first, second, "3.00")
+    history = service.get_transaction_history(first)
+    return ([service.get_balance(number)['balance'] for number in (first, second)],
+            [(row['transaction_type'], row['amount']) for row in history['transactions']],
+            (history['total_deposits'], history['total_withdrawals']),
+            sorted(account['account_holder'] for account in service.get_all_accounts()['accounts']),
+            service.get_all_accounts()['total_balance'])
+
+
+def test_embedded_backends_agree(tmp_path):
+    results = []
+    for config in ({'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')}, {'backend': 'memory'}):
+        backend = open_backend(config)
+        backend.setup()
+        try:
+            results.append(run_script(BankingService(backend)))
+        finally:
+            backend.close()
+    assert results[0] == results[1]
+    assert results[0][0] == [Money(950), Money(700)]
+    assert results[0][-1] == Money(1650)
@@ -0,0 +1,63 @@
+import argparse
+import random
+
+import pytest
+
+from bank_bench import (HotspotChooser, compare, make_workload, parse_mix, percentile, run_benchmark)
+from bank_metrics import Metrics
+from bank_service import BankingService
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile(values, 0.0) == 1
+    assert percentile([], 0.95) == 0.0
+
+
+def test_parse_mix():
+    assert parse_mix("deposit=3, balance=1") == {'deposit': 3.0, 'balance': 1.0}
+    for text in ("refund=1", "deposit=lots", "deposit=0,balance=0"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_mix(text)
+
+
+def test_hot_accounts_get_their_share_of_the_traffic():
+    numbers = [str(n) for n in range(100)]
+    chooser = HotspotChooser(numbers, random.Random(1), hot_fraction=0.05, hot_share=0.5)
+    picks = [chooser.pick() for _ in range(10000)]
+    hot = sum(1 for pick in picks if pick in chooser.hot)
+    assert 4500 < hot < 5500
+    assert all(source != target for source, target in (chooser.pick_pair() for _ in range(100)))
+
+
+def test_workloads_are_reproducible():
+    numbers = [str(n) for n in range(10)]
+
+    def workload():
+        rng = random.Random(7)
+        return make_workload(HotspotChooser(numbers, rng), 200, {'deposit': 1, 'transfer': 1}, rng)
+
+    assert workload() == workload()
+    assert {name for name, _ in workload()} == {'deposit', 'transfer'}
+
+
+def test_compare_flags_regressions_beyond_the_tolerance():
+    baseline = {'operations': {'deposit': {'ops_per_second': 100, 'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 0}}}
+    current = {'operations': {'deposit': {'ops_per_second': 85, 'p50_ms': 1.05, 'p95_ms': 3.0, 'p99_ms': 9.0},
+                              'balance': {'ops_per_second': 1, 'p50_ms': 1, 'p95_ms': 1, 'p99_ms': 1}}}
+    regressions = compare(baseline, current)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("deposit ops_per_second")
+    assert regressions[1].startswith("deposit p95_ms")
+
+
+def test_small_benchmark_run(backend):
+    service = BankingService(backend, metrics=Metrics())
+    report = run_benchmark(service, accounts=20, transactions=50, operations=100, concurrency=2)
+    assert report['overall']['count'] + report['overall']['rejected'] + report['overall']['errors'] == 100
+    assert report['overall']['errors'] == 0
+    assert report['config']['backend'] == backend.name
+    for result in report['operations'].values():
+        assert 'round_trips_per_op' in result
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from bank_broker import BrokerClient, BrokerServer, BrokerUnavailable, database_identity
+from bank_cli import LocalClient, connect
+from bank_service import BankingService
+
+
+def test_the_identity_leaves_out_the_password():
+    identity = database_identity({'backend': 'mysql', 'host': 'db1', 'user': 'bank', 'password': 'secret',
+                                  'database': 'banking_system', 'path': 'unused.db'})
+    assert identity == {'backend': 'mysql', 'host': 'db1', 'user': 'bank', 'database': 'banking_system'}
+
+
+def test_sqlite_paths_are_compared_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert (database_identity({'backend': 'sqlite', 'path': 'bank.db'})
+            == database_identity({'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')}))
+
+
+def test_a_missing_socket_means_no_broker(tmp_path):
+    with pytest.raises(BrokerUnavailable):
+        BrokerClient(str(tmp_path / 'missing.sock')).call('ping')
+
+
+def test_a_file_that_is_not_a_socket_means_no_broker(tmp_path):
+    path = tmp_path / 'stale.sock'
+    path.write_text('')
+    with pytest.raises(BrokerUnavailable):
+        BrokerClient(str(path)).call('ping')
+
+
+@pytest.fixture
+def broker(tmp_path, monkeypatch):
+    """A broker serving a SQLite database named in tmp_path/bank.ini"""
+    for variable in ('DB_BACKEND', 'DB_PATH', 'DB_HOST', 'DB_USER', 'DB_NAME'):
+        monkeypatch.delenv(variable, raising=False)
+    config = tmp_path / 'bank.ini'
+    config.write_text(f"[database]\nbackend = sqlite\npath = {tmp_path / 'bank.db'}\n", encoding='utf-8')
+    db_config = {'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')}
+    service = BankingService.from_config(db_config, pool_size=1)
+    service.backend.setup()
+    server = BrokerServer(str(tmp_path / 'broker.sock'), service, idle_timeout=0,
+                          database=database_identity(db_config))
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield str(config), server.server_address
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def test_a_broker_on_the_same_database_is_used(broker):
+    config, socket_path = broker
+    client = connect('auto', config, socket_path)
+    assert isinstance(client, BrokerClient)
+    assert client.call('ping')['database']['backend'] == 'sqlite'
+
+
+def test_environment_overrides_keep_a_command_off_another_databases_broker(broker, tmp_path, monkeypatch):
+    config, socket_path = broker
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'other.db'))
+    client = connect('auto', config, socket_path)
+    assert isinstance(client, LocalClient)
@@ -0,0 +1,90 @@
+import pytest
+
+from bank_cache import LRUCache
+from bank_errors import InsufficientFundsError
+from bank_money import Money
+from bank_service import BankingService
+
+
+@pytest.fixture
+def service(backend):
+    return BankingService(backend)
+
+
+def cached_balance(service, number):
+    """Read a balance twice; the second read must come from the cache"""
+    service.get_balance(number)
+    hits = service.balances.hits
+    balance = service.get_balance(number)['balance']
+    assert service.balances.hits == hits + 1
+    return balance
+
+
+def test_balances_are_served_from_the_cache(service, backend):
+    number = service.create_account("Grace", "10")['account_number']
+    assert cached_balance(service, number) == Money(1000)
+
+    # Behind the service's back the cache cannot know
+    backend.deposit(backend.lookup_account_id(number), number, Money(100))
+    assert service.get_balance(number)['balance'] == Money(1000)
+
+
+@pytest.mark.parametrize('operation, expected', [
+    (lambda service, a, b: service.deposit(a, "2.00"), (1200, 500)),
+    (lambda service, a, b: service.withdraw(a, "2.00"), (800, 500)),
+    (lambda service, a, b: service.transfer(a, b, "2.00"), (800, 700)),
+    (lambda service, a, b: service.transfer(b, a, "2.00"), (1200, 300)),
+])
+def test_postings_invalidate_the_balances_they_change(service, operation, expected):
+    first = service.create_account("Ada", "10")['account_number']
+    second = service.create_account("Alan", "5")['account_number']
+    cached_balance(service, first)
+    cached_balance(service, second)
+
+    operation(service, first, second)
+    assert (service.get_balance(first)['balance'], service.get_balance(second)['balance']) == tuple(
+        Money(cents) for cents in expected)
+
+
+def test_a_refused_withdrawal_leaves_the_balance_correct(service):
+    number = service.create_account("Edsger", "1")['account_number']
+    cached_balance(service, number)
+    with pytest.raises(InsufficientFundsError):
+        service.withdraw(number, "5.00")
+    assert service.get_balance(number)['balance'] == Money(100)
+
+
+def test_account_ids_are_looked_up_once(service):
+    number = service.create_account("Barbara", "10")['account_number']
+    service.deposit(number, "1.00")
+    misses = service.account_ids.misses
+    service.deposit(number, "1.00")
+    service.withdraw(number, "1.00")
+    assert service.account_ids.misses == misses
+
+
+def test_a_value_read_before_an_invalidation_is_not_cached():
+    cache = LRUCache(10)
+    version = cache.version('1000000008')
+    cache.invalidate('1000000008')
+    assert cache.set('1000000008', 'stale', version) is False
+    assert cache.get('1000000008') is None
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.evictions == 1
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('bank_cache.time.monotonic', lambda: now[0])
+    cache = LRUCache(10, ttl=5)
+    cache.set('a', 1)
+    now[0] += 6
+    assert cache.get('a') is None
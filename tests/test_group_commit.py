@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bank_errors import BankingError, InsufficientFundsError
+from bank_group_commit import GroupCommitter
+from bank_money import Money
+from bank_service import BankingService
+
+
+@pytest.fixture
+def service(backend):
+    service = BankingService(backend, group_commit=GroupCommitter(backend, max_delay=0.01))
+    yield service
+    service.group_commit.close()
+
+
+def test_concurrent_postings_each_get_their_own_balance(service):
+    account = service.create_account("Grace", "100")['account_number']
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: service.deposit(account, "1.00"), range(40)))
+
+    balances = sorted(result['balance'] for result in results)
+    assert balances == [Money(10000 + 100 * count) for count in range(1, 41)]
+    assert service.get_balance(account)['balance'] == Money(14000)
+
+
+def test_a_rejected_posting_fails_only_its_caller(service):
+    account = service.create_account("Ada", "10")['account_number']
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(service.withdraw, account, "4.00") for _ in range(3)]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result()['balance'])
+            except InsufficientFundsError:
+                outcomes.append('refused')
+
+    assert sorted(outcomes, key=str) == [Money(200), Money(600), 'refused']
+    assert service.get_balance(account)['balance'] == Money(200)
+
+
+def test_submit_after_close_is_refused(service):
+    account = service.create_account("Alan", "10")['account_number']
+    service.group_commit.close()
+    with pytest.raises(BankingError, match="closed"):
+        service.deposit(account, "1.00")
+
+
+class Interrupting:
+    """Backend whose first batch dies with a BaseException, as on interpreter shutdown"""
+
+    def apply_postings(self, postings):
+        raise KeyboardInterrupt
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_callers_are_released_when_the_flusher_dies():
+    committer = GroupCommitter(Interrupting(), max_delay=0)
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(committer.submit, 1, '1', 'deposit', Money(100)) for _ in range(4)]
+        for future in futures:
+            with pytest.raises(BankingError):
+                future.result(timeout=5)
+    with pytest.raises(BankingError, match="closed"):
+        committer.submit(1, '1', 'deposit', Money(100))
+    committer.close()
@@ -0,0 +1,67 @@
+import pytest
+
+from bank_money import Money
+from bank_service import BankingService
+
+
+@pytest.fixture
+def account(backend):
+    service = BankingService(backend)
+    number = service.create_account("Grace", "1")['account_number']
+    for cents in range(1, 8):
+        service.deposit(number, Money(cents))
+    return service, number
+
+
+def pages(service, number, limit):
+    result, after = [], None
+    while True:
+        page = service.get_transaction_page(number, after=after, limit=limit)
+        result.append(page['transactions'])
+        after = page['next_cursor']
+        if after is None:
+            return result
+
+
+def keys(transactions):
+    return [(row['transaction_date'], row['transaction_id']) for row in transactions]
+
+
+def test_history_is_newest_first(account):
+    service, number = account
+    rows = service.get_transaction_page(number, limit=100)['transactions']
+    assert len(rows) == 8
+    assert keys(rows) == sorted(keys(rows), reverse=True)
+    assert [row['amount'] for row in rows] == [Money(cents) for cents in range(7, 0, -1)] + [Money(100)]
+
+
+@pytest.mark.parametrize('limit', [1, 3, 4, 7, 8, 9])
+def test_pages_cover_the_history_once_in_order(account, limit):
+    service, number = account
+    everything = service.get_transaction_page(number, limit=100)['transactions']
+    paged = pages(service, number, limit)
+
+    assert [row for page in paged for row in page] == everything
+    assert all(len(page) == limit for page in paged[:-1])
+    assert len(paged[-1]) < limit
+
+
+def test_a_cursor_past_the_oldest_row_gives_an_empty_last_page(account):
+    service, number = account
+    oldest = service.get_transaction_page(number, limit=100)['transactions'][-1]
+    page = service.get_transaction_page(number, after=(oldest['transaction_date'], oldest['transaction_id']))
+    assert page['transactions'] == []
+    assert page['next_cursor'] is None
+
+
+def test_streaming_matches_paging(account):
+    service, number = account
+    everything = service.get_transaction_page(number, limit=100)['transactions']
+    assert list(service.iter_transactions(number, page_size=3)) == everything
+
+
+def test_pages_only_show_the_requested_types(account):
+    service, number = account
+    service.withdraw(number, "0.50")
+    rows = service.get_transaction_page(number, limit=100, transaction_types=['withdrawal'])['transactions']
+    assert [(row['transaction_type'], row['amount']) for row in rows] == [('withdrawal', Money(50))]
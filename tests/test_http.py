@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from bank_async import dispatch, handle_connection
+
+
+class Writer:
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class Service:
+    async def deposit(self, account_number, amount, description=None, request_id=None):
+        return {'account_number': account_number, 'amount': amount}
+
+
+def exchange(request):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(request)
+        reader.feed_eof()
+        writer = Writer()
+        await handle_connection(Service(), reader, writer)
+        return writer
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('length', ['ten', '-5'])
+def test_a_bad_content_length_gets_400_and_closes(length):
+    writer = exchange(f"POST /accounts/1000000008/deposit HTTP/1.1\r\nContent-Length: {length}\r\n\r\n"
+                      f"{{}}".encode('latin-1'))
+    assert writer.data.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b'Invalid Content-Length' in writer.data
+    assert writer.closed
+
+
+def test_a_request_with_a_body_is_answered():
+    body = b'{"amount": "1.00"}'
+    writer = exchange(b"POST /accounts/1000000008/deposit HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+    assert writer.data.startswith(b"HTTP/1.1 200 OK\r\n")
+
+
+@pytest.mark.parametrize('limit', ['0', '1001'])
+def test_history_limits_outside_1_to_1000_are_refused(limit):
+    status, payload = asyncio.run(dispatch(Service(), 'GET', f'/accounts/1000000008/transactions?limit={limit}', b''))
+    assert status == 400
+
+
+def test_a_body_that_is_not_an_object_is_refused():
+    status, payload = asyncio.run(dispatch(Service(), 'POST', '/accounts/1000000008/deposit', b'[1]'))
+    assert (status, payload) == (400, {'error': 'Request body must be a JSON object'})
@@ -0,0 +1,99 @@
+import pytest
+from mysql.connector import Error
+
+from bank_import import BatchImporter, ImportAborted, read_rows
+
+
+class ImportCursor:
+    """Answers the importer's account queries from a dict of account number -> (account_id, cents)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.queries = 0
+
+    def execute(self, sql, params=None):
+        self.queries += 1
+        self.params = params
+
+    def fetchall(self):
+        accounts = self.pool.accounts
+        if self.queries == 1:
+            return [(accounts[number][0],) for number in self.params if number in accounts]
+        return [(number, account_id, cents) for number, (account_id, cents) in accounts.items()
+                if account_id in self.params]
+
+    def executemany(self, sql, rows):
+        if sql.lstrip().startswith('INSERT'):
+            self.pool.posted.extend(rows)
+            return
+        for number, (account_id, cents) in self.pool.accounts.items():
+            for delta, updated_id in rows:
+                if updated_id == account_id:
+                    self.pool.accounts[number] = (account_id, cents + delta)
+
+    def close(self):
+        pass
+
+
+class ImportPool:
+    """Runs importer chunks against ImportCursor; ``fail_on`` chunk numbers raise a driver error"""
+
+    def __init__(self, accounts, fail_on=()):
+        self.accounts = accounts
+        self.fail_on = fail_on
+        self.chunks = 0
+        self.posted = []
+
+    def cursor(self):
+        return ImportCursor(self)
+
+    def run_transaction(self, work):
+        self.chunks += 1
+        if self.chunks in self.fail_on:
+            raise Error("Lost connection")
+        return work(self)
+
+
+def row(number, kind, amount):
+    return {'account_number': number, 'type': kind, 'amount': amount}
+
+
+def test_bad_rows_are_reported_and_the_rest_posted():
+    pool = ImportPool({'1000000008': (1, 1000)})
+    rows = [row('1000000008', 'deposit', '5.00'), 5, row('', 'deposit', '1.00'), row('1000000008', 'refund', '1'),
+            row('1000000008', 'deposit', 'ten'), row('9999999999', 'deposit', '1.00'),
+            row('1000000008', 'withdrawal', '50.00'), row('1000000008', 'withdrawal', '15.00')]
+
+    result = BatchImporter(pool, chunk_size=3).run(rows)
+    assert result.rows_posted == 2
+    assert result.rows_rejected == 6
+    assert [error.offset for error in result.errors] == [1, 2, 3, 4, 5, 6]
+    assert result.errors[0].message == "Row is not an object"
+    assert pool.posted == [(1, 'deposit', 500, 'Batch deposit'), (1, 'withdrawal', 1500, 'Batch withdrawal')]
+
+
+def test_jsonl_lines_that_are_not_objects_are_rejected_one_by_one(tmp_path):
+    path = tmp_path / 'postings.jsonl'
+    path.write_text('5\n"x"\n[1, 2]\n{not json\n{"account_number": "1000000008", "type": "deposit", '
+                    '"amount": "1.00"}\n', encoding='utf-8')
+    pool = ImportPool({'1000000008': (1, 0)})
+
+    result = BatchImporter(pool).run(read_rows(str(path)))
+    assert result.rows_posted == 1
+    assert [error.message for error in result.errors][:3] == ["Row is not an object"] * 3
+    assert result.errors[3].message.startswith("Malformed line")
+
+
+def test_an_aborted_import_resumes_from_its_offset():
+    accounts = {'1000000008': (1, 0)}
+    rows = [row('1000000008', 'deposit', f"{n}.00") for n in range(1, 6)]
+    pool = ImportPool(accounts, fail_on=(2,))
+
+    with pytest.raises(ImportAborted) as aborted:
+        BatchImporter(pool, chunk_size=2).run(rows)
+    assert aborted.value.next_offset == 2
+    assert [cents for _, _, cents, _ in pool.posted] == [100, 200]
+
+    result = BatchImporter(pool, chunk_size=2).run(rows, start_offset=aborted.value.next_offset)
+    assert result.next_offset == 5
+    assert [cents for _, _, cents, _ in pool.posted] == [100, 200, 300, 400, 500]
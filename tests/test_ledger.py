@@ -0,0 +1,77 @@
+import pytest
+
+from bank_ledger import LedgerReplayer
+from bank_money import Money
+from bank_service import BankingService
+
+
+def set_stored_balance(backend, account_number, cents):
+    """Change a stored balance behind the ledger's back"""
+    if backend.name == 'sqlite':
+        with backend._write() as conn:
+            conn.execute("UPDATE accounts SET balance_cents = ? WHERE account_number = ?", (cents, account_number))
+    else:
+        backend._accounts[backend._ids[account_number]]['balance'] = Money(cents)
+
+
+@pytest.fixture
+def accounts(backend):
+    service = BankingService(backend)
+    numbers = [service.create_account(holder, "100")['account_number'] for holder in ("Grace", "Ada", "Alan")]
+    service.deposit(numbers[0], "25.00")
+    service.withdraw(numbers[1], "40.00")
+    service.transfer(numbers[2], numbers[0], "10.00")
+    return service, numbers
+
+
+def reconcile(backend, repair=False):
+    first_txn, high_water = backend.ledger_id_bounds()
+    first_account, last_account = backend.account_id_bounds()
+    replayed = backend.ledger_net_changes(first_txn, high_water)
+    return backend.reconcile_balances(first_account, last_account, replayed, high_water, repair)
+
+
+def test_balances_that_match_the_ledger_show_no_drift(backend, accounts):
+    assert reconcile(backend) == (3, [])
+
+
+def test_a_tampered_balance_is_reported_and_repaired(backend, accounts):
+    service, numbers = accounts
+    set_stored_balance(backend, numbers[1], 99900)
+
+    checked, drift = reconcile(backend)
+    assert checked == 3
+    assert [(number, stored, ledger) for _, number, stored, ledger in drift] == [(numbers[1], 99900, 6000)]
+
+    assert reconcile(backend, repair=True)[1] == drift
+    assert reconcile(backend) == (3, [])
+    assert service.get_balance(numbers[1])['balance'] == Money(6000)
+
+
+def test_postings_after_the_high_water_mark_are_not_drift(backend, accounts):
+    service, numbers = accounts
+    first_txn, high_water = backend.ledger_id_bounds()
+    replayed = backend.ledger_net_changes(first_txn, high_water)
+    service.deposit(numbers[2], "1.00")
+
+    first_account, last_account = backend.account_id_bounds()
+    assert backend.reconcile_balances(first_account, last_account, replayed, high_water) == (3, [])
+
+
+def test_the_parallel_replayer_finds_drift_in_sqlite(tmp_path):
+    db_config = {'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')}
+    service = BankingService.from_config(db_config, pool_size=2)
+    try:
+        service.backend.setup()
+        numbers = [service.create_account(f"Holder {n}", "50")['account_number'] for n in range(5)]
+        for number in numbers:
+            service.deposit(number, "5.00")
+        set_stored_balance(service.backend, numbers[3], 1)
+    finally:
+        service.close()
+
+    replayer = LedgerReplayer(db_config, workers=2, chunk_size=3, account_chunk_size=2, settle_seconds=0)
+    report = replayer.reconcile()
+    assert report.accounts == 5
+    assert [entry['account_number'] for entry in report.drift] == [numbers[3]]
+    assert report.total_drift == Money(1 - 5500)
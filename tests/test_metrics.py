@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+from bank_errors import InsufficientFundsError
+from bank_metrics import Histogram, InstrumentedConnection, Metrics, statement_kind
+from bank_service import BankingService
+
+
+def test_histogram_counts_each_value_in_its_bucket():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+
+def test_statement_kind_is_the_leading_keyword():
+    assert statement_kind("  select * from accounts") == 'SELECT'
+    assert statement_kind("") == 'EMPTY'
+
+
+def test_statements_are_attributed_to_the_enclosing_operations():
+    metrics = Metrics(slow_query_threshold=10)
+    conn = InstrumentedConnection(sqlite3.connect(':memory:'), metrics)
+    with metrics.operation('outer'):
+        with metrics.operation('inner'):
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 UNION ALL SELECT 2")
+            assert len(cursor.fetchall()) == 2
+        conn.commit()
+
+    assert metrics.counter('bank_operation_round_trips_total', (('operation', 'inner'),)) == 1
+    assert metrics.counter('bank_operation_rows_fetched_total', (('operation', 'inner'),)) == 2
+    # The outer operation also counts the inner statement, plus its own commit
+    assert metrics.counter('bank_operation_round_trips_total', (('operation', 'outer'),)) == 2
+    assert metrics.counter('bank_operation_rows_fetched_total', (('operation', 'outer'),)) == 2
+
+
+def test_slow_statements_are_counted_per_operation():
+    metrics = Metrics(slow_query_threshold=0, slow_query_sample=0)
+    with metrics.operation('deposit'):
+        metrics.record_statement("UPDATE accounts SET balance = 1", 0.5)
+    assert metrics.counter('bank_slow_queries_total', (('operation', 'deposit'),)) == 1
+
+
+def test_service_operations_and_errors_are_recorded(backend):
+    metrics = Metrics()
+    service = BankingService(backend, metrics=metrics)
+    number = service.create_account("Ada", "1")['account_number']
+    service.deposit(number, "2.00")
+    with pytest.raises(InsufficientFundsError):
+        service.withdraw(number, "50.00")
+
+    errors = (('operation', 'withdraw'), ('error', 'InsufficientFundsError'))
+    assert metrics.counter('bank_operation_errors_total', errors) == 1
+    assert metrics.counter('bank_operation_errors_total', (('operation', 'deposit'), ('error', 'InsufficientFundsError'))) == 0
+
+    text = metrics.render()
+    assert '# TYPE bank_operation_seconds histogram' in text
+    assert 'bank_operation_seconds_count{operation="deposit"} 1' in text
+    assert 'bank_operation_seconds_bucket{operation="withdraw",le="+Inf"} 1' in text
+    assert 'bank_operation_errors_total{operation="withdraw",error="InsufficientFundsError"} 1' in text
+
+    metrics.reset()
+    assert metrics.render() == '\n'
+
+
+def test_textfile_export_is_replaced_atomically(tmp_path):
+    metrics = Metrics()
+    metrics.inc('bank_group_commit_batches_total', 3)
+    path = tmp_path / 'bank.prom'
+    metrics.write_textfile(str(path))
+    assert 'bank_group_commit_batches_total 3' in path.read_text()
+    assert [p.name for p in tmp_path.iterdir()] == ['bank.prom']
+
+
+def test_metrics_stay_off_without_settings(monkeypatch):
+    for name in ('BANK_METRICS', 'BANK_METRICS_FILE', 'BANK_METRICS_PORT'):
+        monkeypatch.delenv(name, raising=False)
+    assert Metrics.from_env() is None
+    monkeypatch.setenv('BANK_METRICS', '1')
+    monkeypatch.setenv('BANK_SLOW_QUERY_MS', '250')
+    assert Metrics.from_env().slow_query_threshold == 0.25
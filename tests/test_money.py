@@ -0,0 +1,46 @@
+import pytest
+
+from bank_errors import InvalidAmountError
+from bank_money import Money, total
+from bank_service import parse_amount
+
+
+@pytest.mark.parametrize('value, cents', [
+    ('25.50', 2550),
+    (' 7 ', 700),
+    (100, 10000),
+    ('0.1', 10),
+    ('-3.25', -325),
+    ('1e2', 10000),
+])
+def test_parse_reads_dollars_as_cents(value, cents):
+    assert Money.parse(value).cents == cents
+
+
+def test_parse_rounds_to_the_cent_half_even():
+    assert Money.parse('10.005').cents == 1000
+    assert Money.parse('10.015').cents == 1002
+
+
+def test_parse_returns_money_unchanged():
+    amount = Money(1234)
+    assert Money.parse(amount) is amount
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '1.2.3', 'NaN', 'Infinity', None])
+def test_parse_rejects_non_numbers(value):
+    with pytest.raises(InvalidAmountError):
+        Money.parse(value)
+
+
+def test_parse_amount_requires_a_positive_amount():
+    assert parse_amount('0', allow_zero=True) == Money(0)
+    for value in ('0', '-1'):
+        with pytest.raises(InvalidAmountError):
+            parse_amount(value)
+
+
+def test_totals_and_formatting_stay_exact():
+    assert total(Money.parse('0.10') for _ in range(1000)) == Money(10000)
+    assert f"{Money(-5):.2f}" == "-0.05"
+    assert str(Money(123456)) == "1234.56"
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from mysql.connector import Error
+
+from bank_db import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.fail_rollback = False
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.fail_rollback:
+            raise Error("Lost connection")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Connections the pool has opened, in order; no MySQL server is needed"""
+    connections = []
+
+    def open_connection(pool):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(ConnectionPool, '_open', open_connection)
+    return connections
+
+
+def test_connections_are_opened_lazily_and_reused(opened):
+    pool = ConnectionPool({}, size=2)
+    assert opened == []
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(opened) == 1
+    assert first.commits == 2
+
+
+def test_pool_never_opens_more_than_its_size(opened):
+    pool = ConnectionPool({}, size=2, timeout=0.01)
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert len(opened) == 2
+
+    # A waiter gets the next connection handed back
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)))
+    waiter.start()
+    pool.release(held[0])
+    waiter.join()
+    assert got == [held[0]]
+
+
+def test_failed_work_is_rolled_back(opened):
+    pool = ConnectionPool({}, size=1)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("boom")
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+    with pool.connection() as again:
+        pass
+    assert again is conn
+
+
+def test_connection_that_cannot_roll_back_is_discarded(opened):
+    pool = ConnectionPool({}, size=1)
+    with pytest.raises(ValueError):
+        with pool.connection() as broken:
+            broken.fail_rollback = True
+            raise ValueError("boom")
+    assert broken.closed
+
+    with pool.connection() as fresh:
+        pass
+    assert fresh is not broken
+
+
+def test_closed_pool_refuses_checkouts(opened):
+    pool = ConnectionPool({}, size=1)
+    with pool.connection() as conn:
+        pass
+    pool.close_all()
+    assert conn.closed
+    with pytest.raises(Error):
+        pool.acquire()
+
+
+def test_pool_size_must_be_positive():
+    with pytest.raises(ValueError):
+        ConnectionPool({}, size=0)
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from bank_config import load_database_config
+
+
+pytestmark = pytest.mark.skipif(os.getenv('DB_BACKEND') != 'mysql',
+                                reason="set DB_BACKEND=mysql (and DB_HOST, DB_USER, ...) to EXPLAIN against MySQL")
+
+
+@pytest.fixture(scope='module')
+def connection():
+    from bank_db import ConnectionPool, create_database, migrate
+    from bank_service import BankingService
+
+    # A scratch database next to the configured one, never the real data
+    db_config = load_database_config()
+    db_config['database'] += '_test'
+    create_database(db_config)
+    pool = ConnectionPool(db_config, size=2)
+    try:
+        with pool.connection() as conn:
+            migrate(conn)
+        # The optimizer may scan near-empty tables, so give it some rows
+        service = BankingService(pool)
+        accounts = service.create_accounts({'account_holder': f"Plan Check {index}", 'initial_deposit': '100'}
+                                           for index in range(500))
+        for account in accounts[:100]:
+            for _ in range(10):
+                service.deposit(account['account_number'], '1.00')
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            for table in ('accounts', 'transactions', 'transactions_archive', 'posting_requests'):
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+            cursor.close()
+            yield conn
+    finally:
+        pool.close_all()
+
+
+def test_hot_queries_use_their_indexes(connection):
+    from bank_db import check_query_plans
+
+    assert check_query_plans(connection) == []
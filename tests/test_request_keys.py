@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from bank_async import REASONS, dispatch
+from bank_errors import InsufficientFundsError, RequestKeyConflictError
+from bank_money import Money
+from bank_service import BankingService
+
+
+@pytest.fixture
+def service(backend):
+    return BankingService(backend)
+
+
+def test_a_repeated_deposit_returns_the_first_result(service):
+    account = service.create_account("Grace", "10")['account_number']
+    first = service.deposit(account, "5.00", "Pay", request_id='pay-1')
+    again = service.deposit(account, "5.00", "Pay", request_id='pay-1')
+
+    assert again['balance'] == first['balance'] == Money(1500)
+    assert again['transaction_id'] == first['transaction_id']
+    assert service.get_balance(account)['balance'] == Money(1500)
+
+
+def test_a_repeated_withdrawal_is_posted_once(service):
+    account = service.create_account("Ada", "10")['account_number']
+    first = service.withdraw(account, "3.00", request_id='atm-1')
+    again = service.withdraw(account, "3.00", request_id='atm-1')
+
+    assert again['balance'] == first['balance'] == Money(700)
+    assert again['transaction_id'] == first['transaction_id']
+    assert len(service.get_transaction_history(account, limit=None)['transactions']) == 2
+
+
+def test_reusing_an_id_for_another_posting_is_refused(service):
+    account = service.create_account("Alan", "10")['account_number']
+    service.deposit(account, "5.00", request_id='key-1')
+
+    with pytest.raises(RequestKeyConflictError):
+        service.deposit(account, "6.00", request_id='key-1')
+    with pytest.raises(RequestKeyConflictError):
+        service.withdraw(account, "5.00", request_id='key-1')
+    assert service.get_balance(account)['balance'] == Money(1500)
+
+
+def test_a_refused_withdrawal_can_be_retried_under_its_id(service):
+    account = service.create_account("Edsger", "1")['account_number']
+    with pytest.raises(InsufficientFundsError):
+        service.withdraw(account, "5.00", request_id='retry-1')
+
+    service.deposit(account, "10.00")
+    assert service.withdraw(account, "5.00", request_id='retry-1')['balance'] == Money(600)
+
+
+class Conflicting:
+    async def deposit(self, account_number, amount, description=None, request_id=None):
+        raise RequestKeyConflictError(request_id)
+
+
+def test_http_answers_422_for_a_reused_id():
+    status, payload = asyncio.run(dispatch(Conflicting(), 'POST', '/accounts/1000000008/deposit',
+                                           b'{"amount": "1.00", "request_id": "key-1"}'))
+
+    assert status == 422
+    assert 'key-1' in payload['error']
+    assert REASONS[status] == 'Unprocessable Entity'
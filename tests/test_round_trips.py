@@ -0,0 +1,93 @@
+import pytest
+
+from bank_errors import AccountNotFoundError, InsufficientFundsError
+from bank_money import Money
+from bank_service import BankingService
+from bank_storage import MySQLBackend
+
+
+class CountingCursor:
+    """DB-API cursor stand-in that answers bank_post and counts statements"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, sql, params=None):
+        self.pool.statements.append(sql.split()[0].upper())
+
+    def fetchone(self):
+        if self.pool.statements[-1] == 'CALL':
+            return self.pool.outcome
+        return (7,)  # account_id for lookup_account_id
+
+    def close(self):
+        pass
+
+
+class CountingPool:
+    """Runs MySQLBackend work against CountingCursor; COMMIT counts as a round trip"""
+
+    def __init__(self, outcome=('ok', 12500, 42)):
+        self.outcome = outcome
+        self.statements = []
+
+    def cursor(self):
+        return CountingCursor(self)
+
+    def run_transaction(self, work, commit=True):
+        result = work(self)
+        if commit:
+            self.statements.append('COMMIT')
+        return result
+
+    @property
+    def round_trips(self):
+        return len(self.statements)
+
+
+@pytest.mark.parametrize('operation', ['deposit', 'withdraw'])
+def test_posting_is_one_round_trip(operation):
+    pool = CountingPool()
+    backend = MySQLBackend(pool)
+    assert getattr(backend, operation)(7, '1000000008', Money(500)) == (Money(12500), 42)
+    assert pool.statements == ['CALL']
+
+
+def test_service_postings_are_one_round_trip_once_the_account_id_is_cached():
+    pool = CountingPool()
+    service = BankingService(MySQLBackend(pool))
+    service.deposit('1000000008', '5.00')  # first use also looks up the account ID
+    for operation in (service.deposit, service.withdraw, service.deposit):
+        before = pool.round_trips
+        operation('1000000008', '5.00')
+        assert pool.round_trips - before == 1
+
+
+def test_refusals_name_the_account_number():
+    backend = MySQLBackend(CountingPool(('not_found', None, None)))
+    with pytest.raises(AccountNotFoundError, match='1000000008'):
+        backend.deposit(7, '1000000008', Money(500))
+
+    pool = CountingPool(('insufficient_funds', 100, None))
+    with pytest.raises(InsufficientFundsError) as refused:
+        MySQLBackend(pool).withdraw(7, '1000000008', Money(500))
+    assert refused.value.account_number == '1000000008'
+    assert refused.value.balance == Money(100)
+    assert pool.round_trips == 1
+
+
+@pytest.mark.parametrize('operation', ['deposit', 'withdraw', 'transfer_from', 'transfer_to'])
+def test_embedded_backends_refuse_postings_to_missing_accounts(backend, operation):
+    number = BankingService(backend).create_account("Grace", "100")['account_number']
+    account_id = backend.lookup_account_id(number)
+    postings = {
+        'deposit': lambda: backend.deposit(999, '1000000008', Money(500)),
+        'withdraw': lambda: backend.withdraw(999, '1000000008', Money(500)),
+        'transfer_from': lambda: backend.transfer(999, '1000000008', account_id, number, Money(500)),
+        'transfer_to': lambda: backend.transfer(account_id, number, 999, '1000000008', Money(500)),
+    }
+    with pytest.raises(AccountNotFoundError, match='1000000008'):
+        postings[operation]()
+    assert backend.get_account(number)['balance'] == Money(10000)
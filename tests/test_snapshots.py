@@ -0,0 +1,92 @@
+import datetime
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pytest
+
+from bank_errors import BankingError
+from bank_money import Money
+from bank_service import BankingService
+from bank_snapshots import SnapshotStore
+
+
+class ScriptedCursor:
+    """Answers each SELECT with the next scripted result set"""
+
+    def __init__(self, results):
+        self.results = results
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((' '.join(sql.split()), params))
+        self.rows = self.results.pop(0) if sql.lstrip().startswith('SELECT') else []
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class ScriptedPool:
+    def __init__(self, *results):
+        self.script = ScriptedCursor(list(results))
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def run_transaction(self, work):
+        return work(self)
+
+    def cursor(self, dictionary=False):
+        return self.script
+
+
+class PooledService:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get_account_id(self, account_number):
+        return 7
+
+
+def test_snapshots_need_mysql(backend):
+    with pytest.raises(BankingError):
+        SnapshotStore(BankingService(backend))
+
+
+def test_refresh_stops_at_the_first_unsettled_row():
+    pool = ScriptedPool([(10,)], [(11, 1), (12, 1), (13, 0), (14, 1)])
+    processed = SnapshotStore(PooledService(pool), chunk_size=4).refresh()
+
+    assert processed == 2
+    statements = pool.script.statements
+    # Both summaries fold in rows 11-12 only, and the watermark moves to 12
+    assert statements[2][1] == (10, 12)
+    assert statements[3][1] == (10, 12)
+    assert statements[4] == ("UPDATE snapshot_state SET last_transaction_id = %s WHERE snapshot_id = 1", (12,))
+
+
+def test_refresh_continues_until_a_short_chunk():
+    pool = ScriptedPool([(0,)], [(1, 1), (2, 1)], [(2,)], [(3, 1)])
+    assert SnapshotStore(PooledService(pool), chunk_size=2).refresh() == 3
+
+
+def test_statement_runs_balances_from_the_opening_balance():
+    days = [
+        {'balance_date': datetime.date(2026, 3, 1), 'deposits': Decimal('5.00'), 'withdrawals': Decimal('0.00'),
+         'net_change': Decimal('5.00'), 'transaction_count': 1},
+        {'balance_date': datetime.date(2026, 3, 4), 'deposits': Decimal('0.00'), 'withdrawals': Decimal('2.50'),
+         'net_change': Decimal('-2.50'), 'transaction_count': 1},
+    ]
+    pool = ScriptedPool([{'opening_balance': Decimal('10.00')}], days)
+    statement = SnapshotStore(PooledService(pool)).statement("123", datetime.date(2026, 3, 1),
+                                                              datetime.date(2026, 3, 31))
+
+    assert statement['opening_balance'] == Money(1000)
+    assert [day['closing_balance'] for day in statement['days']] == [Money(1500), Money(1250)]
+    assert statement['closing_balance'] == Money(1250)
@@ -0,0 +1,61 @@
+import csv
+import datetime
+import json
+
+import pytest
+
+from bank_errors import BankingError
+from bank_money import Money
+from bank_service import BankingService
+from bank_statements import CHECKPOINT_FILE, StatementExporter, build_statement
+
+START = datetime.datetime(2026, 9, 1)
+END = datetime.datetime(2026, 10, 1)
+
+
+def row(day, kind, cents):
+    return {'transaction_id': day, 'transaction_type': kind, 'amount': Money(cents), 'description': '',
+            'transaction_date': datetime.datetime(2026, 9, 1) + datetime.timedelta(days=day)}
+
+
+def test_a_statement_rolls_the_current_balance_back_to_its_period():
+    account = {'account_number': '1000000008', 'account_holder': 'Grace', 'balance': Money(7000)}
+    rows = [row(1, 'deposit', 5000), row(2, 'withdrawal', 2000), row(10, 'transfer', -1000),
+            row(35, 'deposit', 3000)]
+
+    statement = build_statement(account, rows, START, END)
+    assert statement['closing_balance'] == Money(4000)
+    assert statement['opening_balance'] == Money(2000)
+    assert [line['balance'] for line in statement['transactions']] == [Money(7000), Money(5000), Money(4000)]
+    assert statement['total_deposits'] == Money(5000)
+    assert statement['total_withdrawals'] == Money(3000)
+    assert statement['period_end'] == datetime.date(2026, 9, 30)
+
+
+def test_the_export_refuses_the_in_memory_backend(tmp_path):
+    with pytest.raises(BankingError):
+        StatementExporter({'backend': 'memory'}, START.date(), END.date(), str(tmp_path))
+
+
+def test_the_export_writes_every_account_and_resumes_from_its_checkpoint(tmp_path):
+    db_config = {'backend': 'sqlite', 'path': str(tmp_path / 'bank.db')}
+    service = BankingService.from_config(db_config, pool_size=1)
+    try:
+        service.backend.setup()
+        numbers = [service.create_account(f"Holder {n}", "10")['account_number'] for n in range(5)]
+        service.withdraw(numbers[0], "4.00")
+    finally:
+        service.close()
+    today = datetime.date.today()
+    directory = tmp_path / 'statements'
+
+    progress = StatementExporter(db_config, today, today, str(directory), workers=2, slice_size=2).run()
+    assert (progress.slices_done, progress.accounts, progress.transactions) == (3, 5, 6)
+    with open(directory / f"{numbers[0]}.csv", newline='', encoding='utf-8') as f:
+        lines = list(csv.reader(f))
+    assert lines[1][2:] == ['opening', '', '0.00', 'Opening balance']
+    assert lines[-1][2:] == ['closing', '', '6.00', 'Closing balance']
+    assert json.loads((directory / CHECKPOINT_FILE).read_text())['done'] == [0, 1, 2]
+
+    again = StatementExporter(db_config, today, today, str(directory), workers=2, slice_size=2).run()
+    assert (again.slices_done, again.accounts) == (3, 0)
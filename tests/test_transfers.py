@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bank_errors import AccountNotFoundError, BankingError, InsufficientFundsError
+from bank_money import Money
+from bank_service import BankingService
+from bank_storage import run_plan, transfer_plan
+
+
+class LockingCursor:
+    """Answers transfer_plan's lock query from a dict of balances and records every statement"""
+
+    def __init__(self, balances):
+        self.balances = balances
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def fetchall(self):
+        return sorted((account_id, cents) for account_id, cents in self.balances.items())
+
+
+@pytest.mark.parametrize('from_id, to_id', [(3, 9), (9, 3)])
+def test_transfers_lock_both_rows_in_account_id_order(from_id, to_id):
+    cursor = LockingCursor({3: 1000, 9: 1000})
+    run_plan(cursor, transfer_plan(from_id, 'A', to_id, 'B', Money(100)))
+
+    lock, params = cursor.statements[0]
+    assert lock.endswith("WHERE account_id IN (%s, %s) ORDER BY account_id FOR UPDATE")
+    assert sorted(params) == [3, 9]
+    assert [statement for statement, _ in cursor.statements[1:3]] == [
+        "UPDATE accounts SET balance = balance - %s / 100 WHERE account_id = %s",
+        "UPDATE accounts SET balance = balance + %s / 100 WHERE account_id = %s"]
+    assert cursor.statements[1][1] == (100, from_id)
+
+
+def test_a_transfer_plan_refuses_before_writing():
+    cursor = LockingCursor({3: 50, 9: 1000})
+    with pytest.raises(InsufficientFundsError):
+        run_plan(cursor, transfer_plan(3, 'A', 9, 'B', Money(100)))
+    assert len(cursor.statements) == 1
+
+    cursor = LockingCursor({9: 1000})
+    with pytest.raises(AccountNotFoundError, match='A'):
+        run_plan(cursor, transfer_plan(3, 'A', 9, 'B', Money(100)))
+    assert len(cursor.statements) == 1
+
+
+@pytest.fixture
+def service(backend):
+    return BankingService(backend)
+
+
+def test_opposite_transfers_run_concurrently_and_keep_the_total(service):
+    first = service.create_account("Grace", "100")['account_number']
+    second = service.create_account("Ada", "100")['account_number']
+    start = threading.Barrier(8)
+
+    def move(index):
+        start.wait()
+        source, target = (first, second) if index % 2 else (second, first)
+        for _ in range(25):
+            service.transfer(source, target, "1.00")
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(move, range(8)))
+    assert service.get_balance(first)['balance'] == service.get_balance(second)['balance'] == Money(10000)
+
+
+def test_concurrent_withdrawals_never_overdraw(service):
+    number = service.create_account("Alan", "10")['account_number']
+
+    def withdraw(_):
+        try:
+            return service.withdraw(number, "1.00")['balance']
+        except InsufficientFundsError:
+            return None
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(withdraw, range(20)))
+    assert sorted(result for result in results if result is not None) == [Money(100 * n) for n in range(10)]
+    assert service.get_balance(number)['balance'] == Money(0)
+
+
+def test_a_transfer_to_the_same_account_is_refused(service):
+    number = service.create_account("Edsger", "10")['account_number']
+    with pytest.raises(BankingError, match="same account"):
+        service.transfer(number, number, "1.00")
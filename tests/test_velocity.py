@@ -0,0 +1,169 @@
+import pytest
+
+from bank_errors import InsufficientFundsError, VelocityLimitError
+from bank_import import BatchImporter
+from bank_money import Money
+from bank_service import BankingService
+from bank_velocity import VelocityGuard, VelocityRule
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def service_with(backend, clock, *rules):
+    return BankingService(backend, velocity=VelocityGuard(rules, clock=clock))
+
+
+def test_a_posting_over_the_count_limit_is_refused_without_posting(backend, clock):
+    service = service_with(backend, clock, VelocityRule('twice', 60, max_count=2))
+    account = service.create_account("Grace", "100")['account_number']
+    service.withdraw(account, "1.00")
+    service.withdraw(account, "1.00")
+
+    with pytest.raises(VelocityLimitError) as refused:
+        service.withdraw(account, "1.00")
+    assert refused.value.rule == 'twice'
+    assert service.get_balance(account)['balance'] == Money(9800)
+    assert service.velocity_stats()['refusals'] == 1
+
+
+def test_transfers_count_against_the_source_account_only(backend, clock):
+    service = service_with(backend, clock, VelocityRule('daily', 86400, max_amount="50.00"))
+    first = service.create_account("Ada", "100")['account_number']
+    second = service.create_account("Alan", "100")['account_number']
+    service.transfer(first, second, "40.00")
+
+    with pytest.raises(VelocityLimitError):
+        service.transfer(first, second, "20.00")
+    service.transfer(second, first, "50.00")
+    assert service.get_balance(first)['balance'] == Money(11000)
+
+
+def test_a_failed_posting_is_released(backend, clock):
+    service = service_with(backend, clock, VelocityRule('once', 60, max_count=1))
+    account = service.create_account("Edsger", "10")['account_number']
+    with pytest.raises(InsufficientFundsError):
+        service.withdraw(account, "50.00")
+
+    service.withdraw(account, "5.00")
+    with pytest.raises(VelocityLimitError):
+        service.withdraw(account, "1.00")
+
+
+def test_the_window_slides_and_a_restart_remembers_it(backend, clock):
+    rule = VelocityRule('once', 60, max_count=1, buckets=6)
+    service = service_with(backend, clock, rule)
+    account = service.create_account("Barbara", "10")['account_number']
+    service.withdraw(account, "1.00")
+
+    restarted = VelocityGuard([rule])
+    assert restarted.warm(backend) == 1
+    with pytest.raises(VelocityLimitError):
+        restarted.reserve(service.get_account_id(account), account, 'withdrawal', Money(100))
+
+    clock.now += 71
+    service.withdraw(account, "1.00")
+
+
+def test_a_retry_after_a_restart_is_not_counted_again(backend, clock):
+    rule = VelocityRule('once', 60, max_count=1)
+    service = service_with(backend, clock, rule)
+    account = service.create_account("Barbara", "10")['account_number']
+    service.withdraw(account, "1.00", request_id='atm-42')
+
+    restarted = BankingService(backend, velocity=VelocityGuard([rule], clock=clock))
+    replayed = restarted.withdraw(account, "1.00", request_id='atm-42')
+    assert replayed['balance'] == Money(900)
+    assert restarted.velocity_stats()['refusals'] == 0
+    with pytest.raises(VelocityLimitError):
+        restarted.withdraw(account, "1.00", request_id='atm-43')
+
+
+class ImportCursor:
+    """Answers the importer's two account queries for a single account"""
+
+    def __init__(self, account):
+        self.account = account
+        self.queries = 0
+
+    def execute(self, sql, params=None):
+        self.queries += 1
+
+    def fetchall(self):
+        if self.queries == 1:
+            return [(self.account[1],)]
+        return [self.account]
+
+    def executemany(self, sql, rows):
+        pass
+
+    def close(self):
+        pass
+
+
+class ImportPool:
+    def __init__(self, account, fail=None):
+        self.account = account
+        self.fail = fail
+
+    def cursor(self):
+        return ImportCursor(self.account)
+
+    def run_transaction(self, work):
+        result = work(self)
+        if self.fail:
+            raise self.fail
+        return result
+
+
+def test_imported_withdrawals_are_held_to_the_rules(clock):
+    guard = VelocityGuard([VelocityRule('twice', 60, max_count=2)], clock=clock)
+    importer = BatchImporter(ImportPool(('1000000008', 7, 100000)), velocity=guard)
+    rows = [{'account_number': '1000000008', 'type': kind, 'amount': '1.00'}
+            for kind in ('withdrawal', 'deposit', 'withdrawal', 'withdrawal')]
+
+    result = importer.run(rows)
+    assert result.rows_posted == 3
+    assert [(error.offset, 'twice' in error.message) for error in result.errors] == [(3, True)]
+
+
+def test_a_failed_import_chunk_gives_its_reservations_back(clock):
+    guard = VelocityGuard([VelocityRule('once', 60, max_count=1)], clock=clock)
+    importer = BatchImporter(ImportPool(('1000000008', 7, 100000), fail=RuntimeError("lost")), velocity=guard)
+    with pytest.raises(RuntimeError):
+        importer.run([{'account_number': '1000000008', 'type': 'withdrawal', 'amount': '1.00'}])
+
+    guard.reserve(7, '1000000008', 'withdrawal', Money(100))
+
+
+def test_the_cli_warms_the_rules_only_for_outflows(tmp_path, monkeypatch):
+    from bank_cli import LocalClient, setup
+
+    for variable in ('DB_BACKEND', 'DB_PATH'):
+        monkeypatch.delenv(variable, raising=False)
+    config = tmp_path / 'bank.ini'
+    config.write_text(f"[database]\nbackend = sqlite\npath = {tmp_path / 'bank.db'}\n"
+                      f"[velocity]\nonce = count 1 per 60 withdrawal\n", encoding='utf-8')
+    setup(str(config))
+    client = LocalClient(str(config))
+    try:
+        account = client.call('create_account', "Grace", "10")['account_number']
+        client.call('get_balance', account)
+        assert client.service.velocity is None
+
+        client.call('withdraw', account, "1.00")
+        assert client.service.velocity.warmed
+        with pytest.raises(VelocityLimitError):
+            client.call('withdraw', account, "1.00")
+    finally:
+        client.close()